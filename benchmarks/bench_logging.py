@@ -0,0 +1,99 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Logging overhead microbenchmark.
+Measures the cost of the debug log calls on the radio message path when
+running at INFO level (eager vs lazy formatting) and the cost of the per
+message INFO line (logged, sampled or demoted).
+
+    python benchmarks/bench_logging.py
+"""
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import io
+import os
+import sys
+import timeit
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from xbee2mqtt import Xbee2MQTT
+from libs.processor import Processor
+
+ADDRESS = '0013a20040401122'
+NUMBER = 100000
+
+class MQTTMock(object):
+    def publish(self, topic, value):
+        pass
+    def subscribe(self, topic):
+        pass
+    def unsubscribe(self, topic):
+        pass
+
+def logger():
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger = logging.getLogger('benchmark')
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+def gateway(log_level=logging.INFO, log_sample=1):
+    gateway = Xbee2MQTT('/tmp/xbee2mqtt-benchmark.pid')
+    gateway.logger = logger()
+    gateway.mqtt = MQTTMock()
+    gateway.processor = Processor({})
+    gateway.duplicate_check_window = 0
+    gateway.expose_undefined_topics = True
+    gateway.default_topic_pattern = '/raw/xbee/{address}/{port}'
+    gateway.default_input_topic_pattern = '/raw/xbee/{address}/{port}/set'
+    gateway.message_log_level = log_level
+    gateway.message_log_sample = log_sample
+    gateway.load({})
+    return gateway
+
+def measure(name, statement):
+    elapsed = min(timeit.repeat(statement, number=NUMBER, repeat=3))
+    print("%-45s %8.3f us/call" % (name, elapsed / NUMBER * 1e6))
+
+if __name__ == '__main__':
+
+    log = logger()
+    def log_wrapper(level, message):
+        log.log(level, message)
+    values = (ADDRESS, 'adc-1', 512)
+    measure("debug line, eager formatting", lambda: log_wrapper(logging.DEBUG, "Message received from radio: %s %s %s" % values))
+    measure("debug line, lazy formatting", lambda: log.log(logging.DEBUG, "Message received from radio: %s %s %s", *values))
+    measure("debug line, level guard", lambda: log.isEnabledFor(logging.DEBUG) and log.debug("Message received from radio: %s %s %s", *values))
+
+    for name, instance in [
+        ("radio message, INFO line per message", gateway()),
+        ("radio message, INFO line every 100 messages", gateway(log_sample=100)),
+        ("radio message, message lines demoted to DEBUG", gateway(logging.DEBUG)),
+    ]:
+        measure(name, lambda: instance.xbee_on_message(ADDRESS, 'adc-1', 512))
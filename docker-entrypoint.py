@@ -18,6 +18,16 @@ from libs.processor import Processor
 from libs.config import Config
 from libs.mosquitto_wrapper import MosquittoWrapper
 from libs.xbee_wrapper import XBeeWrapper
+from libs.publish_queue import PublishQueue
+from libs.publish_batcher import PublishBatcher
+from libs.offline_buffer import OfflineBuffer
+from libs.spool import MessageSpool
+from libs.metrics import Metrics, MetricsServer
+from libs.profiler import Profiler
+from libs.async_engine import AsyncEngine
+from libs.at_scheduler import ATScheduler
+from libs.publish_policy import PublishPolicies
+from libs import document
 from xbee2mqtt import Xbee2MQTT
 
 def resolve_path(path):
@@ -46,6 +56,28 @@ if __name__ == "__main__":
     mqtt.retain = config.get('mqtt', 'retain', True)
     mqtt.status_topic = config.get('mqtt', 'status_topic', '/service/%s/status')
     mqtt.set_will = config.get('mqtt', 'set_will', True)
+    mqtt.subscribe_qos = config.get('mqtt', 'subscribe_qos', 0)
+    mqtt.subscribe_chunk_size = config.get('mqtt', 'subscribe_chunk_size', 100)
+    if config.get('mqtt', 'batch_messages', 0) > 1:
+        mqtt.batcher = PublishBatcher(
+            max_messages=config.get('mqtt', 'batch_messages', 0),
+            max_delay=config.get('mqtt', 'batch_delay', 50) / 1000.0
+        )
+        mqtt.batcher.coalesce = config.get('mqtt', 'batch_coalesce', False)
+    mqtt.reconnect_supervisor.min_delay = config.get('mqtt', 'reconnect_min_delay', 1)
+    mqtt.reconnect_supervisor.max_delay = config.get('mqtt', 'reconnect_max_delay', 120)
+    if config.get('mqtt', 'spool_file', None):
+        mqtt.offline = MessageSpool(
+            resolve_path(config.get('mqtt', 'spool_file', None)),
+            config.get('mqtt', 'spool_max_messages', 100000),
+            config.get('mqtt', 'spool_max_age', 86400)
+        )
+    elif config.get('mqtt', 'offline_buffer_size', 1000) > 0:
+        mqtt.offline = OfflineBuffer(
+            config.get('mqtt', 'offline_buffer_size', 1000),
+            config.get('mqtt', 'offline_buffer_policy', 'latest')
+        )
+    mqtt.replay_rate = config.get('mqtt', 'replay_rate', 50)
 
     try:
         serial = Serial(
@@ -61,14 +93,35 @@ if __name__ == "__main__":
     xbee.default_port_name = config.get('radio', 'default_port_name', 'serial')
     xbee.sample_rate = config.get('general', 'sample_rate', 0)
     xbee.change_detection = config.get('general', 'change_detection', False)
+    xbee.native = config.get('radio', 'parser', 'python-xbee') == 'native'
+    xbee.reassembler.max_line_length = config.get('radio', 'max_line_length', 1024)
+    xbee.reassembler.idle_timeout = config.get('radio', 'line_timeout', 60)
+    xbee.scheduler = ATScheduler()
+    xbee.scheduler.interval = config.get('radio', 'query_interval', 1)
+    xbee.scheduler.max_in_flight = config.get('radio', 'query_concurrency', 1)
+    xbee.scheduler.max_total_in_flight = config.get('radio', 'query_max_in_flight', 8)
+    xbee.scheduler.response_timeout = config.get('radio', 'query_timeout', 5)
+    xbee.scheduler.transactions.retries = config.get('radio', 'query_retries', 2)
+    xbee.scheduler.transactions.backoff = config.get('radio', 'query_backoff', 2)
 
-    processor = Processor(config.get('processor', 'filters', []))
+    processor = Processor(config.get('processor', 'filters', {}), logger)
+    policies = PublishPolicies(config.get('publisher', 'policies', {}), logger)
+    policies.idle_timeout = config.get('publisher', 'idle_timeout', 86400)
+
+    queue = None
+    if config.get('queue', 'enabled', True):
+        queue = PublishQueue(
+            config.get('queue', 'size', 1000),
+            config.get('queue', 'policy', 'drop-oldest'),
+            config.get('queue', 'block_timeout', None)
+        )
 
     # Create instance but DON'T use it as a daemon
     # We just use its run() method directly in foreground
     xbee2mqtt = Xbee2MQTT('/tmp/fake.pid')  # Pidfile won't be used
     xbee2mqtt.discovery_on_connect = config.get('general', 'discovery_on_connect', True)
     xbee2mqtt.duplicate_check_window = config.get('general', 'duplicate_check_window', 5)
+    xbee2mqtt.duplicate_cache_size = config.get('general', 'duplicate_cache_size', 10000)
     xbee2mqtt.default_output_topic_pattern = config.get(
         'general', 'default_output_topic_pattern', '/raw/xbee/{address}/{port}'
     )
@@ -82,15 +135,44 @@ if __name__ == "__main__":
     xbee2mqtt.expose_undefined_topics = config.get(
         'general', 'expose_undefined_topics', xbee2mqtt.publish_undefined_topics
     )
+    xbee2mqtt.topic_cache_size = config.get('general', 'topic_cache_size', 4096)
+    xbee2mqtt.subscription_mode = config.get('general', 'subscription_mode', 'routes')
+    xbee2mqtt.message_log_level = config.get('daemon', 'message_logging_level', logging.INFO)
+    xbee2mqtt.message_log_sample = config.get('daemon', 'message_logging_sample', 1)
+    xbee2mqtt.publish_mode = config.get('general', 'publish_mode', 'topics')
+    xbee2mqtt.document_topic_pattern = config.get('general', 'document_topic_pattern', '/raw/xbee/{address}')
+    xbee2mqtt.document_format = config.get('general', 'document_format', 'json')
+    if not document.available(xbee2mqtt.document_format):
+        logger.warning("Document format '%s' not available, using json", xbee2mqtt.document_format)
+        xbee2mqtt.document_format = 'json'
     xbee2mqtt.load(config.get('general', 'routes', {}))
     xbee2mqtt.logger = logger
     xbee2mqtt.mqtt = mqtt
     xbee2mqtt.xbee = xbee
     xbee2mqtt.processor = processor
+    xbee2mqtt.policies = policies
+    xbee2mqtt.queue = queue
+    xbee2mqtt.engine = AsyncEngine() if config.get('general', 'engine', 'threaded') == 'asyncio' else None
     xbee2mqtt.config_file = config_file
+    if config.get('metrics', 'enabled', False):
+        xbee2mqtt.metrics = Metrics()
+        if config.get('metrics', 'port', 9717):
+            xbee2mqtt.metrics_server = MetricsServer(
+                xbee2mqtt.metrics,
+                config.get('metrics', 'host', '127.0.0.1'),
+                config.get('metrics', 'port', 9717)
+            )
+        xbee2mqtt.metrics_topic = config.get('metrics', 'topic', None)
+        xbee2mqtt.metrics_interval = config.get('metrics', 'interval', 60)
+        processor.metrics_by_topic = config.get('metrics', 'filter_topics', False)
+    xbee2mqtt.profiler = Profiler(resolve_path(config.get('profiler', 'directory', 'var/profiles')))
+    xbee2mqtt.profiler.duration = config.get('profiler', 'duration', 60)
+    xbee2mqtt.profiler.interval = config.get('profiler', 'interval', 5) / 1000.0
+    xbee2mqtt.profiler_topic = config.get('profiler', 'topic', None)
 
     # Run in foreground - Docker handles process management
     logger.info("Starting xbee2mqtt in foreground mode for Docker")
+    xbee2mqtt.attach_signals()
     try:
         xbee2mqtt.run()
     except KeyboardInterrupt:
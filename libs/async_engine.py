@@ -0,0 +1,204 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import asyncio
+import logging
+
+class AsyncEngine(object):
+    """
+    Runs the radio and the MQTT client on a single asyncio event loop.
+    The serial port is read when the loop reports it readable, paho is driven
+    through its socket callbacks and remote AT query pacing runs as coroutines.
+    """
+
+    # Seconds between calls to paho's loop_misc (keepalives, retries)
+    misc_interval = 1
+
+    logger = None
+
+    # Called from the loop every misc_interval seconds
+    on_tick = None
+
+    mqtt = None
+    xbee = None
+    loop = None
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._stopped = None
+        self._wakeup = None
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    def attach(self, mqtt, xbee):
+        """
+        Creates the event loop and hooks the MQTT client and the radio into it.
+        Must be called before connecting either of them.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.mqtt = mqtt
+        self.xbee = xbee
+
+        mqtt.on_socket_open = self.on_socket_open
+        mqtt.on_socket_close = self.on_socket_close
+        mqtt.on_socket_register_write = self.on_socket_register_write
+        mqtt.on_socket_unregister_write = self.on_socket_unregister_write
+
+        xbee.threaded = False
+        if xbee.scheduler:
+            xbee.scheduler.on_wakeup = self.wakeup
+        else:
+            xbee.send_commands = self.send_commands
+
+    def run(self):
+        """
+        Reads from the serial port and loops until stopped
+        """
+        self.log(logging.INFO, "Running asyncio engine")
+        asyncio.set_event_loop(self.loop)
+        serial = self.xbee.serial
+        serial.timeout = 0
+        self.loop.add_reader(serial.fileno(), self.on_serial_readable)
+        try:
+            self.loop.run_until_complete(self.wait())
+        finally:
+            self.loop.remove_reader(serial.fileno())
+
+    async def wait(self):
+        self._stopped = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        misc = asyncio.ensure_future(self.misc())
+        if self.xbee.scheduler:
+            scheduler = asyncio.ensure_future(self.schedule())
+        await self._stopped.wait()
+        misc.cancel()
+        if self.xbee.scheduler:
+            scheduler.cancel()
+
+    def stop(self):
+        """
+        Stops the event loop, can be called from any thread
+        """
+        if self.loop and self._stopped:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def on_serial_readable(self):
+        """
+        Reads every byte waiting in the serial port and feeds them to the radio
+        """
+        serial = self.xbee.serial
+        try:
+            data = serial.read(serial.in_waiting or 1)
+        except Exception as e:
+            self.log(logging.ERROR, "Error while reading from serial port (%s)", e)
+            return
+        if data:
+            self.xbee.feed(data)
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, self.on_socket_readable)
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        # paho calls this from whatever thread publishes
+        self.loop.call_soon_threadsafe(self.loop.add_writer, sock, self.on_socket_writable)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.remove_writer, sock)
+
+    def on_socket_readable(self):
+        try:
+            self.mqtt.loop_read()
+        except Exception as e:
+            self.log(logging.ERROR, "Error while reading from MQTT broker (%s)", e)
+
+    def on_socket_writable(self):
+        try:
+            self.mqtt.loop_write()
+        except Exception as e:
+            self.log(logging.ERROR, "Error while writing to MQTT broker (%s)", e)
+
+    async def misc(self):
+        """
+        Periodic paho housekeeping: keepalives, retries, reconnections and offline replay
+        """
+        while True:
+            try:
+                self.mqtt.loop_misc()
+                self.mqtt.maintain()
+            except Exception as e:
+                self.log(logging.ERROR, "Error while looping MQTT (%s)", e)
+            if self.on_tick:
+                try:
+                    self.on_tick()
+                except Exception as e:
+                    self.log(logging.ERROR, "Error during housekeeping (%s)", e)
+            await asyncio.sleep(self.misc_interval)
+
+    def wakeup(self):
+        """
+        Wakes the scheduler coroutine up, can be called from any thread
+        """
+        if self._wakeup:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def schedule(self):
+        """
+        Drives the remote AT command scheduler
+        """
+        scheduler = self.xbee.scheduler
+        while True:
+            self._wakeup.clear()
+            try:
+                wait = scheduler.poll()
+            except Exception as e:
+                self.log(logging.ERROR, "Error while scheduling remote commands (%s)", e)
+                wait = 1
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def send_commands(self, commands):
+        """
+        Schedules a list of remote AT commands on the event loop instead of
+        sleeping between them on the calling thread
+        """
+        asyncio.run_coroutine_threadsafe(self.pace(commands), self.loop)
+
+    async def pace(self, commands):
+        for command in commands:
+            try:
+                self.xbee.send_command(command)
+            except Exception as e:
+                self.log(logging.ERROR, "Error while sending remote command (%s)", e)
+            await asyncio.sleep(self.xbee.query_delay)
@@ -0,0 +1,311 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import time
+import logging
+import binascii
+import threading
+from collections import deque, OrderedDict
+
+from .transactions import TransactionTable
+
+class ATRequest(object):
+    """
+    A remote AT command waiting to be sent or waiting for its response
+    """
+
+    __slots__ = ['address', 'command', 'parameter', 'callback', 'paced', 'attempts', 'frame_id']
+
+    def __init__(self, address, command, parameter=None, callback=None, paced=True):
+        self.address = address
+        self.command = command
+        self.parameter = parameter
+        self.callback = callback
+        self.paced = paced
+        self.attempts = 0
+        self.frame_id = None
+
+    def key(self):
+        return (self.address, self.command, self.parameter)
+
+    def arguments(self):
+        """
+        Returns the request as remote_at arguments
+        """
+        arguments = {
+            'dest_addr_long': self.address,
+            'command': self.command,
+            'frame_id': bytes([self.frame_id]),
+        }
+        if self.parameter is not None:
+            arguments['parameter'] = self.parameter
+        return arguments
+
+class ATScheduler(object):
+    """
+    Paces remote AT commands per destination radio.
+    Commands to the same radio are sent in order, at least 'interval' seconds apart and with at most
+    'max_in_flight' of them waiting for a response. Identical queries still waiting to be sent are
+    coalesced. Responses are matched to their requests by frame id through a TransactionTable,
+    requests that time out are retried with backoff.
+    """
+
+    # Minimum seconds between two paced commands sent to the same radio
+    interval = 1
+
+    # Commands awaiting a response, per radio and overall
+    max_in_flight = 1
+    max_total_in_flight = 8
+
+    logger = None
+
+    # Callable that actually sends a request, receives the remote_at arguments
+    sender = None
+
+    # Called whenever there may be new work, for schedulers driven by an external loop
+    on_wakeup = None
+
+    def __init__(self, sender=None):
+        """
+        Constructor
+        """
+        self.sender = sender
+        self.transactions = TransactionTable()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self._pending = OrderedDict()
+        self._queued = set()
+        self._next = {}
+
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    @property
+    def response_timeout(self):
+        return self.transactions.timeout
+
+    @response_timeout.setter
+    def response_timeout(self, timeout):
+        self.transactions.timeout = timeout
+
+    def submit(self, address, command, parameter=None, callback=None, paced=True, coalesce=True):
+        """
+        Queues a remote AT command for the given radio (raw 64-bit address).
+        Unpaced commands (user commands) skip the interval between commands and go ahead of the paced
+        ones waiting for the same radio, keeping their order among themselves and the in-flight limits.
+        Returns False if coalescing and an identical command was already waiting to be sent.
+        The callback, if any, is called with the request, the response status and parameter
+        (status is None if the command timed out).
+        """
+        request = ATRequest(address, command, parameter, callback, paced)
+        key = request.key()
+        with self._lock:
+            if coalesce:
+                if key in self._queued:
+                    self.coalesced += 1
+                    return False
+                self._queued.add(key)
+            queue = self._pending.get(address, None)
+            if queue is None:
+                queue = self._pending[address] = deque()
+            if paced:
+                queue.append(request)
+            else:
+                # Behind the other unpaced commands, ahead of the paced ones
+                position = 0
+                while position < len(queue) and not queue[position].paced:
+                    position += 1
+                queue.insert(position, request)
+        self.wakeup()
+        return True
+
+    def response(self, frame_id, status=None, parameter=None):
+        """
+        Matches a response with the request it answers, releasing its slot.
+        Returns the request or None if the frame id is unknown.
+        """
+        if isinstance(frame_id, bytes):
+            frame_id = frame_id[0] if frame_id else None
+        with self._lock:
+            request = self.transactions.close(frame_id, time.time())
+        if request is None:
+            return None
+        self.wakeup()
+        if request.callback:
+            request.callback(request, status, parameter)
+        return request
+
+    def wakeup(self):
+        """
+        Signals the scheduler there may be something to do
+        """
+        self._event.set()
+        if self.on_wakeup:
+            self.on_wakeup()
+
+    def poll(self, now=None):
+        """
+        Sends the commands that are due and retries those that timed out.
+        Returns the number of seconds until the next command may be due, None if idle.
+        """
+        now = time.time() if now is None else now
+        transactions = self.transactions
+        requests = []
+        wait = None
+
+        with self._lock:
+
+            retry, failed = transactions.expire(now)
+            for request in reversed(retry):
+                # Retries go first in their radio line
+                queue = self._pending.get(request.address, None)
+                if queue is None:
+                    queue = self._pending[request.address] = deque()
+                queue.appendleft(request)
+
+            for address in list(self._pending.keys()):
+                if len(transactions) >= self.max_total_in_flight:
+                    break
+                if transactions.count(address) >= self.max_in_flight:
+                    continue
+                queue = self._pending[address]
+                request = queue[0]
+                due = self._next.get(address, 0)
+                if request.paced and due > now:
+                    wait = due - now if wait is None else min(wait, due - now)
+                    continue
+                frame_id = transactions.open(request, now)
+                if frame_id is None:
+                    break
+
+                queue.popleft()
+                self._queued.discard(request.key())
+                if queue:
+                    # Round robin, move the radio to the back of the line
+                    self._pending.move_to_end(address)
+                    wait = self.interval if wait is None else min(wait, self.interval)
+                else:
+                    del self._pending[address]
+
+                request.frame_id = frame_id
+                if request.paced:
+                    self._next[address] = now + self.interval
+                requests.append(request)
+
+            # Forget pacing for radios that have nothing left to send
+            for address in list(self._next.keys()):
+                if self._next[address] <= now and address not in self._pending:
+                    del self._next[address]
+
+            deadline = transactions.next_deadline()
+            if deadline is not None:
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+
+        for request in retry:
+            self.retries += 1
+            self.log(logging.DEBUG, "Command %s to %s timed out, retrying", request.command, self.hexlify(request.address))
+
+        for request in failed:
+            self.timeouts += 1
+            self.log(logging.WARNING, "Command %s to %s timed out after %d attempts", request.command, self.hexlify(request.address), request.attempts)
+            if request.callback:
+                request.callback(request, None, None)
+
+        for request in requests:
+            try:
+                self.sender(request.arguments())
+                self.sent += 1
+            except Exception as e:
+                self.log(logging.ERROR, "Error while sending command %s to %s (%s)", request.command, self.hexlify(request.address), e)
+                with self._lock:
+                    transactions.cancel(request.frame_id)
+
+        return wait
+
+    def hexlify(self, address):
+        return binascii.hexlify(address).decode('ascii')
+
+    def latency(self):
+        """
+        Returns the round-trip statistics by radio (hex) address
+        """
+        with self._lock:
+            latency = self.transactions.latency()
+        return dict([(self.hexlify(address), stats) for address, stats in latency.items()])
+
+    def stats(self):
+        """
+        Returns the scheduler counters
+        """
+        with self._lock:
+            return {
+                'pending': sum([len(queue) for queue in self._pending.values()]),
+                'in_flight': len(self.transactions),
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'retries': self.retries,
+                'timeouts': self.timeouts,
+            }
+
+    def start(self):
+        """
+        Starts the scheduler thread
+        """
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self.run, name='at-scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the scheduler thread
+        """
+        if self._thread is None:
+            return
+        self._running = False
+        self._event.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def run(self):
+        """
+        Scheduler thread loop
+        """
+        while self._running:
+            self._event.clear()
+            wait = self.poll()
+            self._event.wait(wait)
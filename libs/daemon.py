@@ -67,7 +67,14 @@ class Daemon:
             f.write("%s\n" % pid)
 
         # attach signals hooks
+        self.attach_signals()
+
+    def attach_signals(self):
+        """
+        USR1 reloads the configuration, USR2 toggles profiling
+        """
         signal.signal( signal.SIGUSR1, self.reload_handler )
+        signal.signal( signal.SIGUSR2, self.profile_handler )
 
     def cleanup(self):
         os.remove(self.pidfile)
@@ -139,6 +146,18 @@ class Daemon:
         """
         Send USR1 signal to reload config
         """
+        self.send_signal(signal.SIGUSR1)
+
+    def profile(self):
+        """
+        Send USR2 signal to start or stop profiling
+        """
+        self.send_signal(signal.SIGUSR2)
+
+    def send_signal(self, signum):
+        """
+        Send a signal to the running daemon
+        """
         # Get the pid from the pidfile
         try:
             with open(self.pidfile,'r') as pf:
@@ -153,7 +172,7 @@ class Daemon:
 
         # Send signal
         try:
-            os.kill(pid, signal.SIGUSR1)
+            os.kill(pid, signum)
         except OSError as err:
             err = str(err)
             if err.find("No such process") > 0:
@@ -175,3 +194,15 @@ class Daemon:
         It will be called when the process receives a USR1 signal.
         """
 
+    def profile_handler(self, signum, frame):
+        """
+        Profile signal handler
+        """
+        self.do_profile()
+
+    def do_profile(self):
+        """
+        You should override this method when you subclass Daemon.
+        It will be called when the process receives a USR2 signal.
+        """
+
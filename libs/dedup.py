@@ -0,0 +1,147 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import time
+import threading
+from collections import OrderedDict
+
+class DuplicateRecord(object):
+    """
+    Last value published to a topic
+    """
+
+    __slots__ = ['value', 'time', 'expires']
+
+    def __init__(self, value, time, expires):
+        self.value = value
+        self.time = time
+        self.expires = expires
+
+class DuplicateFilter(object):
+    """
+    Suppresses values repeated on the same topic within a time window.
+    Records expire through a time wheel with one slot per 'resolution' seconds
+    and the number of records is capped, least recently used ones being evicted first,
+    so memory stays flat whatever the topic churn.
+    """
+
+    # Seconds per time wheel slot
+    resolution = 1
+
+    def __init__(self, window=5, maxsize=10000):
+        """
+        Constructor
+        """
+        self.window = window
+        self.maxsize = maxsize
+        self.checked = 0
+        self.suppressed = 0
+        self.expired = 0
+        self.evicted = 0
+        self._records = OrderedDict()
+        self._slots = int(window / self.resolution) + 3
+        self._wheel = [set() for i in range(self._slots)]
+        self._tick = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def duplicate(self, topic, value, now=None):
+        """
+        Returns True if the value was already seen for the topic within the window,
+        otherwise records it and returns False
+        """
+        if self.window <= 0:
+            return False
+        now = time.time() if now is None else now
+
+        with self._lock:
+            self._advance(now)
+            self.checked += 1
+            record = self._records.get(topic, None)
+            if record is not None:
+                self._records.move_to_end(topic)
+                if record.time + self.window > now and record.value == value:
+                    self.suppressed += 1
+                    return True
+                self._wheel[record.expires % self._slots].discard(topic)
+                record.value = value
+                record.time = now
+                record.expires = self._expires(now)
+            else:
+                record = self._records[topic] = DuplicateRecord(value, now, self._expires(now))
+                while len(self._records) > self.maxsize:
+                    evicted, old = self._records.popitem(last=False)
+                    self._wheel[old.expires % self._slots].discard(evicted)
+                    self.evicted += 1
+            self._wheel[record.expires % self._slots].add(topic)
+            return False
+
+    def expire(self, now=None):
+        """
+        Drops the records older than the window
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._advance(now)
+
+    def _expires(self, now):
+        # First wheel tick after the window is over
+        return int((now + self.window) / self.resolution) + 1
+
+    def _advance(self, now):
+        tick = int(now / self.resolution)
+        if self._tick is None or tick < self._tick:
+            self._tick = tick
+            return
+        if tick - self._tick >= self._slots:
+            # Everything is older than the window
+            self.expired += len(self._records)
+            self._records.clear()
+            for slot in self._wheel:
+                slot.clear()
+            self._tick = tick
+            return
+        while self._tick < tick:
+            self._tick += 1
+            slot = self._wheel[self._tick % self._slots]
+            for topic in slot:
+                record = self._records.get(topic, None)
+                if record is not None and record.expires == self._tick:
+                    del self._records[topic]
+                    self.expired += 1
+            slot.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._records),
+            'maxsize': self.maxsize,
+            'checked': self.checked,
+            'suppressed': self.suppressed,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
@@ -0,0 +1,48 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ['json', 'msgpack']
+
+def available(format):
+    """
+    Whether documents can be encoded in the given format
+    """
+    return format == 'json' or (format == 'msgpack' and msgpack is not None)
+
+def encode(document, format='json'):
+    """
+    Encodes a document, values that can not be serialized are turned into strings
+    """
+    if format == 'msgpack':
+        return msgpack.packb(document, default=str, use_bin_type=True)
+    return json.dumps(document, default=str, separators=(',', ':'))
@@ -24,30 +24,47 @@ __copyright__ = "Copyright (C) Xose Pérez"
 __license__ = 'GPL v3'
 
 import re
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from string import Formatter
 from datetime import datetime
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Batches smaller than this are processed as plain lists,
+# converting them to arrays is not worth it
+NUMPY_MIN_BATCH = 32
+
+def use_numpy(values):
+    """
+    Whether a batch of values should take the NumPy fast path
+    """
+    return numpy is not None and len(values) >= NUMPY_MIN_BATCH
+
 class FilterFactory(object):
     """
     Filter factory, returns the appropriate filter given the type
     """
 
-    filters = []
+    filters = {}
 
     @staticmethod
     def register(filter):
         """
         Registers a new filter class
         """
-        FilterFactory.filters.append(filter)
+        FilterFactory.filters[filter.name] = filter
 
     def __new__(self, type):
         """
         Constructor, returns an instance of a filter given type
         """
-        for filter in self.filters:
-            if filter.name == type:
-                return filter()
-        return None
+        filter = self.filters.get(type, None)
+        return filter() if filter else None
 
 class Filter(object):
     """
@@ -60,6 +77,10 @@ class Filter(object):
 
     required = []
 
+    # Stateful filters depend on the previous values, so they are never batched
+    # and may return None to drop a value
+    stateful = False
+
     def configure(self, parameters):
         """
         Loads the configuration parameters
@@ -70,17 +91,31 @@ class Filter(object):
         """
         Validates the configuration parameters
         """
+        parameters = self.parameters or {}
         for key in self.required:
-            if key not in self.parameters:
+            if key not in parameters:
                 return False
         return True
 
+    def prepare(self):
+        """
+        Precomputes whatever the filter needs from its (validated) parameters,
+        called once before the filter starts processing values
+        """
+        pass
+
     def process(self, value):
         """
         Processes the value
         """
         return value
 
+    def process_batch(self, values):
+        """
+        Processes a list of values, returns the list of processed values
+        """
+        return [self.process(value) for value in values]
+
 class LinearFilter(Filter):
     """
     Simple linear filter: y=ax+b
@@ -89,6 +124,11 @@ class LinearFilter(Filter):
     required = ['slope', 'offset']
     def process(self, value):
         return self.parameters['slope'] * float(value) + self.parameters['offset']
+    def process_batch(self, values):
+        slope, offset = self.parameters['slope'], self.parameters['offset']
+        if use_numpy(values):
+            return (numpy.asarray(values, dtype=float) * slope + offset).tolist()
+        return [slope * float(value) + offset for value in values]
 FilterFactory.register(LinearFilter)
 
 class RoundFilter(Filter):
@@ -102,6 +142,14 @@ class RoundFilter(Filter):
         if self.parameters['decimals'] == 0:
             value = int(value)
         return value
+    def process_batch(self, values):
+        decimals = self.parameters['decimals']
+        if use_numpy(values):
+            values = numpy.round(numpy.asarray(values, dtype=float), decimals)
+            return (values.astype(int) if decimals == 0 else values).tolist()
+        if decimals == 0:
+            return [int(round(float(value))) for value in values]
+        return [round(float(value), decimals) for value in values]
 FilterFactory.register(RoundFilter)
 
 class BooleanFilter(Filter):
@@ -112,6 +160,10 @@ class BooleanFilter(Filter):
     required = []
     def process(self, value):
         return 0 if int(value) == 0 else 1
+    def process_batch(self, values):
+        if use_numpy(values):
+            return (numpy.asarray(values).astype(int) != 0).astype(int).tolist()
+        return [0 if int(value) == 0 else 1 for value in values]
 FilterFactory.register(BooleanFilter)
 
 class NotFilter(Filter):
@@ -122,32 +174,86 @@ class NotFilter(Filter):
     required = []
     def process(self, value):
         return 1 if int(value) == 0 else 0
+    def process_batch(self, values):
+        if use_numpy(values):
+            return (numpy.asarray(values).astype(int) == 0).astype(int).tolist()
+        return [1 if int(value) == 0 else 0 for value in values]
 FilterFactory.register(NotFilter)
 
 class EnumFilter(Filter):
     """
-    Enumeration filter, returns the value for a dictionary which key matches the input value
+    Enumeration filter, returns the value for a dictionary which key matches the input value.
+    Parameters can either be the dictionary itself, in which case unknown values map to
+    the last entry, or a 'values' dictionary plus an explicit 'default'.
     """
     name = 'enum'
     required = []
+
+    _map = None
+    _has_default = False
+    _default = None
+
+    def prepare(self):
+        parameters = self.parameters or {}
+        values = parameters.get('values', None)
+        if isinstance(values, dict):
+            mapping = values
+            self._has_default = 'default' in parameters
+            self._default = parameters.get('default', None)
+        else:
+            mapping = parameters
+            self._has_default = len(mapping) > 0
+            self._default = list(mapping.values())[-1] if mapping else None
+        self._map = dict([(str(key), value) for key, value in mapping.items()])
+
     def process(self, value):
-        for from_value, to_value in self.parameters.items():
-            if str(value) == str(from_value):
-                return to_value
-        return to_value
+        try:
+            return self._map[str(value)]
+        except KeyError:
+            return self._default if self._has_default else value
+
+    def process_batch(self, values):
+        get = self._map.get
+        if self._has_default:
+            default = self._default
+            return [get(str(value), default) for value in values]
+        return [get(str(value), value) for value in values]
 FilterFactory.register(EnumFilter)
 
 class StepFilter(Filter):
     """
-    Step filter
+    Step filter, returns the value of the lowest threshold the input value does not exceed,
+    or the value of the highest threshold if it exceeds them all
     """
     name = 'step'
     required = []
+
+    _thresholds = None
+    _values = None
+
+    def prepare(self):
+        steps = sorted(
+            [(float(threshold), value) for threshold, value in (self.parameters or {}).items()],
+            key=lambda step: step[0]
+        )
+        if not steps:
+            raise ValueError("no thresholds defined")
+        self._thresholds = [threshold for threshold, value in steps]
+        self._values = [value for threshold, value in steps]
+
     def process(self, value):
-        for threshold, to_value in self.parameters.items():
-            if float(value) <= threshold:
-                return to_value
-        return to_value
+        index = bisect_left(self._thresholds, float(value))
+        return self._values[min(index, len(self._values) - 1)]
+
+    def process_batch(self, values):
+        last = len(self._values) - 1
+        if use_numpy(values):
+            indexes = numpy.searchsorted(self._thresholds, numpy.asarray(values, dtype=float), side='left')
+            indexes = numpy.minimum(indexes, last).tolist()
+        else:
+            thresholds = self._thresholds
+            indexes = [min(bisect_left(thresholds, float(value)), last) for value in values]
+        return [self._values[index] for index in indexes]
 FilterFactory.register(StepFilter)
 
 class FormatFilter(Filter):
@@ -156,15 +262,38 @@ class FormatFilter(Filter):
     """
     name = 'format'
     required = ['format']
+
+    timestamps = {
+        'date': '%Y-%m-%d',
+        'time': '%H:%M:%S',
+        'datetime': '%Y-%m-%d %H:%M:%S',
+    }
+
+    _format = None
+    _timestamps = None
+
+    def prepare(self):
+        """
+        Finds out which placeholders the format string uses so timestamps
+        are only computed when needed
+        """
+        self._format = self.parameters['format']
+        fields = set()
+        for literal, field, spec, conversion in Formatter().parse(self._format):
+            if field:
+                fields.add(re.split(r'[.\[]', field, 1)[0])
+        self._timestamps = dict([
+            (field, format) for field, format in self.timestamps.items() if field in fields
+        ])
+
     def process(self, value):
+        if not self._timestamps:
+            return self._format.format(value=value)
         now = datetime.now()
-        value = self.parameters['format'].format(
-            value=value,
-            date=now.strftime('%Y-%m-%d'),
-            time=now.strftime('%H:%M:%S'),
-            datetime=now.strftime('%Y-%m-%d %H:%M:%S')
-        )
-        return value
+        timestamps = dict([
+            (field, now.strftime(format)) for field, format in self._timestamps.items()
+        ])
+        return self._format.format(value=value, **timestamps)
 FilterFactory.register(FormatFilter)
 
 class RegExpFilter(Filter):
@@ -173,8 +302,194 @@ class RegExpFilter(Filter):
     """
     name = 'regexp'
     required = ['pattern', 'replacement']
+
+    _pattern = None
+
+    def prepare(self):
+        self._pattern = re.compile(self.parameters['pattern'])
+
     def process(self, value):
-        pattern = re.compile(self.parameters['pattern'])
-        return pattern.sub(self.parameters['replacement'], value)
+        return self._pattern.sub(self.parameters['replacement'], value)
 FilterFactory.register(RegExpFilter)
 
+class WindowFilter(Filter):
+    """
+    Abstract class for the aggregations over a sliding window of the last 'samples' values
+    and/or the values of the last 'seconds' seconds. With 'downsample' set the window is
+    tumbling instead: one aggregate is returned per full window and the other values are dropped.
+    Values are kept in a ring buffer, the aggregation being updated as values enter and leave it.
+    """
+    required = []
+    stateful = True
+
+    # Clock, replaceable for testing
+    clock = time.time
+
+    _buffer = None
+    _sequence = 0
+    _start = None
+
+    def validate(self):
+        parameters = self.parameters or {}
+        return 'samples' in parameters or 'seconds' in parameters
+
+    def prepare(self):
+        parameters = self.parameters
+        self._samples = parameters.get('samples', None)
+        self._seconds = parameters.get('seconds', None)
+        self._downsample = parameters.get('downsample', False)
+        if self._samples is not None and int(self._samples) < 1:
+            raise ValueError("samples must be positive")
+        if self._seconds is not None and float(self._seconds) <= 0:
+            raise ValueError("seconds must be positive")
+        self._buffer = deque(maxlen=int(self._samples) if self._samples else None)
+        self.reset()
+
+    def process(self, value):
+        value = float(value)
+        now = self.clock()
+        buffer = self._buffer
+
+        if self._downsample and self._start is not None and self._seconds is not None \
+            and now - self._start >= self._seconds:
+            # The time window is over, this value belongs to the next one
+            result = self.result() if buffer else None
+            buffer.clear()
+            self.reset()
+            self.append(buffer, value, now)
+            return result
+
+        self.append(buffer, value, now)
+        if self._downsample:
+            if self._samples and len(buffer) >= self._samples:
+                result = self.result()
+                buffer.clear()
+                self.reset()
+                return result
+            return None
+
+        if self._seconds is not None:
+            while buffer[0][1] <= now - self._seconds:
+                self.remove(*buffer.popleft())
+        return self.result()
+
+    def append(self, buffer, value, now):
+        if self._start is None:
+            self._start = now
+        if buffer.maxlen is not None and len(buffer) == buffer.maxlen:
+            self.remove(*buffer.popleft())
+        self._sequence += 1
+        entry = (self._sequence, now, value)
+        buffer.append(entry)
+        self.add(*entry)
+
+    def reset(self):
+        """
+        Clears the aggregation state
+        """
+        self._start = None
+
+    def add(self, sequence, now, value):
+        pass
+
+    def remove(self, sequence, now, value):
+        pass
+
+    def result(self):
+        return None
+
+class AverageFilter(WindowFilter):
+    """
+    Moving average, keeps a running sum
+    """
+    name = 'average'
+    _sum = 0.0
+    def reset(self):
+        WindowFilter.reset(self)
+        self._sum = 0.0
+    def add(self, sequence, now, value):
+        self._sum += value
+    def remove(self, sequence, now, value):
+        self._sum -= value
+    def result(self):
+        return self._sum / len(self._buffer)
+FilterFactory.register(AverageFilter)
+
+class MinimumFilter(WindowFilter):
+    """
+    Rolling minimum, keeps a monotonic queue of candidates
+    """
+    name = 'minimum'
+    _candidates = None
+    def better(self, a, b):
+        return a <= b
+    def reset(self):
+        WindowFilter.reset(self)
+        self._candidates = deque()
+    def add(self, sequence, now, value):
+        candidates = self._candidates
+        while candidates and self.better(value, candidates[-1][1]):
+            candidates.pop()
+        candidates.append((sequence, value))
+    def remove(self, sequence, now, value):
+        if self._candidates and self._candidates[0][0] == sequence:
+            self._candidates.popleft()
+    def result(self):
+        return self._candidates[0][1]
+FilterFactory.register(MinimumFilter)
+
+class MaximumFilter(MinimumFilter):
+    """
+    Rolling maximum, keeps a monotonic queue of candidates
+    """
+    name = 'maximum'
+    def better(self, a, b):
+        return a >= b
+FilterFactory.register(MaximumFilter)
+
+class MedianFilter(WindowFilter):
+    """
+    Rolling median, keeps the window values sorted
+    """
+    name = 'median'
+    _sorted = None
+    def reset(self):
+        WindowFilter.reset(self)
+        self._sorted = []
+    def add(self, sequence, now, value):
+        insort(self._sorted, value)
+    def remove(self, sequence, now, value):
+        del self._sorted[bisect_left(self._sorted, value)]
+    def result(self):
+        values = self._sorted
+        middle = len(values) // 2
+        if len(values) % 2:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2.0
+FilterFactory.register(MedianFilter)
+
+class EWMAFilter(Filter):
+    """
+    Exponentially weighted moving average: y=alpha*x+(1-alpha)*y'
+    """
+    name = 'ewma'
+    required = ['alpha']
+    stateful = True
+
+    _alpha = None
+    _average = None
+
+    def prepare(self):
+        self._alpha = float(self.parameters['alpha'])
+        if not 0 < self._alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self._average = None
+
+    def process(self, value):
+        value = float(value)
+        if self._average is None:
+            self._average = value
+        else:
+            self._average = self._alpha * value + (1 - self._alpha) * self._average
+        return self._average
+FilterFactory.register(EWMAFilter)
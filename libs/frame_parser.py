@@ -0,0 +1,204 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+START_BYTE = 0x7E
+ESCAPE_BYTE = 0x7D
+
+# Supported frame types
+RX = 0x90
+RX_IO_DATA = 0x92
+NODE_ID = 0x95
+AT_RESPONSE = 0x88
+REMOTE_AT_RESPONSE = 0x97
+
+class FrameParser(object):
+    """
+    Decoder for XBee ZigBee API frames in escaped mode (AP=2).
+    Bytes are buffered as they are read, frames are cut at start delimiters
+    (which never appear escaped in the data), unescaped, checked and decoded
+    into tuples whose first element is the frame type:
+
+        (RX, address, rf_data)
+        (RX_IO_DATA, address, [(port, value), ...])
+        (NODE_ID, address, node_id)
+        (AT_RESPONSE, frame_id, command, status, parameter)
+        (REMOTE_AT_RESPONSE, frame_id, address, command, status, parameter)
+
+    Addresses are the raw 64-bit addresses, commands and statuses are strings
+    and the parameter of ND responses is decoded into a dictionary.
+    Other frame types are ignored.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._buffer = bytearray()
+        self.frames = 0
+        self.errors = 0
+        self.decoders = {
+            RX: self.decode_rx,
+            RX_IO_DATA: self.decode_io_data,
+            NODE_ID: self.decode_node_id,
+            AT_RESPONSE: self.decode_at_response,
+            REMOTE_AT_RESPONSE: self.decode_remote_at_response,
+        }
+
+    def unescape(self, data):
+        """
+        Removes the escaping from a frame, returns None if it ends in the middle of an escape sequence
+        """
+        if ESCAPE_BYTE not in data:
+            return data
+        parts = data.split(b'\x7d')
+        unescaped = bytearray(parts[0])
+        for part in parts[1:]:
+            if not part:
+                return None
+            unescaped.append(part[0] ^ 0x20)
+            unescaped += part[1:]
+        return unescaped
+
+    def feed(self, data):
+        """
+        Buffers the given bytes and returns the list of frames completed
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+
+        while True:
+            start = buffer.find(START_BYTE)
+            if start == -1:
+                del buffer[:]
+                break
+            following = buffer.find(START_BYTE, start + 1)
+            end = len(buffer) if following == -1 else following
+
+            frame = self.unescape(bytes(buffer[start + 1:end]))
+            length = (frame[0] << 8 | frame[1]) if frame is not None and len(frame) >= 2 else None
+            if length is None or len(frame) < length + 3:
+                if following == -1:
+                    # Incomplete, wait for more data
+                    del buffer[:start]
+                    break
+                # Truncated by the next frame
+                self.errors += 1
+                del buffer[:following]
+                continue
+
+            # Anything after the checksum and before the next frame is garbage
+            del buffer[:end]
+            data = frame[2:2 + length]
+            if (sum(data) + frame[2 + length]) & 0xFF != 0xFF:
+                self.errors += 1
+                continue
+
+            decoded = self.decode(data)
+            if decoded is not None:
+                self.frames += 1
+                frames.append(decoded)
+
+        return frames
+
+    def decode(self, data):
+        """
+        Decodes the data of a checked frame
+        """
+        decoder = self.decoders.get(data[0], None)
+        if decoder is None:
+            return None
+        try:
+            return decoder(data)
+        except (IndexError, ValueError):
+            self.errors += 1
+            return None
+
+    def decode_rx(self, data):
+        # id, source_addr_long(8), source_addr(2), options(1), rf_data
+        return (RX, bytes(data[1:9]), bytes(data[12:]))
+
+    def decode_io_data(self, data):
+        # id, source_addr_long(8), source_addr(2), options(1), samples
+        return (RX_IO_DATA, bytes(data[1:9]), self.decode_samples(data[12:]))
+
+    def decode_samples(self, data):
+        """
+        Decodes ZigBee IO samples into (port, value) tuples, digital ports first
+        """
+        count = data[0]
+        dio_mask = (data[1] << 8 | data[2]) & 0x1CFF
+        aio_mask = data[3]
+        dio_channels = [i for i in range(13) if dio_mask & (1 << i)]
+        aio_channels = [i for i in range(8) if aio_mask & (1 << i)]
+
+        samples = []
+        index = 4
+        for sample in range(count):
+            if dio_channels:
+                values = (data[index] << 8 | data[index + 1]) & dio_mask
+                index += 2
+                for i in dio_channels:
+                    samples.append(('dio-%d' % i, (values >> i) & 1 == 1))
+            for i in aio_channels:
+                samples.append(('adc-%d' % i, data[index] << 8 | data[index + 1]))
+                index += 2
+        if index > len(data):
+            raise IndexError("truncated IO samples")
+        return samples
+
+    def decode_node_id(self, data):
+        # id, sender_addr_long(8), sender_addr(2), options(1), source_addr(2), source_addr_long(8), node_id, 0x00, ...
+        end = data.index(0, 22)
+        return (NODE_ID, bytes(data[14:22]), bytes(data[22:end]))
+
+    def decode_at_response(self, data):
+        # id, frame_id(1), command(2), status(1), parameter
+        command = data[2:4].decode('latin-1')
+        status = chr(data[4])
+        parameter = bytes(data[5:])
+        if command == 'ND' and status == '\x00':
+            parameter = self.decode_node_discovery(parameter)
+        return (AT_RESPONSE, data[1], command, status, parameter)
+
+    def decode_remote_at_response(self, data):
+        # id, frame_id(1), source_addr_long(8), source_addr(2), command(2), status(1), parameter
+        return (REMOTE_AT_RESPONSE, data[1], bytes(data[2:10]), data[12:14].decode('latin-1'), chr(data[14]), bytes(data[15:]))
+
+    def decode_node_discovery(self, parameter):
+        """
+        Decodes the parameter of a node discovery response
+        """
+        end = parameter.index(0, 10)
+        return {
+            'source_addr': parameter[0:2],
+            'source_addr_long': parameter[2:10],
+            'node_identifier': parameter[10:end],
+            'parent_address': parameter[end + 1:end + 3],
+            'device_type': parameter[end + 3:end + 4],
+            'status': parameter[end + 4:end + 5],
+            'profile_id': parameter[end + 5:end + 7],
+            'manufacturer': parameter[end + 7:end + 9],
+        }
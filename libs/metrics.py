@@ -0,0 +1,274 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class Histogram(object):
+    """
+    HDR-style histogram of durations: values are recorded in microseconds into
+    log-linear buckets (exact below 2^precision, then 2^(precision-1) linear
+    buckets per power of two), so any percentile is known within a relative
+    error of 2^(1-precision) using a few hundred counters at most.
+    """
+
+    precision = 6
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0
+        self._exact = 1 << self.precision
+        self._half = self._exact >> 1
+
+    def index(self, value):
+        if value < self._exact:
+            return value
+        shift = value.bit_length() - self.precision
+        return self._exact + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def value(self, index):
+        """
+        Highest value recorded in a bucket
+        """
+        if index < self._exact:
+            return index
+        shift = (index - self._exact) // self._half + 1
+        top = (index - self._exact) % self._half + self._half
+        return ((top + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1000000))
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, quantile):
+        """
+        Value in seconds below which the given fraction of the records fall
+        """
+        if not self.count:
+            return 0.0
+        rank = quantile * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.value(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+class Metrics(object):
+    """
+    Registry of the gateway metrics: counters, histograms and gauges
+    whose value is read from a callback when the metrics are collected.
+    Metrics are identified by name and an optional dictionary of labels.
+    Rendered in the Prometheus text format or as a flat list of values.
+    """
+
+    namespace = 'xbee2mqtt'
+    quantiles = [0.5, 0.9, 0.99, 0.999]
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def key(self, name, labels):
+        return (name, tuple(sorted(labels.items())) if labels else ())
+
+    def describe(self, name, help):
+        self._help[name] = help
+
+    def inc(self, name, labels=None, amount=1):
+        """
+        Increments a counter
+        """
+        key = self.key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, labels=None):
+        """
+        Records a duration into a histogram
+        """
+        key = self.key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key, None)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.record(seconds)
+
+    def gauge(self, name, callback, labels=None, type='gauge'):
+        """
+        Registers a callback returning the current value of a metric,
+        type is 'counter' for callbacks returning ever-growing totals
+        """
+        self._gauges[self.key(name, labels)] = (callback, type)
+
+    def collect(self):
+        """
+        Returns the current metrics as (name, type, labels, value) tuples,
+        histograms as a dictionary of quantiles plus 'sum' and 'count'
+        """
+        metrics = []
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                metrics.append((name, 'counter', labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                value = dict([(quantile, histogram.percentile(quantile)) for quantile in self.quantiles])
+                value['sum'] = histogram.sum
+                value['count'] = histogram.count
+                metrics.append((name, 'summary', labels, value))
+        for (name, labels), (callback, type) in list(self._gauges.items()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            if value is not None:
+                metrics.append((name, type, labels, value))
+        return sorted(metrics, key=lambda metric: (metric[0], metric[2]))
+
+    def format_labels(self, labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return ''
+        return '{%s}' % ','.join([
+            '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for key, value in labels
+        ])
+
+    def render(self):
+        """
+        Prometheus text exposition of the metrics
+        """
+        lines = []
+        described = set()
+        for name, type, labels, value in self.collect():
+            full = '%s_%s' % (self.namespace, name) + ('_total' if type == 'counter' else '')
+            if full not in described:
+                described.add(full)
+                if name in self._help:
+                    lines.append('# HELP %s %s' % (full, self._help[name]))
+                lines.append('# TYPE %s %s' % (full, type))
+            if type == 'summary':
+                for quantile in self.quantiles:
+                    lines.append('%s%s %s' % (full, self.format_labels(labels, [('quantile', quantile)]), value[quantile]))
+                lines.append('%s_sum%s %s' % (full, self.format_labels(labels), value['sum']))
+                lines.append('%s_count%s %s' % (full, self.format_labels(labels), value['count']))
+            else:
+                lines.append('%s%s %s' % (full, self.format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+    def values(self):
+        """
+        The metrics as (path, value) tuples, the path made of the
+        metric name and its label values, i.e. to publish them as topics
+        """
+        values = []
+        for name, type, labels, value in self.collect():
+            path = '/'.join([name] + [str(label) for _, label in labels])
+            if type == 'summary':
+                for quantile in self.quantiles:
+                    values.append(('%s/p%s' % (path, ('%g' % (quantile * 100)).replace('.', '')), value[quantile]))
+                values.append(('%s/count' % path, value['count']))
+            else:
+                values.append((path, value))
+        return values
+
+class MetricsServer(object):
+    """
+    Serves the metrics in the Prometheus text format over HTTP from a background thread
+    """
+
+    host = '127.0.0.1'
+    port = 9717
+    logger = None
+
+    def __init__(self, metrics, host=None, port=None):
+        """
+        Constructor
+        """
+        self.metrics = metrics
+        if host is not None:
+            self.host = host
+        if port is not None:
+            self.port = port
+        self._server = None
+        self._thread = None
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    def start(self):
+        """
+        Starts listening, returns False if the port could not be bound
+        """
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            self.log(logging.ERROR, "Could not start the metrics server on %s:%s (%s)", self.host, self.port, e)
+            return False
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics')
+        self._thread.daemon = True
+        self._thread.start()
+        self.log(logging.INFO, "Serving metrics on http://%s:%s/metrics", self.host, self._server.server_address[1])
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
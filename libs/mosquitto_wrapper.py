@@ -22,7 +22,7 @@ __contact__ = "xose.perez@gmail.com"
 __copyright__ = "Copyright (C) 2013 Xose Pérez"
 __license__ = 'GPL v3'
 
-from paho.mqtt.client import Client as Mosquitto, MQTTv311
+from paho.mqtt.client import Client as Mosquitto, MQTTv311, MQTT_ERR_SUCCESS
 try:
     from paho.mqtt.client import CallbackAPIVersion
     PAHO_V2 = True
@@ -30,8 +30,13 @@ except ImportError:
     PAHO_V2 = False
 import ctypes
 import time
+import threading
+import socket
 import logging
 
+from libs.subscriptions import SubscriptionRegistry
+from libs.reconnect import ReconnectSupervisor
+
 # Class messages
 MSG_CONNECTED = 1
 MSG_DISCONNECTED = 2
@@ -51,6 +56,10 @@ class MosquittoWrapper(Mosquitto):
     retain = False
     set_will = True
 
+    # QoS of the subscriptions and maximum topics per SUBSCRIBE/UNSUBSCRIBE packet
+    subscribe_qos = 0
+    subscribe_chunk_size = 100
+
     status_topic = '/service/%s/status'
     subscribe_to = []
 
@@ -59,12 +68,42 @@ class MosquittoWrapper(Mosquitto):
 
     on_message_cleaned = None
 
-    _subscriptions = {}
+    # Optional PublishBatcher, publications are sent in bursts when set
+    batcher = None
+
+    subscriptions = None
+
+    # Reconnection backoff, attempts are made from maintain()
+    reconnect_supervisor = None
+
+    # Optional OfflineBuffer (or MessageSpool) for the publications made while disconnected,
+    # replayed after reconnecting at up to replay_rate messages per second (0 for no limit)
+    # reading at most replay_batch messages at a time
+    offline = None
+    replay_rate = 50
+    replay_batch = 1000
+
+    # Optional Metrics, published messages, queue depths and reconnections are reported
+    metrics = None
+
+    _replay_budget = 0
+    _replay_time = 0
+    _replaying = False
+    _inflight = None
+    _early = None
 
     def __init__(self, client_id="", clean_session=None, userdata=None, protocol=None, transport="tcp"):
         """
         Initialize with compatibility for both paho-mqtt v1.x and v2.x
         """
+        self.subscriptions = SubscriptionRegistry()
+        self.reconnect_supervisor = ReconnectSupervisor()
+        # Guards the buffer-or-send decision against a concurrent replay, never held while sending
+        self._offline_lock = threading.Lock()
+        # Message ids of the replayed messages not confirmed yet, and confirmations that beat their id
+        self._inflight = set()
+        self._early = set()
+
         # Default to MQTTv311 if protocol not specified
         if protocol is None:
             protocol = MQTTv311
@@ -94,9 +133,9 @@ class MosquittoWrapper(Mosquitto):
                 transport=transport
             )
 
-    def log(self, level, message):
+    def log(self, level, message, *args):
         if self.logger:
-            self.logger.log(level, message)
+            self.logger.log(level, message, *args)
 
     def connect(self):
         """
@@ -105,42 +144,174 @@ class MosquittoWrapper(Mosquitto):
         self.on_connect = self.__on_connect
         self.on_message = self.__on_message
         self.on_disconnect = self.__on_disconnect
+        self.on_publish = self.__on_publish
         self.on_subscribe = self.__on_subscribe
         self.on_unsubscribe = self.__on_unsubscribe
-        self.on_log = self.__on_log
+        # paho builds a log line for every packet, only ask for them when they are wanted
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+            self.on_log = self.__on_log
         if self.username:
             self.username_pw_set(self.username, self.password)
         if self.set_will:
             # Decode client_id from bytes to string for Python 3 compatibility
             client_id_str = self._client_id.decode('utf-8') if isinstance(self._client_id, bytes) else self._client_id
             self.will_set(self.status_topic % client_id_str, "0", self.qos, self.retain)
-        self.log(logging.INFO, "Connecting to MQTT broker at %s:%s" % (self.host, self.port))
+        self.log(logging.INFO, "Connecting to MQTT broker at %s:%s", self.host, self.port)
         # Ensure host is a valid string (paho-mqtt v2.x is strict about validation)
         if not self.host or not isinstance(self.host, str):
             raise ValueError("MQTT host must be a valid string, got: %s" % repr(self.host))
-        Mosquitto.connect(self, self.host, self.port, self.keepalive)
+        if self.batcher is not None:
+            self.batcher.sender = self.publish_batch
+            self.batcher.logger = self.logger
+            self.batcher.start()
+        if self.metrics is not None:
+            self.register_metrics(self.metrics)
+        try:
+            Mosquitto.connect(self, self.host, self.port, self.keepalive)
+        except (socket.error, OSError) as e:
+            # Keep running, maintain() will retry
+            self.log(logging.ERROR, "Could not connect to MQTT broker (%s)", e)
+            self.reconnect_supervisor.disconnected()
+
+    def register_metrics(self, metrics):
+        supervisor = self.reconnect_supervisor
+        metrics.describe('delivered', 'Messages sent (QoS 0) or acknowledged by the broker')
+        metrics.gauge('mqtt_connected', lambda: int(self.connected))
+        metrics.gauge('mqtt_reconnects', lambda: supervisor.reconnects, type='counter')
+        metrics.gauge('mqtt_reconnect_failures', lambda: supervisor.failures, type='counter')
+        if self.offline is not None:
+            metrics.describe('mqtt_offline_messages', 'Messages waiting to be replayed after a disconnection')
+            metrics.gauge('mqtt_offline_messages', lambda: len(self.offline))
+            metrics.gauge('mqtt_offline_dropped', lambda: self.offline.stats()['dropped'], type='counter')
+        if self.batcher is not None:
+            metrics.gauge('mqtt_batched_messages', lambda: len(self.batcher))
+
+    def maintain(self, now=None):
+        """
+        Reconnects to the broker when an attempt is due and replays the offline buffer.
+        Must be called regularly from the thread driving the network loop (never from a callback).
+        Returns the seconds until the next reconnection attempt, None if none is scheduled.
+        """
+        now = time.time() if now is None else now
+        supervisor = self.reconnect_supervisor
+        if self.connected:
+            if self.offline is not None and len(self.offline):
+                self.replay(now)
+            return None
+        if supervisor.due(now):
+            self.log(logging.INFO, "Reconnecting to MQTT broker (attempt %d)", supervisor.attempts)
+            error = supervisor.attempt(lambda: Mosquitto.reconnect(self), now)
+            if error is not None:
+                self.log(logging.ERROR, "Could not reconnect to MQTT broker (%s), retrying in %.1f seconds", error, supervisor.wait(now))
+        return supervisor.wait(now)
+
+    def replay(self, now):
+        """
+        Publishes the buffered messages allowed by replay_rate since the last call.
+        They are only acknowledged (and dropped from the buffer) once paho reports them
+        published, the next batch waits until then.
+        """
+        if self._inflight:
+            return
+        if self.replay_rate > 0:
+            elapsed = max(0, now - self._replay_time)
+            self._replay_budget = min(self.replay_rate, self._replay_budget + elapsed * self.replay_rate)
+            self._replay_time = now
+            count = int(self._replay_budget)
+            if count == 0:
+                return
+        else:
+            count = len(self.offline)
+        # New publications are buffered until the batch taken here has been delivered
+        with self._offline_lock:
+            messages = self.offline.take(min(count, self.replay_batch))
+            self._replaying = bool(messages)
+        if not messages:
+            return
+        self._replay_budget -= len(messages)
+        if self.metrics is not None:
+            self.metrics.inc('published', amount=len(messages))
+        infos = self.write(messages)
+        with self._offline_lock:
+            if not self._replaying:
+                # Disconnected meanwhile, the batch has already been rewound
+                return
+            if any(info.rc != MQTT_ERR_SUCCESS for info in infos):
+                self.log(logging.ERROR, "Could not replay buffered messages, retrying later")
+                self._rewind()
+                return
+            self._inflight = set(info.mid for info in infos) - self._early
+            self._early.clear()
+            if not self._inflight:
+                self._delivered()
+
+    def _delivered(self):
+        """
+        The replayed batch has been published, called with the offline lock held
+        """
+        self.offline.acknowledge()
+        self._replaying = False
+        if not len(self.offline):
+            self.log(logging.INFO, "Offline buffer replayed")
+
+    def _rewind(self):
+        """
+        The replayed batch will be replayed again, called with the offline lock held
+        """
+        self.offline.rewind()
+        self._inflight = set()
+        self._early.clear()
+        self._replaying = False
+
+    def disconnect(self):
+        """
+        Sends the pending publications and disconnects from the broker
+        """
+        if self.batcher is not None:
+            self.batcher.stop()
+        return Mosquitto.disconnect(self)
 
     def subscribe(self, topics):
         """
-        Subscribe to a given topic
+        Subscribe to a given topic, topics already subscribed are ignored
         """
         if not isinstance(topics, list):
             topics = [topics]
-        for topic in topics:
-            rc, mid = Mosquitto.subscribe(self, topic, 0)
-            self._subscriptions[mid] = topic
-            self.log(logging.INFO, "Sent subscription request to topic %s" % topic)
+        if self.subscriptions.want(topics):
+            self.flush_subscriptions()
 
     def unsubscribe(self, topics):
         """
-        Unsubscribe of a given topic
+        Unsubscribe of a given topic, topics not subscribed are ignored
         """
         if not isinstance(topics, list):
             topics = [topics]
-        for topic in topics:
-            rc, mid = Mosquitto.unsubscribe(self, topic)
-            self._subscriptions[mid] = topic
-            self.log(logging.INFO, "Sent unsubscription request of topic %s" % topic)
+        if self.subscriptions.unwant(topics):
+            self.flush_subscriptions()
+
+    def flush_subscriptions(self):
+        """
+        Sends the pending subscription changes to the broker
+        in multi-topic packets of up to subscribe_chunk_size topics
+        """
+        if not self.connected:
+            return
+        subscribe, unsubscribe = self.subscriptions.changes()
+        size = max(1, self.subscribe_chunk_size)
+        for start in range(0, len(subscribe), size):
+            chunk = subscribe[start:start + size]
+            rc, mid = Mosquitto.subscribe(self, [(topic, self.subscribe_qos) for topic in chunk])
+            self.subscriptions.sent(mid, chunk, rc == MQTT_ERR_SUCCESS)
+            self.log(logging.INFO, "Sent subscription request to %d topics", len(chunk))
+            if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Subscribing to %s", ', '.join(chunk))
+        for start in range(0, len(unsubscribe), size):
+            chunk = unsubscribe[start:start + size]
+            rc, mid = Mosquitto.unsubscribe(self, chunk)
+            self.subscriptions.sent(mid, chunk, rc == MQTT_ERR_SUCCESS)
+            self.log(logging.INFO, "Sent unsubscription request of %d topics", len(chunk))
+            if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Unsubscribing from %s", ', '.join(chunk))
 
     def publish(self, topic, value, qos=None, retain=None):
         """
@@ -151,7 +322,49 @@ class MosquittoWrapper(Mosquitto):
         # Ensure topic is a string for Python 3 compatibility
         if isinstance(topic, bytes):
             topic = topic.decode('utf-8')
-        Mosquitto.publish(self, topic, str(value), qos, retain)
+        payload = value if isinstance(value, (bytes, bytearray)) else str(value)
+        # Messages wait in the buffer while it is being replayed, so they are not overtaken by older ones
+        if self.offline is not None:
+            with self._offline_lock:
+                buffered = not self.connected or self._replaying or len(self.offline) > 0
+                if buffered:
+                    self.offline.put(topic, payload, qos, retain)
+            if buffered:
+                return
+        self.send(topic, payload, qos, retain)
+
+    def send(self, topic, payload, qos, retain):
+        if self.metrics is not None:
+            self.metrics.inc('published')
+        if self.batcher is not None:
+            self.batcher.add(topic, payload, qos, retain)
+        else:
+            Mosquitto.publish(self, topic, payload, qos, retain)
+
+    def publish_batch(self, messages):
+        """
+        Publishes a list of (topic, payload, qos, retain) tuples in a single write burst
+        """
+        if self.offline is not None:
+            with self._offline_lock:
+                if not self.connected:
+                    # The connection was lost while the batch was filling up,
+                    # it goes back in front of the messages buffered since then
+                    self.offline.requeue(messages)
+                    return
+        self.write(messages)
+
+    def write(self, messages):
+        """
+        Publishes the messages through paho and writes whatever it left queued
+        to the socket afterwards, unless an event loop takes care of the writes.
+        Returns paho's MQTTMessageInfo for each message.
+        """
+        # No paho lock is held here: PUBACK handling takes them in its own order
+        infos = [Mosquitto.publish(self, topic, payload, qos, retain) for topic, payload, qos, retain in messages]
+        if self.on_socket_register_write is None and self.want_write():
+            self.loop_write()
+        return infos
 
     def __on_connect(self, mosq, obj, flags, rc):
         """
@@ -161,22 +374,48 @@ class MosquittoWrapper(Mosquitto):
             self.log(logging.INFO , "Connected to MQTT broker")
             # Decode client_id from bytes to string for Python 3 compatibility
             client_id_str = self._client_id.decode('utf-8') if isinstance(self._client_id, bytes) else self._client_id
-            self.publish(self.status_topic % client_id_str, "1")
-            self.subscribe(self.subscribe_to)
             self.connected = True
+            self.reconnect_supervisor.connected()
+            self._replay_time = time.time()
+            self._replay_budget = 0
+            if self.offline is not None and len(self.offline):
+                self.log(logging.INFO, "Replaying %d buffered messages", len(self.offline))
+            self.send(self.status_topic % client_id_str, "1", self.qos, self.retain)
+            self.subscriptions.reset()
+            self.subscriptions.want(self.subscribe_to)
+            self.flush_subscriptions()
         else:
             self.log(logging.ERROR , "Could not connect to MQTT broker")
             self.connected = False
+            self.reconnect_supervisor.disconnected()
 
     def __on_disconnect(self, mosq, obj, rc):
         """
         Callback when disconnecting from the MQTT broker
         """
-        self.connected = False
+        with self._offline_lock:
+            self.connected = False
+            if self._replaying:
+                self._rewind()
         self.log(logging.INFO, "Disconnected from MQTT broker")
         if rc != 0:
-            time.sleep(3)
-            self.connect()
+            # Reconnecting here would block the network loop, maintain() takes care of it
+            self.reconnect_supervisor.disconnected()
+
+    def __on_publish(self, mosq, obj, mid):
+        """
+        Callback when a message has been sent (QoS 0) or acknowledged by the broker
+        """
+        if self.metrics is not None:
+            self.metrics.inc('delivered')
+        with self._offline_lock:
+            if mid in self._inflight:
+                self._inflight.discard(mid)
+                if not self._inflight:
+                    self._delivered()
+            elif self._replaying:
+                # Published before replay() got to know its id
+                self._early.add(mid)
 
     def __on_message(self, mosq, obj, msg):
         """
@@ -193,15 +432,15 @@ class MosquittoWrapper(Mosquitto):
         """
         Callback when succeeded subscription
         """
-        topic = self._subscriptions.get(mid, 'Unknown')
-        self.log(logging.INFO, "Subscription to topic %s confirmed" % topic)
+        topics = self.subscriptions.acknowledged(mid, qos_list)
+        self.log(logging.INFO, "Subscription to %s topics confirmed", len(topics) if topics else 'unknown')
 
     def __on_unsubscribe(self, mosq, obj, mid):
         """
         Callback when succeeded an unsubscription
         """
-        topic = self._subscriptions.get(mid, 'Unknown')
-        self.log(logging.INFO, "Unsubscription of topic %s confirmed" % topic)
+        topics = self.subscriptions.acknowledged(mid)
+        self.log(logging.INFO, "Unsubscription of %s topics confirmed", len(topics) if topics else 'unknown')
 
     def __on_log(self, mosq, obj, level, string):
         self.log(logging.DEBUG, string)
@@ -222,8 +461,9 @@ if __name__ == '__main__':
     mqtt.logger = logger
     mqtt.connect()
 
-    rc = 0
-    while rc == 0:
-        rc = mqtt.loop()
-    print("rc: "+str(rc))
+    while True:
+        mqtt.loop()
+        mqtt.maintain()
+        if mqtt.socket() is None:
+            time.sleep(1)
 
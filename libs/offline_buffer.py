@@ -0,0 +1,157 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import threading
+from collections import deque, OrderedDict
+
+# Overflow policies
+POLICY_LATEST = 'latest'
+POLICY_FIFO = 'fifo'
+
+class OfflineBuffer(object):
+    """
+    Bounded buffer for the messages published while the broker is unreachable.
+    With the 'latest' policy only the latest message of each topic is kept
+    (and at most maxsize topics), with 'fifo' every message is kept in order
+    up to maxsize. In both cases the oldest entries are dropped when full.
+    """
+
+    policies = [POLICY_LATEST, POLICY_FIFO]
+
+    def __init__(self, maxsize=1000, policy=POLICY_LATEST):
+        """
+        Constructor
+        """
+        if policy not in self.policies:
+            raise ValueError("Unknown offline buffer policy '%s', valid values are %s" % (policy, self.policies))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.buffered = 0
+        self.replaced = 0
+        self.dropped = 0
+        self._messages = OrderedDict() if policy == POLICY_LATEST else deque()
+        # Messages taken but not yet acknowledged
+        self._taken = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def put(self, topic, payload, qos, retain):
+        """
+        Buffers a message
+        """
+        with self._lock:
+            self.buffered += 1
+            if self.policy == POLICY_LATEST:
+                if topic in self._messages:
+                    # Keep its place in the replay order
+                    self.replaced += 1
+                    self._messages[topic] = (topic, payload, qos, retain)
+                    return
+                self._messages[topic] = (topic, payload, qos, retain)
+                full = len(self._messages) > self.maxsize
+                if full:
+                    self._messages.popitem(last=False)
+            else:
+                self._messages.append((topic, payload, qos, retain))
+                full = len(self._messages) > self.maxsize
+                if full:
+                    self._messages.popleft()
+            if full:
+                self.dropped += 1
+
+    def take(self, count):
+        """
+        Removes and returns up to count messages, oldest first.
+        They are kept aside until acknowledged, rewind() puts them back.
+        """
+        messages = []
+        with self._lock:
+            while self._messages and len(messages) < count:
+                if self.policy == POLICY_LATEST:
+                    messages.append(self._messages.popitem(last=False)[1])
+                else:
+                    messages.append(self._messages.popleft())
+            self._taken.extend(messages)
+        return messages
+
+    def acknowledge(self):
+        """
+        Forgets the messages taken so far, they have been published
+        """
+        with self._lock:
+            self._taken = []
+
+    def rewind(self):
+        """
+        Puts the messages taken but not acknowledged back in front of the buffer
+        """
+        with self._lock:
+            taken, self._taken = self._taken, []
+            self._prepend(taken)
+
+    def requeue(self, messages):
+        """
+        Puts messages that could not be published back in front of the buffer,
+        together with the ones taken but not acknowledged
+        """
+        with self._lock:
+            taken, self._taken = self._taken, []
+            self._prepend(taken + list(messages))
+
+    def _prepend(self, messages):
+        if self.policy == POLICY_LATEST:
+            for message in reversed(messages):
+                topic = message[0]
+                if topic in self._messages:
+                    # A newer message of the same topic is already waiting
+                    self.replaced += 1
+                    continue
+                self._messages[topic] = message
+                self._messages.move_to_end(topic, last=False)
+            while len(self._messages) > self.maxsize:
+                self._messages.popitem(last=False)
+                self.dropped += 1
+        else:
+            self._messages.extendleft(reversed(messages))
+            while len(self._messages) > self.maxsize:
+                self._messages.popleft()
+                self.dropped += 1
+
+    def close(self):
+        """
+        Nothing to do, buffered messages are lost on exit
+        """
+        pass
+
+    def stats(self):
+        return {
+            'size': len(self._messages),
+            'buffered': self.buffered,
+            'replaced': self.replaced,
+            'dropped': self.dropped,
+        }
@@ -23,6 +23,9 @@ __contact__ = "xose.perez@gmail.com"
 __copyright__ = "Copyright (C) Xose Pérez"
 __license__ = 'GPL v3'
 
+import time
+import logging
+
 from .filters import FilterFactory
 
 class Processor(object):
@@ -30,33 +33,137 @@ class Processor(object):
     Processes values using the appropriate filter strategy
     """
 
+    logger = None
+
+    # Optional Metrics, the time spent in the filters is recorded,
+    # by topic when metrics_by_topic is set (one histogram per topic)
+    metrics = None
+    metrics_by_topic = False
+
     _filters = {}
 
-    def __init__(self, filters):
+    def __init__(self, filters, logger=None):
         """
         Constructor, loads the strategy mappings
         """
-        self._filters = filters
+        self.logger = logger
+        self.load(filters)
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    def load(self, filters):
+        """
+        Compiles the strategy mappings into ready-to-use filter pipelines,
+        one per topic. Invalid filter definitions are reported here, once,
+        and left out of the pipeline.
+        """
+        pipelines = {}
+        for topic, config in (filters or {}).items():
+            pipeline = self.compile(topic, config)
+            if pipeline:
+                pipelines[topic] = pipeline
+        self._filters = pipelines
+
+    def compile(self, topic, config):
+        """
+        Instantiates, configures and validates the filters defined for a topic
+        and returns the list of filters to apply in order
+        """
+        if not isinstance(config, list):
+            config = [config]
+
+        pipeline = []
+        for element in config:
+            try:
+                type = element.get('type', None)
+                parameters = element.get('parameters', None)
+            except AttributeError:
+                self.log(logging.WARNING, "Invalid filter definition for topic %s: %s", topic, element)
+                continue
+            filter = FilterFactory(type)
+            if filter is None:
+                self.log(logging.WARNING, "Unknown filter type '%s' for topic %s", type, topic)
+                continue
+            filter.configure(parameters)
+            if not filter.validate():
+                self.log(logging.WARNING,
+                    "Invalid parameters for filter '%s' on topic %s, required: %s", type, topic, filter.required
+                )
+                continue
+            try:
+                filter.prepare()
+            except Exception as e:
+                self.log(logging.WARNING, "Invalid filter '%s' for topic %s (%s)", type, topic, e)
+                continue
+            pipeline.append(filter)
+
+        return pipeline
 
     def process(self, topic, value):
         """
-        Gets the filter strategy for the given topic,
-        instantiates a filter for that strategy using the FilterFactory and
-        requests the filter to process the input value
+        Runs the input value through the filter pipeline compiled for the given topic.
+        Returns None if a filter dropped the value.
         """
+        pipeline = self._filters.get(topic, None)
+        if pipeline:
+            start = time.perf_counter() if self.metrics is not None else None
+            try:
+                for filter in pipeline:
+                    value = filter.process(value)
+                    if value is None:
+                        break
+            except:
+                pass
+            if start is not None:
+                self.metrics.observe(
+                    'filter_seconds', time.perf_counter() - start, {'topic': topic} if self.metrics_by_topic else None
+                )
 
-        try:
-            config = self._filters[topic]
-            if not isinstance(config, list):
-                config = [config]
-            for element in config:
-                filter = FilterFactory(element.get('type', None))
-                if (filter):
-                    filter.configure(element.get('parameters', None))
-                    if filter.validate():
-                        value = filter.process(value)
+        return value
+
+    def process_batch(self, topic, values):
+        """
+        Runs a list of values for the same topic through the topic pipeline,
+        each filter handling the whole list at once. If a filter fails on the
+        batch the values are processed one by one, so each of them ends up
+        exactly as process() would have left it. Pipelines with stateful filters
+        are always processed one value at a time.
+        """
+        values = list(values)
+        pipeline = self._filters.get(topic, None)
+        if not pipeline or not values:
+            return values
+        if [filter for filter in pipeline if filter.stateful]:
+            return [self.process(topic, value) for value in values]
 
+        processed = values
+        try:
+            for filter in pipeline:
+                processed = filter.process_batch(processed)
         except:
-            pass
+            processed = [self.process(topic, value) for value in values]
 
-        return value
+        return processed
+
+    def process_many(self, messages):
+        """
+        Processes a list of (topic, value) tuples, batching the values by topic.
+        Returns the list of (topic, processed value) tuples in the original order.
+        """
+        messages = list(messages)
+        batches = {}
+        for index, (topic, value) in enumerate(messages):
+            batch = batches.get(topic, None)
+            if batch is None:
+                batch = batches[topic] = ([], [])
+            batch[0].append(index)
+            batch[1].append(value)
+
+        results = [None] * len(messages)
+        for topic, (indexes, values) in batches.items():
+            for index, value in zip(indexes, self.process_batch(topic, values)):
+                results[index] = (topic, value)
+
+        return results
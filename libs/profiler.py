@@ -0,0 +1,187 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import os
+import sys
+import math
+import time
+import logging
+import threading
+
+class StackSampler(object):
+    """
+    Statistical profiler: a background thread takes the stacks of all the
+    other threads every interval seconds and counts them, to be written in
+    the collapsed stack format of flame graph tools.
+    """
+
+    interval = 0.005
+
+    def __init__(self, interval=None):
+        """
+        Constructor
+        """
+        if interval is not None:
+            self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self.run, name='sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        names = {}
+        own = threading.get_ident()
+        while self._running:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.sample(names.get(ident, str(ident)), frame)
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def sample(self, name, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        stack.append(name)
+        key = ';'.join(reversed(stack))
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('%s %d\n' % (stack, count))
+
+class Profiler(object):
+    """
+    Runtime profiling of the live gateway for a limited time: the stacks of
+    every thread, the MQTT loop, the radio reader and the publisher worker
+    included, are sampled and written in the collapsed stack format.
+    """
+
+    duration = 60
+    # Longest profiling run accepted, in seconds
+    max_duration = 3600
+    interval = 0.005
+    directory = 'var/profiles'
+
+    logger = None
+
+    def __init__(self, directory=None):
+        """
+        Constructor
+        """
+        if directory is not None:
+            self.directory = directory
+        self._sampler = None
+        self._deadline = None
+        # Commands arrive on the MQTT thread, polls and signals on the main thread
+        self._lock = threading.Lock()
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    def running(self):
+        return self._sampler is not None
+
+    def start(self, duration=None, now=None):
+        """
+        Starts profiling for duration seconds (at most max_duration),
+        returns False if already running
+        """
+        duration = min(self.duration if duration is None else duration, self.max_duration)
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.running():
+                return False
+            self._sampler = StackSampler(self.interval)
+            self._sampler.start()
+            self._deadline = now + duration
+        self.log(logging.INFO, "Profiling for %s seconds", duration)
+        return True
+
+    def poll(self, now=None):
+        """
+        Stops profiling once the duration is over, returns the file written, if any
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            due = self.running() and now >= self._deadline
+        return self.stop() if due else None
+
+    def stop(self):
+        """
+        Stops profiling and writes the results, returns the file written
+        """
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+        if sampler is None:
+            return None
+        sampler.stop()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, 'profile-%s.collapsed' % time.strftime('%Y%m%d-%H%M%S'))
+        sampler.dump(path)
+        self.log(logging.INFO, "Profile written to %s", path)
+        return path
+
+    def command(self, message, now=None):
+        """
+        Handles a profiling command: 'stop', or the number of seconds
+        to start profiling for (i.e. '30'), empty for the default
+        """
+        if isinstance(message, bytes):
+            message = message.decode('utf-8', 'ignore')
+        message = message.strip()
+        if message == 'stop':
+            return self.stop()
+        duration = None
+        if message:
+            try:
+                duration = float(message)
+            except ValueError:
+                pass
+            if duration is None or not math.isfinite(duration) or duration <= 0:
+                self.log(logging.WARNING, "Invalid profiling command '%s'", message)
+                return None
+        self.start(duration, now)
+        return None
@@ -0,0 +1,170 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import time
+import logging
+import threading
+
+class PublishBatcher(object):
+    """
+    Collects outgoing messages and hands them over to the sender in batches,
+    once 'max_messages' are waiting or the oldest one has waited 'max_delay' seconds.
+    With 'coalesce' set only the latest message of each topic in a batch is sent.
+    """
+
+    max_messages = 50
+    max_delay = 0.05
+    coalesce = False
+
+    logger = None
+
+    def __init__(self, sender=None, max_messages=None, max_delay=None):
+        """
+        Constructor
+        """
+        self.sender = sender
+        if max_messages is not None:
+            self.max_messages = max_messages
+        if max_delay is not None:
+            self.max_delay = max_delay
+
+        self._batch = []
+        self._deadline = None
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = None
+        self._running = False
+
+        self.batches = 0
+        self.messages = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    def __len__(self):
+        return len(self._batch)
+
+    def add(self, topic, payload, qos, retain):
+        """
+        Queues a message, flushing the batch if it is full
+        """
+        with self._lock:
+            self._batch.append((topic, payload, qos, retain))
+            self.messages += 1
+            if len(self._batch) == 1:
+                self._deadline = time.time() + self.max_delay
+                self._wakeup.notify()
+            full = len(self._batch) >= self.max_messages
+        if full:
+            self.flush()
+
+    def take(self):
+        """
+        Returns the queued messages and starts a new batch
+        """
+        with self._lock:
+            batch = self._batch
+            self._batch = []
+            self._deadline = None
+        if self.coalesce and len(batch) > 1:
+            latest = {}
+            for index, message in enumerate(batch):
+                latest[message[0]] = index
+            coalesced = [message for index, message in enumerate(batch) if latest[message[0]] == index]
+            self.coalesced += len(batch) - len(coalesced)
+            batch = coalesced
+        return batch
+
+    def flush(self):
+        """
+        Sends the queued messages
+        """
+        # Batches are taken and sent under the same lock so they go out in order
+        with self._flushing:
+            batch = self.take()
+            if not batch:
+                return
+            self.batches += 1
+            try:
+                self.sender(batch)
+            except Exception as e:
+                self.errors += 1
+                self.log(logging.ERROR, "Error while publishing batch (%s)", e)
+
+    def start(self):
+        """
+        Starts the thread flushing batches on time
+        """
+        if self._worker is not None:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self.run, name='publish-batcher')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the flushing thread and sends whatever is queued
+        """
+        if self._worker is not None:
+            with self._lock:
+                self._running = False
+                self._wakeup.notify_all()
+            if self._worker is not threading.current_thread():
+                self._worker.join(timeout)
+            self._worker = None
+        self.flush()
+
+    def run(self):
+        """
+        Flushing loop, sends each batch when its oldest message is due
+        """
+        while True:
+            with self._lock:
+                while self._running:
+                    if self._deadline is not None:
+                        wait = self._deadline - time.time()
+                        if wait <= 0:
+                            break
+                        self._wakeup.wait(wait)
+                    else:
+                        self._wakeup.wait()
+                if not self._running:
+                    return
+            self.flush()
+
+    def stats(self):
+        return {
+            'queued': len(self._batch),
+            'batches': self.batches,
+            'messages': self.messages,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+        }
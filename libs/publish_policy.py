@@ -0,0 +1,225 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import time
+import logging
+import threading
+
+from libs.topic_trie import TopicTrie
+
+class PublishState(object):
+    """
+    Publishing state of a topic
+    """
+
+    __slots__ = ['policy', 'published', 'time', 'latest', 'pending', 'seen']
+
+    def __init__(self, policy, value, now):
+        self.policy = policy
+        self.published = value
+        self.time = now
+        self.latest = value
+        self.pending = False
+        self.seen = now
+
+    def publish(self, value, now):
+        self.published = value
+        self.latest = value
+        self.time = now
+        self.pending = False
+
+class PublishPolicy(object):
+    """
+    When to publish the values of a topic:
+
+        deadband            minimum absolute change
+        deadband_percent    minimum change relative to the last published value
+        on_change           only publish values different from the last published one
+        min_interval        minimum seconds between publications
+        max_interval        republish the latest value after this many silent seconds
+
+    When both deadbands are set a value has to exceed both of them.
+    Non numeric values fall back to on change comparison.
+    """
+
+    parameters = ['deadband', 'deadband_percent', 'on_change', 'min_interval', 'max_interval']
+
+    deadband = None
+    deadband_percent = None
+    on_change = False
+    min_interval = 0
+    max_interval = None
+
+    def configure(self, parameters):
+        """
+        Sets the policy parameters, returns the list of unknown ones
+        """
+        unknown = []
+        for key, value in (parameters or {}).items():
+            if key in self.parameters:
+                setattr(self, key, value)
+            else:
+                unknown.append(key)
+        return unknown
+
+    def filtering(self):
+        return self.deadband is not None or self.deadband_percent is not None or self.on_change
+
+    def changed(self, previous, value):
+        """
+        Whether the value is different enough from the previously published one
+        """
+        if not self.filtering():
+            return True
+        if self.deadband is None and self.deadband_percent is None:
+            return value != previous
+        try:
+            delta = abs(float(value) - float(previous))
+            if self.deadband is not None and delta < self.deadband:
+                return False
+            if self.deadband_percent is not None and delta < abs(float(previous)) * self.deadband_percent / 100.0:
+                return False
+            return delta > 0
+        except (TypeError, ValueError):
+            return value != previous
+
+class PublishPolicies(object):
+    """
+    Per topic publishing policies. Topics are MQTT topic filters,
+    so a policy may apply to many topics ('+' and '#' wildcards),
+    each topic keeping its own state.
+    """
+
+    # Seconds a topic keeps its state without receiving any value,
+    # then it is forgotten (and its heartbeats stop), 0 keeps them forever
+    idle_timeout = 86400
+
+    logger = None
+
+    def __init__(self, policies=None, logger=None):
+        """
+        Constructor
+        """
+        self.logger = logger
+        self.suppressed = 0
+        self.heartbeats = 0
+        self._states = {}
+        self._lock = threading.Lock()
+        self.load(policies)
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    def load(self, policies):
+        """
+        Builds the policies from their configuration, forgets any previous state
+        """
+        trie = TopicTrie()
+        for topic, parameters in (policies or {}).items():
+            policy = PublishPolicy()
+            try:
+                unknown = policy.configure(parameters)
+            except AttributeError:
+                self.log(logging.WARNING, "Invalid publish policy for topic %s: %s", topic, parameters)
+                continue
+            if unknown:
+                self.log(logging.WARNING, "Unknown publish policy parameters for topic %s: %s", topic, ', '.join(unknown))
+            trie.insert(topic, policy)
+        with self._lock:
+            self._policies = trie
+            self._states = {}
+
+    def __len__(self):
+        return len(self._policies)
+
+    def check(self, topic, value, now=None):
+        """
+        Returns True if the value has to be published now
+        """
+        if not len(self._policies):
+            return True
+        policy = self._policies.match(topic)
+        if policy is None:
+            return True
+        now = time.time() if now is None else now
+
+        with self._lock:
+            state = self._states.get(topic, None)
+            if state is None:
+                self._states[topic] = PublishState(policy, value, now)
+                return True
+            state.latest = value
+            state.seen = now
+            elapsed = now - state.time
+            if elapsed < policy.min_interval:
+                # Held back, published by tick() once the interval is over
+                state.pending = True
+                self.suppressed += 1
+                return False
+            if policy.changed(state.published, value) \
+                or (policy.max_interval is not None and elapsed >= policy.max_interval):
+                state.publish(value, now)
+                return True
+            state.pending = False
+            self.suppressed += 1
+            return False
+
+    def tick(self, now=None):
+        """
+        Returns the list of (topic, value) tuples due for publication: heartbeats of topics
+        silent for max_interval and changes held back by min_interval.
+        Forgets the topics idle for longer than idle_timeout.
+        """
+        if not len(self._policies):
+            return []
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            for topic, state in list(self._states.items()):
+                if self.idle_timeout and not state.pending and now - state.seen >= self.idle_timeout:
+                    del self._states[topic]
+                    continue
+                policy = state.policy
+                elapsed = now - state.time
+                if elapsed < policy.min_interval:
+                    continue
+                heartbeat = policy.max_interval is not None and elapsed >= policy.max_interval
+                if heartbeat or (state.pending and policy.changed(state.published, state.latest)):
+                    if heartbeat:
+                        self.heartbeats += 1
+                    due.append((topic, state.latest))
+                    state.publish(state.latest, now)
+                else:
+                    state.pending = False
+        return due
+
+    def stats(self):
+        return {
+            'topics': len(self._states),
+            'suppressed': self.suppressed,
+            'heartbeats': self.heartbeats,
+        }
@@ -0,0 +1,218 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import time
+import logging
+import threading
+from collections import deque
+
+# Overflow policies
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop-oldest'
+POLICY_DROP_NEWEST = 'drop-newest'
+
+class PublishQueue(object):
+    """
+    Bounded handoff queue between the radio reader thread and the publishing pipeline.
+    Calls are queued by the producer and executed in order by a dedicated worker thread.
+    """
+
+    policies = [POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST]
+
+    maxsize = 1000
+    policy = POLICY_DROP_OLDEST
+
+    # Seconds to wait for room when blocking, None waits forever.
+    # When the timeout expires the new item is dropped.
+    block_timeout = None
+
+    # Minimum seconds between overflow warnings
+    warning_interval = 60
+
+    logger = None
+
+    def __init__(self, maxsize=None, policy=None, block_timeout=None):
+        """
+        Constructor
+        """
+        if maxsize is not None:
+            self.maxsize = maxsize
+        if policy is not None:
+            if policy not in self.policies:
+                raise ValueError("Unknown queue policy '%s', valid values are %s" % (policy, self.policies))
+            self.policy = policy
+        if block_timeout is not None:
+            self.block_timeout = block_timeout
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._worker = None
+        self._running = False
+        self._last_warning = 0
+
+        self.enqueued = 0
+        self.processed = 0
+        self.errors = 0
+        self.high_watermark = 0
+        self.dropped = dict([(policy, 0) for policy in self.policies])
+
+    def log(self, level, message, *args):
+        if self.logger:
+            self.logger.log(level, message, *args)
+
+    def handler(self, callback):
+        """
+        Returns a function with the same signature as callback that queues the call
+        """
+        def enqueue(*args):
+            self.put(callback, *args)
+        return enqueue
+
+    def put(self, callback, *args):
+        """
+        Queues a call, applying the overflow policy if the queue is full.
+        Returns False if the call (or, for drop-oldest, the oldest one) was dropped.
+        """
+        accepted = True
+        with self._lock:
+            if len(self._queue) >= self.maxsize:
+                accepted = self._overflow()
+                if accepted is None:
+                    return False
+            self._queue.append((callback, args))
+            self.enqueued += 1
+            self.high_watermark = max(self.high_watermark, len(self._queue))
+            self._not_empty.notify()
+        return accepted
+
+    def _overflow(self):
+        """
+        Applies the overflow policy, must be called holding the lock.
+        Returns True if there is room for the new item without dropping anything,
+        False if an old item was dropped to make room and None if the new item must be dropped.
+        """
+        if self.policy == POLICY_BLOCK:
+            deadline = None if self.block_timeout is None else time.time() + self.block_timeout
+            while len(self._queue) >= self.maxsize and self._running:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._not_full.wait(remaining)
+            if len(self._queue) < self.maxsize:
+                return True
+            self._drop(POLICY_BLOCK)
+            return None
+
+        if self.policy == POLICY_DROP_OLDEST:
+            self._queue.popleft()
+            self._drop(POLICY_DROP_OLDEST)
+            return False
+
+        self._drop(POLICY_DROP_NEWEST)
+        return None
+
+    def _drop(self, policy):
+        """
+        Accounts for a dropped item, warning from time to time
+        """
+        self.dropped[policy] += 1
+        now = time.time()
+        if now - self._last_warning >= self.warning_interval:
+            self._last_warning = now
+            self.log(logging.WARNING,
+                "Publish queue full (%d items), %d messages dropped so far (policy: %s)", self.maxsize, self.dropped[policy], policy
+            )
+
+    def qsize(self):
+        """
+        Current number of queued items
+        """
+        return len(self._queue)
+
+    def stats(self):
+        """
+        Returns the queue counters
+        """
+        with self._lock:
+            return {
+                'size': len(self._queue),
+                'maxsize': self.maxsize,
+                'policy': self.policy,
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'errors': self.errors,
+                'high_watermark': self.high_watermark,
+                'dropped': dict(self.dropped),
+            }
+
+    def start(self):
+        """
+        Starts the worker thread
+        """
+        if self._worker is not None:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self.run, name='publish-queue')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the worker thread once the queued items have been processed
+        """
+        if self._worker is None:
+            return
+        with self._lock:
+            self._running = False
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        if self._worker is not threading.current_thread():
+            self._worker.join(timeout)
+        self._worker = None
+
+    def run(self):
+        """
+        Worker loop, executes queued calls in order
+        """
+        while True:
+            with self._lock:
+                while not self._queue and self._running:
+                    self._not_empty.wait()
+                if not self._queue:
+                    return
+                callback, args = self._queue.popleft()
+                self._not_full.notify()
+            error = None
+            try:
+                callback(*args)
+            except Exception as e:
+                error = e
+                self.log(logging.ERROR, "Error while processing queued message (%s)", e)
+            with self._lock:
+                if error is not None:
+                    self.errors += 1
+                self.processed += 1
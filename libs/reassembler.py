@@ -0,0 +1,123 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import time
+import threading
+
+class LineBuffer(object):
+    """
+    Pending bytes of a radio serial stream
+    """
+
+    __slots__ = ['data', 'scanned', 'last']
+
+    def __init__(self, now):
+        self.data = bytearray()
+        self.scanned = 0
+        self.last = now
+
+class LineReassembler(object):
+    """
+    Reassembles the text lines radios send through their serial port,
+    which may arrive split across several packets.
+    Only newly arrived bytes are scanned for line ends, lines longer than
+    max_line_length are split and partial lines are flushed (and their buffer
+    released) once the radio has been silent for idle_timeout seconds.
+    """
+
+    # Maximum bytes in a line, longer lines are split
+    max_line_length = 1024
+
+    # Seconds a partial line waits for more data before being flushed
+    idle_timeout = 60
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def decode(self, data):
+        return str(data, 'utf-8', 'ignore').rstrip()
+
+    def feed(self, address, data, now=None):
+        """
+        Appends data received from a radio, returns the list of completed lines
+        """
+        now = time.time() if now is None else now
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        lines = []
+        with self._lock:
+            buffer = self._buffers.get(address, None)
+            if buffer is None:
+                buffer = self._buffers[address] = LineBuffer(now)
+            buffer.last = now
+            pending = buffer.data
+            pending += data
+
+            start = 0
+            scan = buffer.scanned
+            limit = self.max_line_length
+            with memoryview(pending) as view:
+                while True:
+                    end = pending.find(b'\n', scan)
+                    if end == -1 or end - start > limit:
+                        if len(pending) - start <= limit:
+                            break
+                        # Line too long, split it
+                        end = start + limit
+                        lines.append(self.decode(view[start:end]))
+                        start = scan = end
+                        continue
+                    lines.append(self.decode(view[start:end]))
+                    start = scan = end + 1
+
+            if start:
+                del pending[:start]
+            buffer.scanned = len(pending)
+            if not pending:
+                del self._buffers[address]
+
+        return lines
+
+    def expire(self, now=None):
+        """
+        Flushes the partial lines of radios silent for more than idle_timeout seconds.
+        Returns a list of (address, line) tuples.
+        """
+        now = time.time() if now is None else now
+        lines = []
+        with self._lock:
+            for address, buffer in list(self._buffers.items()):
+                if buffer.last + self.idle_timeout <= now:
+                    del self._buffers[address]
+                    lines.append((address, self.decode(buffer.data)))
+        return lines
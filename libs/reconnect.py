@@ -0,0 +1,117 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import time
+import random
+
+class ReconnectSupervisor(object):
+    """
+    Decides when to try reconnecting to the broker after a connection loss:
+    exponential backoff from min_delay up to max_delay, each delay shortened by
+    a random amount of up to 'jitter' (a fraction) so gateways sharing a broker
+    do not reconnect in lockstep. Attempts are made by whoever drives the
+    network loop, through attempt(), never from within a paho callback.
+    """
+
+    min_delay = 1
+    max_delay = 120
+    factor = 2
+    jitter = 0.5
+
+    def __init__(self, random=random.random):
+        """
+        Constructor
+        """
+        self.random = random
+        self.attempts = 0
+        self.reconnects = 0
+        self.failures = 0
+        self._next = None
+
+    def delay(self, attempts):
+        """
+        Seconds to wait before the given attempt
+        """
+        delay = min(self.max_delay, self.min_delay * self.factor ** attempts)
+        return delay * (1 - self.jitter * self.random())
+
+    def disconnected(self, now=None):
+        """
+        Connection lost (or never established), schedules the next attempt
+        """
+        if self._next is None:
+            self.schedule(now)
+
+    def connected(self):
+        """
+        Connection established, resets the backoff
+        """
+        if self.attempts:
+            self.reconnects += 1
+        self.attempts = 0
+        self._next = None
+
+    def schedule(self, now=None):
+        now = time.time() if now is None else now
+        self._next = now + self.delay(self.attempts)
+        self.attempts += 1
+
+    def due(self, now=None):
+        """
+        Whether a reconnection attempt is due
+        """
+        now = time.time() if now is None else now
+        return self._next is not None and now >= self._next
+
+    def wait(self, now=None):
+        """
+        Seconds until the next attempt, None if none is scheduled
+        """
+        if self._next is None:
+            return None
+        now = time.time() if now is None else now
+        return max(0, self._next - now)
+
+    def attempt(self, connect, now=None):
+        """
+        Calls connect(), scheduling the next attempt if it raises.
+        Returns the exception raised, None on success.
+        """
+        self._next = None
+        try:
+            connect()
+        except Exception as e:
+            self.failures += 1
+            self.schedule(now)
+            return e
+        return None
+
+    def stats(self):
+        return {
+            'attempts': self.attempts,
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+        }
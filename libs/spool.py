@@ -0,0 +1,198 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import os
+import time
+import sqlite3
+import threading
+
+class MessageSpool(object):
+    """
+    Disk-backed FIFO of the messages published while the broker is unreachable,
+    stored in an SQLite database in WAL mode so they survive restarts.
+    Messages are read in order, in batches, and only deleted once acknowledged:
+    after a crash the replay resumes from the first unacknowledged message.
+    The oldest messages are dropped beyond max_messages or max_age seconds.
+    Same interface as OfflineBuffer.
+    """
+
+    # Maximum messages spooled, 0 for no limit
+    max_messages = 100000
+
+    # Maximum seconds a message is kept, 0 for no limit
+    max_age = 86400
+
+    # Seconds between expirations while messages are being spooled or replayed
+    expire_interval = 60
+
+    def __init__(self, path, max_messages=None, max_age=None):
+        """
+        Constructor, opens (or creates) the spool
+        """
+        if max_messages is not None:
+            self.max_messages = max_messages
+        if max_age is not None:
+            self.max_age = max_age
+        self.path = path
+        self.buffered = 0
+        self.dropped = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        # Id of the last message taken but not yet acknowledged, None when there is none
+        self._cursor = None
+        self._expired_at = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL, topic TEXT, payload BLOB, qos INTEGER, retain INTEGER)'
+        )
+        self._count = self._db.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def put(self, topic, payload, qos, retain, now=None):
+        """
+        Spools a message
+        """
+        now = time.time() if now is None else now
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO messages (time, topic, payload, qos, retain) VALUES (?, ?, ?, ?, ?)',
+                (now, topic, payload, qos, int(bool(retain)))
+            )
+            self._count += 1
+            self.buffered += 1
+            self._limit()
+        # Old messages also go away during an outage, not only when replaying
+        if now - self._expired_at >= self.expire_interval:
+            self.expire(now)
+
+    def requeue(self, messages, now=None):
+        """
+        Puts messages that could not be published back in front of the spool,
+        the ones taken but not acknowledged are taken again afterwards
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._cursor = None
+            first = self._db.execute('SELECT MIN(id) FROM messages').fetchone()[0]
+            first = 1 if first is None else first
+            for index, (topic, payload, qos, retain) in enumerate(messages):
+                if isinstance(payload, str):
+                    payload = payload.encode('utf-8')
+                self._db.execute(
+                    'INSERT INTO messages (id, time, topic, payload, qos, retain) VALUES (?, ?, ?, ?, ?, ?)',
+                    (first - len(messages) + index, now, topic, payload, qos, int(bool(retain)))
+                )
+                self._count += 1
+            self._limit()
+
+    def _limit(self):
+        if self.max_messages and self._count > self.max_messages:
+            self.dropped += self._delete(
+                'id IN (SELECT id FROM messages ORDER BY id LIMIT ?)', self._count - self.max_messages
+            )
+
+    def _delete(self, where, *args):
+        deleted = self._db.execute('DELETE FROM messages WHERE ' + where, args).rowcount
+        self._count -= deleted
+        return deleted
+
+    def _after(self):
+        """
+        Condition selecting the messages not taken yet
+        """
+        if self._cursor is None:
+            return '1', ()
+        return 'id > ?', (self._cursor,)
+
+    def expire(self, now=None):
+        """
+        Drops the messages older than max_age seconds
+        """
+        if not self.max_age:
+            return 0
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expired_at = now
+            after, args = self._after()
+            expired = self._delete('time < ? AND ' + after, now - self.max_age, *args)
+            self.expired += expired
+        return expired
+
+    def take(self, count, now=None):
+        """
+        Returns up to count messages after the ones already taken, oldest first
+        """
+        now = time.time() if now is None else now
+        if now - self._expired_at >= self.expire_interval:
+            self.expire(now)
+        with self._lock:
+            after, args = self._after()
+            rows = self._db.execute(
+                'SELECT id, topic, payload, qos, retain FROM messages WHERE ' + after + ' ORDER BY id LIMIT ?',
+                args + (count,)
+            ).fetchall()
+            if rows:
+                self._cursor = rows[-1][0]
+        return [(topic, bytes(payload), qos, bool(retain)) for _, topic, payload, qos, retain in rows]
+
+    def acknowledge(self):
+        """
+        Deletes the messages taken so far, they have been published
+        """
+        with self._lock:
+            if self._cursor is not None:
+                self._delete('id <= ?', self._cursor)
+                self._cursor = None
+
+    def rewind(self):
+        """
+        Takes again the messages taken but not acknowledged
+        """
+        with self._lock:
+            self._cursor = None
+
+    def stats(self):
+        return {
+            'size': self._count,
+            'buffered': self.buffered,
+            'dropped': self.dropped,
+            'expired': self.expired,
+        }
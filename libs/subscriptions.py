@@ -0,0 +1,182 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import threading
+
+# Subscription states as seen by the broker
+SUBSCRIBING = 1
+SUBSCRIBED = 2
+UNSUBSCRIBING = 3
+
+class SubscriptionRegistry(object):
+    """
+    Keeps the subscriptions the gateway wants (desired state) apart from the ones
+    requested to the broker (actual state) so only real changes are sent.
+    Changes are accumulated and flushed as batches, each batch being tracked
+    by its message id until the broker acknowledges it. Acknowledgements may arrive
+    (from the network thread) before the request is registered with sent(),
+    they are kept until then.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._desired = set()
+        self._actual = {}
+        self._changed = set()
+        self._pending = {}
+        self._early = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, topic):
+        return topic in self._desired
+
+    def __len__(self):
+        return len(self._desired)
+
+    def want(self, topics):
+        """
+        Adds topics to the desired subscriptions, returns the number of new ones
+        """
+        count = 0
+        with self._lock:
+            for topic in topics:
+                if topic not in self._desired:
+                    self._desired.add(topic)
+                    self._changed.add(topic)
+                    count += 1
+        return count
+
+    def unwant(self, topics):
+        """
+        Removes topics from the desired subscriptions, returns the number of removed ones
+        """
+        count = 0
+        with self._lock:
+            for topic in topics:
+                if topic in self._desired:
+                    self._desired.discard(topic)
+                    self._changed.add(topic)
+                    count += 1
+        return count
+
+    def changes(self):
+        """
+        Returns the lists of topics to subscribe to and to unsubscribe from
+        to bring the broker in line with the desired state, and marks them as in progress.
+        Each list must then be sent and registered with sent().
+        """
+        subscribe = []
+        unsubscribe = []
+        with self._lock:
+            for topic in self._changed:
+                state = self._actual.get(topic, (None, None))[0]
+                if topic in self._desired:
+                    if state is None or state == UNSUBSCRIBING:
+                        subscribe.append(topic)
+                        self._actual[topic] = (SUBSCRIBING, None)
+                elif state is not None and state != UNSUBSCRIBING:
+                    unsubscribe.append(topic)
+                    self._actual[topic] = (UNSUBSCRIBING, None)
+            self._changed = set()
+        return sorted(subscribe), sorted(unsubscribe)
+
+    def sent(self, mid, topics, success=True):
+        """
+        Registers the message id of a (un)subscription request.
+        If it could not be sent the topics go back to the change list.
+        """
+        with self._lock:
+            if not success:
+                for topic in topics:
+                    state = self._actual.get(topic, (None, None))[0]
+                    if state == SUBSCRIBING:
+                        del self._actual[topic]
+                    elif state == UNSUBSCRIBING:
+                        self._actual[topic] = (SUBSCRIBED, None)
+                    self._changed.add(topic)
+                return
+            for topic in topics:
+                state = self._actual.get(topic, (None, None))[0]
+                if state is not None:
+                    self._actual[topic] = (state, mid)
+            if mid in self._early:
+                self._acknowledge(mid, topics, self._early.pop(mid))
+            else:
+                self._pending[mid] = topics
+
+    def acknowledged(self, mid, granted=None):
+        """
+        Broker acknowledgement (SUBACK or UNSUBACK) of a request, forgets its message id.
+        Granted is the list of QoS levels of a SUBACK, 0x80 meaning refused.
+        Returns the list of topics of the request, None if the message id is not registered yet.
+        """
+        with self._lock:
+            topics = self._pending.pop(mid, None)
+            if topics is None:
+                self._early[mid] = granted
+                return None
+            self._acknowledge(mid, topics, granted)
+            return topics
+
+    def _acknowledge(self, mid, topics, granted):
+        for index, topic in enumerate(topics):
+            state, current = self._actual.get(topic, (None, None))
+            if current != mid:
+                # Superseded by a later request
+                continue
+            if state == SUBSCRIBING:
+                refused = granted is not None and index < len(granted) and granted[index] == 0x80
+                if refused:
+                    del self._actual[topic]
+                else:
+                    self._actual[topic] = (SUBSCRIBED, mid)
+            elif state == UNSUBSCRIBING:
+                del self._actual[topic]
+
+    def reset(self):
+        """
+        Forgets the broker state, i.e. after a reconnection, so every desired topic is requested again
+        """
+        with self._lock:
+            self._actual = {}
+            self._pending = {}
+            self._early = {}
+            self._changed = set(self._desired)
+
+    def subscribed(self):
+        """
+        Topics acknowledged by the broker
+        """
+        return sorted([topic for topic, (state, mid) in self._actual.items() if state == SUBSCRIBED])
+
+    def stats(self):
+        return {
+            'desired': len(self._desired),
+            'subscribed': len(self.subscribed()),
+            'pending': len(self._pending),
+        }
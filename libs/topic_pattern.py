@@ -0,0 +1,84 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+import re
+
+from parse import compile as parse_compile
+
+# Port prefixes and the {item} they expand to
+ITEMS = {
+    'adc-': 'analog',
+    'dio-': 'digital',
+    'pin-': 'config',
+}
+
+# Excess slashes removed from the resulting topics
+CLEANUP = re.compile('//+|/$')
+
+class TopicPattern(object):
+    """
+    Default topic pattern, analysed once.
+    Patterns holding an {item} placeholder expand adc/dio ports into
+    analog/digital/config items to keep compatibility with old topic schemas.
+    """
+
+    def __init__(self, pattern):
+        """
+        Constructor
+        """
+        self.pattern = pattern
+        self.has_item = '{item}' in pattern
+        self._parser = None
+
+    def format(self, address, port):
+        """
+        Returns the topic for a given radio address and port
+        """
+        if self.has_item:
+            item = ITEMS.get(port[:4], '')
+            if item:
+                port = 'pin-%s' % port[4:]
+            topic = self.pattern.format(address=address, port=port, item=item)
+        else:
+            topic = self.pattern.format(address=address, port=port)
+        return CLEANUP.sub('', topic).rstrip('/')
+
+    def topic_filter(self):
+        """
+        Returns the MQTT filter matching every topic of the pattern,
+        levels holding a placeholder becoming single level wildcards
+        """
+        levels = ['+' if '{' in level else level for level in self.pattern.split('/')]
+        return CLEANUP.sub('', '/'.join(levels)).rstrip('/')
+
+    def parse(self, topic):
+        """
+        Returns the named fields of a topic, None if it does not match the pattern
+        """
+        if self._parser is None:
+            self._parser = parse_compile(self.pattern)
+        result = self._parser.parse(topic)
+        return result.named if result is not None else None
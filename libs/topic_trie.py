@@ -0,0 +1,91 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+
+class TopicNode(object):
+
+    __slots__ = ['children', 'value', 'filled']
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+        self.filled = False
+
+class TopicTrie(object):
+    """
+    Prefix tree of MQTT topic filters, one level per node.
+    Filters may hold '+' (single level) and '#' (trailing, any number of levels) wildcards.
+    Matching a topic costs one lookup per level whatever the number of filters,
+    literal levels being preferred over '+' and '+' over '#'.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._root = TopicNode()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def insert(self, topic_filter, value):
+        """
+        Stores a value for a topic filter, replacing any previous one
+        """
+        node = self._root
+        for level in topic_filter.split('/'):
+            child = node.children.get(level, None)
+            if child is None:
+                child = node.children[level] = TopicNode()
+            node = child
+        if not node.filled:
+            self._count += 1
+        node.value = value
+        node.filled = True
+
+    def match(self, topic, default=None):
+        """
+        Returns the value of the most specific filter matching a topic
+        """
+        node = self._search(self._root, topic.split('/'), 0)
+        return node.value if node is not None else default
+
+    def _search(self, node, levels, index):
+        if index == len(levels):
+            if node.filled:
+                return node
+            wildcard = node.children.get('#', None)
+            return wildcard if wildcard is not None and wildcard.filled else None
+        for key in (levels[index], '+'):
+            child = node.children.get(key, None)
+            if child is not None:
+                found = self._search(child, levels, index + 1)
+                if found is not None:
+                    return found
+        wildcard = node.children.get('#', None)
+        if wildcard is not None and wildcard.filled:
+            return wildcard
+        return None
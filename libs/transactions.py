@@ -0,0 +1,198 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
+#   Xbee to MQTT gateway
+#   Copyright (C) 2012 by Xose Pérez
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+class Transaction(object):
+    """
+    A request sent to a radio and waiting for its response
+    """
+
+    __slots__ = ['frame_id', 'request', 'sent', 'deadline']
+
+    def __init__(self, frame_id, request, sent, deadline):
+        self.frame_id = frame_id
+        self.request = request
+        self.sent = sent
+        self.deadline = deadline
+
+class Latency(object):
+    """
+    Round-trip time statistics for a radio
+    """
+
+    __slots__ = ['count', 'total', 'min', 'max', 'last', 'timeouts']
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.timeouts = 0
+
+    def add(self, rtt):
+        self.count += 1
+        self.total += rtt
+        self.last = rtt
+        self.min = rtt if self.min is None else min(self.min, rtt)
+        self.max = rtt if self.max is None else max(self.max, rtt)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'last': self.last,
+            'timeouts': self.timeouts,
+        }
+
+class TransactionTable(object):
+    """
+    Frame id correlation table.
+    Allocates frame ids (1-255, recycled once their transaction is closed), keeps the
+    in-flight requests with their send time, enforces response timeouts and keeps
+    per radio round-trip statistics. Requests are expected to expose 'address',
+    'attempts' and 'callback' attributes.
+    Not thread safe, callers must serialize access.
+    """
+
+    # Seconds to wait for the response to the first attempt
+    timeout = 5
+
+    # Retries after a timeout, each one waiting 'backoff' times longer than the previous
+    retries = 2
+    backoff = 2
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._transactions = {}
+        self._count = {}
+        self._last_frame_id = 0
+        self._latency = {}
+
+    def __len__(self):
+        return len(self._transactions)
+
+    def __contains__(self, frame_id):
+        return frame_id in self._transactions
+
+    def count(self, address):
+        """
+        Number of in-flight requests for a given radio
+        """
+        return self._count.get(address, 0)
+
+    def allocate(self):
+        """
+        Returns a free frame id or None if all of them are in use.
+        Frame id 0 is never used as it disables the radio response.
+        """
+        for i in range(255):
+            frame_id = (self._last_frame_id + i) % 255 + 1
+            if frame_id not in self._transactions:
+                self._last_frame_id = frame_id
+                return frame_id
+        return None
+
+    def open(self, request, now):
+        """
+        Registers a request about to be sent, returns its frame id
+        or None if there are no free frame ids
+        """
+        frame_id = self.allocate()
+        if frame_id is None:
+            return None
+        request.attempts += 1
+        timeout = self.timeout * self.backoff ** (request.attempts - 1)
+        self._transactions[frame_id] = Transaction(frame_id, request, now, now + timeout)
+        self._count[request.address] = self._count.get(request.address, 0) + 1
+        return frame_id
+
+    def _remove(self, frame_id):
+        transaction = self._transactions.pop(frame_id, None)
+        if transaction is not None:
+            address = transaction.request.address
+            self._count[address] -= 1
+            if self._count[address] == 0:
+                del self._count[address]
+        return transaction
+
+    def close(self, frame_id, now):
+        """
+        Closes the transaction for a response, returns its request or None if the frame id is unknown
+        """
+        transaction = self._remove(frame_id)
+        if transaction is None:
+            return None
+        self.latency_for(transaction.request.address).add(now - transaction.sent)
+        return transaction.request
+
+    def cancel(self, frame_id):
+        """
+        Forgets a transaction without accounting for it, i.e. when the request could not be sent
+        """
+        transaction = self._remove(frame_id)
+        return transaction.request if transaction else None
+
+    def expire(self, now):
+        """
+        Closes the transactions whose response did not arrive in time.
+        Returns two lists of requests: those to be retried and those that failed.
+        """
+        retry = []
+        failed = []
+        for frame_id, transaction in list(self._transactions.items()):
+            if transaction.deadline > now:
+                continue
+            self._remove(frame_id)
+            request = transaction.request
+            self.latency_for(request.address).timeouts += 1
+            if request.attempts <= self.retries:
+                retry.append(request)
+            else:
+                failed.append(request)
+        return retry, failed
+
+    def next_deadline(self):
+        """
+        Earliest response deadline, None if nothing is in flight
+        """
+        if not self._transactions:
+            return None
+        return min([transaction.deadline for transaction in self._transactions.values()])
+
+    def latency_for(self, address):
+        latency = self._latency.get(address, None)
+        if latency is None:
+            latency = self._latency[address] = Latency()
+        return latency
+
+    def latency(self):
+        """
+        Returns the round-trip statistics by radio address
+        """
+        return dict([(address, latency.as_dict()) for address, latency in self._latency.items()])
@@ -29,7 +29,21 @@ import glob
 import time
 import binascii
 import logging
+import threading
 from xbee import ZigBee as XBee
+from xbee.frame import APIFrame
+
+from .reassembler import LineReassembler
+from .frame_parser import FrameParser, RX, RX_IO_DATA, NODE_ID, AT_RESPONSE, REMOTE_AT_RESPONSE
+
+# python-xbee names of the frame types decoded by the built-in parser
+FRAME_NAMES = {
+    RX: 'rx',
+    RX_IO_DATA: 'rx_io_data_long_addr',
+    NODE_ID: 'node_id_indicator',
+    AT_RESPONSE: 'at_response',
+    REMOTE_AT_RESPONSE: 'remote_at_response',
+}
 
 class XBeeWrapper(object):
     """
@@ -47,21 +61,59 @@ class XBeeWrapper(object):
     sample_rate = 0
     change_detection = False
 
+    # Hook for all the (port, value) tuples of a frame at once, called as
+    # on_frame(address, values, rssi) instead of on_message for each of them.
+    # Values not coming in frames (pin responses) still go to on_message.
+    on_frame = None
+
+    # Seconds to wait between consecutive remote queries
+    query_delay = 1
+
+    # When False no python-xbee reader thread is started
+    # and incoming data must be pushed through feed()
+    threaded = True
+
+    # When True incoming frames are decoded by the built-in FrameParser,
+    # reading from the serial port in bulk, instead of by python-xbee
+    native = False
+
+    # Remote AT command scheduler, when set queries are paced by it
+    # instead of sleeping query_delay seconds between commands
+    scheduler = None
+
+    # Optional Metrics, frames are counted by API id
+    metrics = None
+
+    _frame = None
+    _reader = None
+    _reading = False
+
     _change_detection_masks = {}
 
-    buffer = dict()
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.reassembler = LineReassembler()
+        self.parser = FrameParser()
 
     def errorlog(self, e):
         logging.exception(e)
 
-    def log(self, level, message):
+    def log(self, level, message, *args):
         if self.logger:
-            self.logger.log(level, message)
+            self.logger.log(level, message, *args)
 
     def disconnect(self):
         """
         Closes serial port
         """
+        if self.scheduler:
+            self.scheduler.stop()
+        if self._reader:
+            self._reading = False
+            self._reader.join()
+            self._reader = None
         self.xbee.halt()
         self.serial.close()
         return True
@@ -72,11 +124,79 @@ class XBeeWrapper(object):
         """
         try:
             self.log(logging.INFO, "Connecting to Xbee")
-            self.xbee = XBee(self.serial, callback=self.process, error_callback=self.errorlog, escaped=True)
+            if self.threaded and not self.native:
+                self.xbee = XBee(self.serial, callback=self.process, error_callback=self.errorlog, escaped=True)
+            else:
+                self.xbee = XBee(self.serial, escaped=True)
         except:
             return False
+        if self.threaded and self.native:
+            # Reads must time out from time to time so the reader can be stopped
+            if self.serial.timeout is None:
+                self.serial.timeout = 0.1
+            self._reading = True
+            self._reader = threading.Thread(target=self.read, name='xbee-reader')
+            self._reader.daemon = True
+            self._reader.start()
+        if self.scheduler:
+            self.scheduler.sender = self.send_command
+            self.scheduler.logger = self.logger
+            if self.threaded:
+                self.scheduler.start()
         return True
 
+    def read(self):
+        """
+        Reader thread loop for the built-in frame parser,
+        reads everything waiting in the serial port at once
+        """
+        while self._reading:
+            try:
+                data = self.serial.read(self.serial.in_waiting or 1)
+            except Exception as e:
+                self.errorlog(e)
+                time.sleep(1)
+                continue
+            if data:
+                self.feed(data)
+
+    def feed(self, data):
+        """
+        Processes raw bytes read from the serial port, used instead of
+        the python-xbee reader thread when not running threaded
+        or when using the built-in frame parser
+        """
+        if self.native:
+            for frame in self.parser.feed(data):
+                try:
+                    self.process_frame(frame)
+                except Exception as e:
+                    self.errorlog(e)
+            return
+
+        for byte in data:
+            byte = bytes([byte])
+            if self._frame is None:
+                if byte != APIFrame.START_BYTE:
+                    continue
+                self._frame = APIFrame(escaped=True)
+            self._frame.fill(byte)
+            if self._frame.remaining_bytes() > 0:
+                continue
+            frame, self._frame = self._frame, None
+            try:
+                frame.parse()
+                if len(frame.data) == 0:
+                    continue
+                packet = self.xbee._split_response(frame.data)
+            except Exception as e:
+                self.log(logging.DEBUG, "Discarding invalid frame (%s)", e)
+                continue
+            try:
+                self.process(packet)
+            except Exception as e:
+                self.errorlog(e)
+
     def process(self, packet):
         """
         Processes an incoming packet, supported packet frame ids:
@@ -87,7 +207,8 @@ class XBeeWrapper(object):
             0x97: ZigBee Remote Command Response (remote_at_response)
         """
 
-        self.log(logging.DEBUG, packet)
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s", packet)
 
         try:
             address = binascii.hexlify(packet['source_addr_long'])
@@ -97,59 +218,150 @@ class XBeeWrapper(object):
             pass
 
         id = packet.get('id', None)
+        if self.metrics is not None:
+            self.metrics.inc('frames', {'api_id': id})
 
         # Data sent through the serial connection of the remote radio
         if (id == "rx"):
 
             # Some streams arrive split in different packets
             # we buffer the data until we get an EOL
-            rf_data = packet['rf_data']
-            if isinstance(rf_data, bytes):
-                rf_data = rf_data.decode('utf-8', errors='ignore')
-            self.buffer[address] = self.buffer.get(address,'') + rf_data
-            count = self.buffer[address].count('\n')
-            if (count):
-                lines = self.buffer[address].splitlines()
-                try:
-                    self.buffer[address] = lines[count:][0]
-                except:
-                    self.buffer[address] = ''
-                for line in lines[:count]:
-                    line = line.rstrip()
-                    try:
-                        port, value = line.split(':', 1)
-                    except:
-                        value = line
-                        port = self.default_port_name
-                    self.on_message(address, port, value)
+            self.process_lines(address, self.reassembler.feed(address, packet['rf_data']), self.rssi(packet))
 
         # Data received from an IO data sample
         elif (id == "rx_io_data_long_addr"):
-            for sample in packet['samples']:
-                for port, value in sample.items():
-                    if port[:4] == 'dio-':
-                        value = 1 if value else 0
-                    self.on_message(address, port, value)
+            self.process_samples(
+                address, [item for sample in packet['samples'] for item in sample.items()], self.rssi(packet)
+            )
 
         # Node Identification Indicator received
         elif (id == "node_id_indicator"):
             alias = packet.get('node_id', None)
+            if isinstance(alias, bytes):
+                alias = alias.decode('utf-8', errors='ignore')
             self.on_identification(address, alias)
 
         # Response received after a local command request
         elif (id == "at_response"):
-            status = packet.get('status', None)
-            command = packet.get('command', None)
+            status = self.decode(packet.get('status', None))
+            command = self.decode(packet.get('command', None))
             response = packet.get('parameter', None)
             self.on_response(status, command, response, "local")
 
         # Response received after a remote command request
         elif (id == "remote_at_response"):
-            status = packet.get('status', None)
-            command = packet.get('command', None)
+            status = self.decode(packet.get('status', None))
+            command = self.decode(packet.get('command', None))
             response = packet.get('parameter', None)
+            if self.scheduler:
+                self.scheduler.response(packet.get('frame_id', None), status, response)
+            self.on_response(status, command, response, address)
+
+    def process_frame(self, frame):
+        """
+        Processes a frame decoded by the built-in FrameParser,
+        supports the same frame types as process()
+        """
+
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s", frame)
+
+        type = frame[0]
+        if self.metrics is not None:
+            self.metrics.inc('frames', {'api_id': FRAME_NAMES.get(type, type)})
+
+        if (type == RX):
+            address = self.hexlify(frame[1])
+            self.process_lines(address, self.reassembler.feed(address, frame[2]))
+
+        elif (type == RX_IO_DATA):
+            self.process_samples(self.hexlify(frame[1]), frame[2])
+
+        elif (type == NODE_ID):
+            self.on_identification(self.hexlify(frame[1]), frame[2].decode('utf-8', errors='ignore'))
+
+        elif (type == AT_RESPONSE):
+            frame_id, command, status, response = frame[1:]
+            self.on_response(status, command, response, "local")
+
+        elif (type == REMOTE_AT_RESPONSE):
+            frame_id, address, command, status, response = frame[1:]
+            address = self.hexlify(address)
+            if self.scheduler:
+                self.scheduler.response(frame_id, status, response)
             self.on_response(status, command, response, address)
 
+    def process_samples(self, address, samples, rssi=None):
+        """
+        Processes the (port, value) tuples of an IO data sample
+        """
+        values = []
+        for port, value in samples:
+            if port[:4] == 'dio-':
+                value = 1 if value else 0
+            values.append((port, value))
+        self.dispatch(address, values, rssi)
+
+    def dispatch(self, address, values, rssi=None):
+        """
+        Hands the (port, value) tuples received in a frame to on_frame all together
+        or, when it is not set, to on_message one by one
+        """
+        if self.on_frame is not None:
+            if values:
+                self.on_frame(address, values, rssi)
+            return
+        for port, value in values:
+            self.on_message(address, port, value)
+
+    def rssi(self, packet):
+        """
+        Received signal strength in dBm of the frames that report it, None otherwise
+        """
+        rssi = packet.get('rssi', None)
+        if isinstance(rssi, bytes):
+            rssi = -rssi[0] if rssi else None
+        return rssi
+
+    def hexlify(self, address):
+        return binascii.hexlify(address).decode('ascii')
+
+    def process_line(self, address, line):
+        """
+        Processes a text line received through the serial port of a remote radio,
+        lines are either "port:value" or just a value for the default port
+        """
+        self.process_lines(address, [line])
+
+    def process_lines(self, address, lines, rssi=None):
+        """
+        Processes the text lines completed by a frame
+        """
+        values = []
+        for line in lines:
+            try:
+                port, value = line.split(':', 1)
+            except:
+                value = line
+                port = self.default_port_name
+            values.append((port, value))
+        self.dispatch(address, values, rssi)
+
+    def housekeeping(self, now = None):
+        """
+        Periodic maintenance, flushes partial serial lines of radios that went silent
+        """
+        for address, line in self.reassembler.expire(now):
+            self.process_lines(address, [line])
+
+    def decode(self, value):
+        """
+        Decodes status and command fields, python-xbee returns them as bytes
+        """
+        if isinstance(value, bytes):
+            value = value.decode('latin-1')
+        return value
+
     def on_identification(self, address, alias):
         """
         Hook for node identification message.
@@ -180,7 +392,7 @@ class XBeeWrapper(object):
             status_msg = "Unknown"
 
         self.log(logging.INFO,
-            "AT response for command: %s, status: %s" % (command, status_msg)
+            "AT response for command: %s, status: %s", command, status_msg
         )
 
         if (status != '\x00'):
@@ -195,13 +407,13 @@ class XBeeWrapper(object):
             if isinstance(address, bytes):
                 address = address.decode('ascii')
 
-            self.log(logging.DEBUG, "Setting IO Sample Rate to %s seconds for address %s" % (self.sample_rate, address))
+            self.log(logging.DEBUG, "Setting IO Sample Rate to %s seconds for address %s", self.sample_rate, address)
 
             milliseconds = str(hex(self.sample_rate * 1000))[2:]
             milliseconds = '0' * (len(milliseconds) % 2) + milliseconds
             milliseconds = binascii.unhexlify(milliseconds)
             source_addr_long = response['source_addr_long']
-            self.xbee.remote_at(dest_addr_long = source_addr_long, command = 'IR', parameter = milliseconds)
+            self.remote_at(source_addr_long, 'IR', milliseconds)
 
             self.on_node_discovery(address, alias)
 
@@ -210,24 +422,29 @@ class XBeeWrapper(object):
             current_mask = int(binascii.hexlify(response), 16)
             new_mask = self._change_detection_masks.get(address, current_mask)
             if self.change_detection and current_mask != new_mask:
-                self.log(logging.DEBUG,
-                     "Applying new IC mask to address: %s, value: %s" % (address, '{:012b}'.format(new_mask))
-                )
+                if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Applying new IC mask to address: %s, value: %s", address, '{:012b}'.format(new_mask))
                 new_mask = str(hex(new_mask))[2:]
                 new_mask = '0' * (len(new_mask) % 2) + new_mask
                 new_mask = binascii.unhexlify(new_mask)
                 source_addr_long = binascii.unhexlify(address)
-                self.xbee.remote_at(dest_addr_long = source_addr_long, command = 'IC', parameter = new_mask)
-                self.xbee.remote_at(dest_addr_long = source_addr_long, command = 'WR')
+                self.remote_at(source_addr_long, 'IC', new_mask)
+                self.remote_at(source_addr_long, 'WR')
 
-        # Process retrieved pin status
+        # Process retrieved pin status, replies to pin changes carry no value
         elif (re.match(r'[DP]\d', command)):
-            prefix, number = command[:1], command[1:]
-            port = 'pin-1%s' % number if (prefix == 'P') else 'pin-%s' % number
-            value = int(binascii.hexlify(response), 16)
-            self.on_message(address, port, value)
+            if response:
+                prefix, number = command[:1], command[1:]
+                port = 'pin-1%s' % number if (prefix == 'P') else 'pin-%s' % number
+                value = int(binascii.hexlify(response), 16)
+                self.on_message(address, port, value)
+
+        # Acknowledgements of configuration changes
+        elif (command in ['IR', 'WR', 'AC']):
+            pass
+
         else:
-            self.log(logging.WARNING, "Command response (%s) not implemented." % command)
+            self.log(logging.WARNING, "Command response (%s) not implemented.", command)
 
     def on_message(self, address, port, value):
         """
@@ -245,9 +462,10 @@ class XBeeWrapper(object):
         if not isinstance(ports, list):
             ports = [ports]
 
-        self.log(logging.INFO, "Request configuration for %s at %s" % (ports, address))
+        self.log(logging.INFO, "Request configuration for %s at %s", ports, address)
         address = binascii.unhexlify(address)
 
+        commands = []
         for port in ports:
 
             if port[:4] not in [ 'adc-', 'dio-', 'pin-' ]:
@@ -256,8 +474,43 @@ class XBeeWrapper(object):
             number = int(port[4:])
 
             command = 'P%d' % (number - 10) if number>9 else 'D%d' % number
-            self.xbee.remote_at(dest_addr_long = address, command = command, frame_id="A")
-            time.sleep(1)
+            commands.append({'dest_addr_long': address, 'command': command, 'frame_id': b'A'})
+
+        self.send_commands(commands)
+
+    def send_commands(self, commands):
+        """
+        Sends a list of remote AT commands. If there is a scheduler they are queued there,
+        otherwise they are sent waiting query_delay seconds after each one
+        """
+        if self.scheduler:
+            for command in commands:
+                self.scheduler.submit(command['dest_addr_long'], command['command'], command.get('parameter', None))
+            return
+
+        for command in commands:
+            self.send_command(command)
+            time.sleep(self.query_delay)
+
+    def send_command(self, command):
+        """
+        Sends a remote AT command given as a dictionary of remote_at arguments
+        """
+        self.xbee.remote_at(**command)
+
+    def remote_at(self, address, command, parameter = None):
+        """
+        Sends a remote AT command to a radio given its raw 64-bit address.
+        Goes through the scheduler if there is one, so the response is correlated and
+        the command retried if it times out, but it is not paced like queries are.
+        """
+        if self.scheduler:
+            self.scheduler.submit(address, command, parameter, paced=False, coalesce=False)
+            return
+        arguments = {'dest_addr_long': address, 'command': command, 'frame_id': b'A'}
+        if parameter is not None:
+            arguments['parameter'] = parameter
+        self.send_command(arguments)
 
     def send_message(self, address, port, value, permanent = True):
         """
@@ -266,7 +519,7 @@ class XBeeWrapper(object):
         and setting a raw configuration for any pin of remote radio.
         """
         self.log(logging.DEBUG,
-            "Sending message to address: %s, port: %s, value: %s" % (address, port, value)
+            "Sending message to address: %s, port: %s, value: %s", address, port, value
         )
 
         try:
@@ -278,9 +531,9 @@ class XBeeWrapper(object):
                 command = 'P%d' % (number - 10) if number>9 else 'D%d' % number
                 value = int(value) % 10 if prefix == 'pin-' else (int(value) > 0) + 4
                 value = binascii.unhexlify('0' + str(value))
-                self.xbee.remote_at(dest_addr_long = address, command = command, parameter = value)
-                self.xbee.remote_at(dest_addr_long = address, command = 'WR' if permanent else 'AC')
-                self.xbee.remote_at(dest_addr_long = address, command = command, frame_id = 'A')
+                self.remote_at(address, command, value)
+                self.remote_at(address, 'WR' if permanent else 'AC')
+                self.remote_at(address, command)
                 if self.change_detection:
                     address = binascii.hexlify(address)
                     if isinstance(address, bytes):
@@ -298,7 +551,7 @@ class XBeeWrapper(object):
         Sends IC command to check the response and change if it differs
         """
         self.log(logging.DEBUG,
-            "Sending IC command to address: %s, port: %s, enabled: %s" % (address, port, enabled)
+            "Sending IC command to address: %s, port: %s, enabled: %s", address, port, enabled
         )
         offset = int(port[4:]) % 12
         mask = int(self._change_detection_masks.get(address, 0))
@@ -308,7 +561,7 @@ class XBeeWrapper(object):
             self._change_detection_masks[address] = mask & ~(1 << offset)
 
         address = binascii.unhexlify(address)
-        self.xbee.remote_at(dest_addr_long = address, command = 'IC', frame_id = 'A')
+        self.remote_at(address, 'IC')
 
     def find_devices(self, vendor_id = None, product_id = None):
         """
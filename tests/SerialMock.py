@@ -23,6 +23,7 @@ __contact__ = "xose.perez@gmail.com"
 __copyright__ = "Copyright (C) Xose Pérez"
 __license__ = 'GPL v3'
 
+import time
 import binascii
 
 class Serial(object):
@@ -33,6 +34,7 @@ class Serial(object):
     stream = b''
     length = 0
     index = 0
+    timeout = None
 
     data = b''
 
@@ -65,14 +67,19 @@ class Serial(object):
         """
         return self.length - self.index
 
-    def read(self):
+    @property
+    def in_waiting(self):
+        return self.inWaiting()
+
+    def read(self, size=1):
         """
-        Feeds incoming bytes to the consumer
+        Feeds up to size incoming bytes to the consumer,
+        waits for the timeout if there is nothing to read
         """
-        response = None
-        if self.inWaiting() > 0:
-            response = self.stream[self.index]
-            self.index += 1
+        response = self.stream[self.index:self.index + size]
+        self.index += len(response)
+        if not response and self.timeout:
+            time.sleep(self.timeout)
         return response
 
     def write(self, message):
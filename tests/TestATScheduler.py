@@ -0,0 +1,131 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.at_scheduler import ATScheduler
+
+ADDRESS_1 = b'\x00\x13\xa2\x00\x40\x40\x11\x22'
+ADDRESS_2 = b'\x00\x13\xa2\x00\x40\x6b\xfd\x09'
+
+class TestATScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.scheduler = ATScheduler(self.sent.append)
+        self.scheduler.interval = 1
+        self.scheduler.max_in_flight = 1
+        self.scheduler.response_timeout = 5
+
+    def test_pacing(self):
+        self.scheduler.submit(ADDRESS_1, 'D0')
+        self.scheduler.submit(ADDRESS_1, 'D1')
+        self.scheduler.submit(ADDRESS_2, 'D0')
+        self.scheduler.poll(100)
+        self.assertEqual([(ADDRESS_1, 'D0'), (ADDRESS_2, 'D0')], [(c['dest_addr_long'], c['command']) for c in self.sent])
+
+        # Response arrived but the interval has not elapsed yet
+        self.scheduler.response(self.sent[0]['frame_id'])
+        self.assertEqual(0.5, self.scheduler.poll(100.5))
+        self.assertEqual(2, len(self.sent))
+        self.scheduler.poll(101)
+        self.assertEqual('D1', self.sent[2]['command'])
+
+    def test_concurrency(self):
+        self.scheduler.submit(ADDRESS_1, 'D0')
+        self.scheduler.submit(ADDRESS_1, 'D1')
+        self.scheduler.poll(100)
+        self.scheduler.poll(102)
+        self.assertEqual(1, len(self.sent))
+        self.scheduler.response(self.sent[0]['frame_id'])
+        self.scheduler.poll(102)
+        self.assertEqual(2, len(self.sent))
+
+    def test_timeout(self):
+        responses = []
+        self.scheduler.transactions.retries = 0
+        self.scheduler.submit(ADDRESS_1, 'D0', callback=lambda request, status, parameter: responses.append(status))
+        self.scheduler.submit(ADDRESS_1, 'D1')
+        self.scheduler.poll(100)
+        self.scheduler.poll(105)
+        self.assertEqual([None], responses)
+        self.assertEqual(['D0', 'D1'], [c['command'] for c in self.sent])
+        self.assertEqual(1, self.scheduler.stats()['timeouts'])
+
+    def test_retries(self):
+        self.scheduler.transactions.retries = 1
+        self.scheduler.transactions.backoff = 2
+        self.scheduler.submit(ADDRESS_1, 'D0')
+        self.scheduler.submit(ADDRESS_1, 'D1')
+        self.scheduler.poll(100)
+        self.scheduler.poll(105)
+        # retried first, with a twice as long timeout
+        self.assertEqual(['D0', 'D0'], [c['command'] for c in self.sent])
+        self.assertNotEqual(self.sent[0]['frame_id'], self.sent[1]['frame_id'])
+        self.assertEqual(None, self.scheduler.response(self.sent[0]['frame_id']))
+        self.scheduler.poll(114)
+        self.assertEqual(2, len(self.sent))
+        self.scheduler.poll(115)
+        self.assertEqual(['D0', 'D0', 'D1'], [c['command'] for c in self.sent])
+        stats = self.scheduler.stats()
+        self.assertEqual(1, stats['retries'])
+        self.assertEqual(1, stats['timeouts'])
+
+    def test_unpaced(self):
+        self.scheduler.submit(ADDRESS_1, 'D0', b'\x05', paced=False, coalesce=False)
+        self.scheduler.submit(ADDRESS_1, 'WR', paced=False, coalesce=False)
+        self.scheduler.poll(100)
+        self.scheduler.response(self.sent[0]['frame_id'])
+        self.scheduler.poll(100.1)
+        self.assertEqual(['D0', 'WR'], [c['command'] for c in self.sent])
+        self.assertEqual(b'\x05', self.sent[0]['parameter'])
+
+    def test_unpaced_priority(self):
+        self.scheduler.submit(ADDRESS_1, 'D0')
+        self.scheduler.submit(ADDRESS_1, 'D1')
+        self.scheduler.submit(ADDRESS_1, 'D2')
+        self.scheduler.poll(100)
+        self.scheduler.submit(ADDRESS_1, 'D3', b'\x05', paced=False, coalesce=False)
+        self.scheduler.submit(ADDRESS_1, 'WR', paced=False, coalesce=False)
+        self.scheduler.response(self.sent[0]['frame_id'])
+        self.scheduler.poll(100.1)
+        self.scheduler.response(self.sent[1]['frame_id'])
+        self.scheduler.poll(100.2)
+        self.assertEqual(['D0', 'D3', 'WR'], [c['command'] for c in self.sent])
+
+    def test_latency(self):
+        self.scheduler.submit(ADDRESS_1, 'D0')
+        self.scheduler.poll()
+        self.scheduler.response(self.sent[0]['frame_id'])
+        latency = self.scheduler.latency()['0013a20040401122']
+        self.assertEqual(1, latency['count'])
+        self.assertTrue(latency['mean'] >= 0)
+
+    def test_coalescing(self):
+        self.assertTrue(self.scheduler.submit(ADDRESS_1, 'D0'))
+        self.assertFalse(self.scheduler.submit(ADDRESS_1, 'D0'))
+        self.assertTrue(self.scheduler.submit(ADDRESS_1, 'D0', b'\x05'))
+        self.assertEqual(2, self.scheduler.stats()['pending'])
+
+    def test_frame_ids(self):
+        self.scheduler.max_in_flight = 300
+        self.scheduler.max_total_in_flight = 300
+        self.scheduler.interval = 0
+        for number in range(256):
+            self.scheduler.submit(ADDRESS_1, 'D%d' % number)
+            self.scheduler.poll(100)
+        frame_ids = [c['frame_id'] for c in self.sent]
+        self.assertEqual(255, len(frame_ids))
+        self.assertEqual(255, len(set(frame_ids)))
+        self.assertNotIn(b'\x00', frame_ids)
+        self.scheduler.response(b'\x07', b'\x00')
+        self.scheduler.poll(100)
+        self.assertEqual(b'\x07', self.sent[-1]['frame_id'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import time
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from .SerialMock import Serial
+from libs.xbee_wrapper import XBeeWrapper
+from libs.async_engine import AsyncEngine
+
+class SocketSerial(object):
+    """
+    Serial port over one end of a socket pair, readable from an event loop
+    """
+
+    timeout = None
+    in_waiting = 0
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read(self, size=1):
+        try:
+            return self.sock.recv(size)
+        except BlockingIOError:
+            return b''
+
+    def write(self, data):
+        self.sock.sendall(data)
+
+    def close(self):
+        self.sock.close()
+
+class TestAsyncEngine(unittest.TestCase):
+
+    native = False
+
+    def setUp(self):
+        self.messages = []
+        self.radio, port = socket.socketpair()
+        self.xbee = XBeeWrapper()
+        self.xbee.native = self.native
+        self.xbee.serial = SocketSerial(port)
+        self.xbee.on_message = lambda address, port, value: self.messages.append((address, port, value))
+        self.engine = AsyncEngine()
+        self.engine.misc_interval = 0.01
+        self.engine.attach(mock.Mock(), self.xbee)
+        self.xbee.connect()
+        self.thread = threading.Thread(target=self.engine.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.engine.stop()
+        self.thread.join(2)
+        self.engine.loop.close()
+        self.radio.close()
+        self.xbee.serial.close()
+
+    def test_frame(self):
+        serial = Serial(None, None)
+        serial.feed('920013a200406bfd090123010110008010000B00')  # IO Sample DIO12:1, ADC7(Supply Voltage):2816
+        self.radio.sendall(serial.stream)
+        deadline = time.time() + 2
+        while len(self.messages) < 2 and time.time() < deadline:
+            time.sleep(.01)
+        self.assertEqual([('0013a200406bfd09', 'dio-12', 1), ('0013a200406bfd09', 'adc-7', 2816)], self.messages)
+        self.assertTrue(self.engine.mqtt.loop_misc.called)
+        self.engine.stop()
+        self.thread.join(2)
+        self.assertFalse(self.thread.is_alive())
+
+class TestAsyncEngineNative(TestAsyncEngine):
+
+    native = True
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.dedup import DuplicateFilter
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self):
+        self.filter = DuplicateFilter(5, 3)
+
+    def test_window(self):
+        self.assertFalse(self.filter.duplicate('/a', 1, 100))
+        self.assertTrue(self.filter.duplicate('/a', 1, 104.9))
+        self.assertFalse(self.filter.duplicate('/a', 2, 104.9))
+        self.assertFalse(self.filter.duplicate('/a', 2, 110))
+        self.assertEqual(1, self.filter.stats()['suppressed'])
+
+    def test_expire(self):
+        self.filter.duplicate('/a', 1, 100)
+        self.filter.duplicate('/b', 1, 103)
+        self.filter.expire(105)
+        self.assertEqual(2, len(self.filter))
+        self.filter.expire(107)
+        self.assertEqual(1, len(self.filter))
+        self.filter.expire(200)
+        self.assertEqual(0, len(self.filter))
+        self.assertEqual(2, self.filter.stats()['expired'])
+
+    def test_refresh(self):
+        self.filter.duplicate('/a', 1, 100)
+        self.filter.duplicate('/a', 2, 103)
+        self.filter.expire(107)
+        self.assertEqual(1, len(self.filter))
+        self.filter.expire(110)
+        self.assertEqual(0, len(self.filter))
+
+    def test_eviction(self):
+        for topic in ['/a', '/b', '/c']:
+            self.filter.duplicate(topic, 1, 100)
+        self.assertTrue(self.filter.duplicate('/a', 1, 100))
+        self.filter.duplicate('/d', 1, 100)
+        self.assertEqual(3, len(self.filter))
+        self.assertFalse(self.filter.duplicate('/b', 1, 100))
+        self.assertEqual(2, self.filter.stats()['evicted'])
+
+    def test_disabled(self):
+        self.filter.window = 0
+        self.assertFalse(self.filter.duplicate('/a', 1, 100))
+        self.assertFalse(self.filter.duplicate('/a', 1, 100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+import binascii
+
+from .SerialMock import Serial
+from libs.frame_parser import FrameParser, RX, RX_IO_DATA, NODE_ID, AT_RESPONSE, REMOTE_AT_RESPONSE
+
+ADDRESS = binascii.unhexlify('0013a20040401122')
+
+def frame(message):
+    serial = Serial(None, None)
+    serial.feed(message)
+    return serial.stream
+
+class TestFrameParser(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = FrameParser()
+
+    def test_rx(self):
+        self.assertEqual(
+            [(RX, ADDRESS, b'status:1\n')],
+            self.parser.feed(frame('900013a20040401122012340' + binascii.hexlify(b'status:1\n').decode()))
+        )
+
+    def test_io_data(self):
+        self.assertEqual(
+            [(RX_IO_DATA, binascii.unhexlify('0013a200406bfd09'), [('dio-12', True), ('adc-7', 2816)])],
+            self.parser.feed(frame('920013a200406bfd090123010110008010000B00'))
+        )
+
+    def test_split_and_noise(self):
+        data = b'\x00\x11' + frame('900013a20040401122012340' + binascii.hexlify(b'a\n').decode()) * 2
+        frames = []
+        for i in range(len(data)):
+            frames += self.parser.feed(data[i:i + 1])
+        self.assertEqual([(RX, ADDRESS, b'a\n')] * 2, frames)
+
+    def test_escaped(self):
+        # 0x7D, 0x7E, 0x11 and 0x13 are escaped in the data, length and checksum
+        data = frame('900013a20040401122012340' + binascii.hexlify(b'}~\x11\x13').decode())
+        escaped = bytearray(data[:1])
+        for byte in data[1:]:
+            if byte in (0x7D, 0x7E, 0x11, 0x13):
+                escaped += bytes([0x7D, byte ^ 0x20])
+            else:
+                escaped.append(byte)
+        self.assertEqual([(RX, ADDRESS, b'}~\x11\x13')], self.parser.feed(escaped[:20]) + self.parser.feed(escaped[20:]))
+
+    def test_checksum(self):
+        data = bytearray(frame('900013a20040401122012340' + binascii.hexlify(b'a\n').decode()))
+        data[-1] ^= 0xFF
+        self.assertEqual([], self.parser.feed(data))
+        self.assertEqual(1, self.parser.errors)
+        self.assertEqual(1, len(self.parser.feed(frame('900013a20040401122012340' + binascii.hexlify(b'a\n').decode()))))
+
+    def test_node_id(self):
+        self.assertEqual(
+            [(NODE_ID, binascii.unhexlify('0013a200406bfd09'), b'DOOR')],
+            self.parser.feed(frame('950013a20040401122fffe02fffe0013a200406bfd09' + binascii.hexlify(b'DOOR').decode() + '00fffe0101c105101e'))
+        )
+
+    def test_at_responses(self):
+        self.assertEqual(
+            [(REMOTE_AT_RESPONSE, 5, ADDRESS, 'D0', '\x00', b'\x03')],
+            self.parser.feed(frame('97050013a20040401122fffe44300003'))
+        )
+        frames = self.parser.feed(frame('8801' + binascii.hexlify(b'ND').decode() + '00' + 'fffe0013a200406bfd09' + binascii.hexlify(b'DOOR').decode() + '00fffe0100c105101e'))
+        self.assertEqual(1, len(frames))
+        self.assertEqual((AT_RESPONSE, 1, 'ND', '\x00'), frames[0][:4])
+        self.assertEqual(b'DOOR', frames[0][4]['node_identifier'])
+        self.assertEqual(binascii.unhexlify('0013a200406bfd09'), frames[0][4]['source_addr_long'])
+
+if __name__ == '__main__':
+    unittest.main()
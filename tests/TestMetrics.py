@@ -0,0 +1,75 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+from urllib.request import urlopen
+
+from libs.metrics import Histogram, Metrics, MetricsServer
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value / 1000.0)
+        self.assertEqual(1000, histogram.count)
+        for quantile in [0.5, 0.9, 0.99]:
+            self.assertAlmostEqual(quantile, histogram.percentile(quantile), delta=quantile * 0.04)
+        self.assertEqual(1.0, histogram.percentile(1))
+        self.assertEqual(0.0, Histogram().percentile(0.5))
+
+    def test_buckets(self):
+        histogram = Histogram()
+        for value in [0, 1, 63, 64, 65, 100, 1000, 123456789]:
+            index = histogram.index(value)
+            self.assertTrue(histogram.value(index) >= value)
+            self.assertEqual(index, histogram.index(histogram.value(index)))
+            self.assertTrue(histogram.value(index) <= value * 1.04 + 1)
+
+    def test_render(self):
+        self.metrics.describe('frames', 'API frames received')
+        self.metrics.inc('frames', {'api_id': 'rx'})
+        self.metrics.inc('frames', {'api_id': 'rx'})
+        self.metrics.inc('frames', {'api_id': 'at_response'})
+        self.metrics.observe('filter_seconds', 0.001, {'topic': '/a "b"'})
+        self.metrics.gauge('queue_depth', lambda: 5)
+        self.metrics.gauge('broken', lambda: 1 / 0)
+        text = self.metrics.render()
+        self.assertIn('# HELP xbee2mqtt_frames_total API frames received\n', text)
+        self.assertIn('# TYPE xbee2mqtt_frames_total counter\n', text)
+        self.assertIn('xbee2mqtt_frames_total{api_id="rx"} 2\n', text)
+        self.assertIn('xbee2mqtt_frames_total{api_id="at_response"} 1\n', text)
+        self.assertIn('xbee2mqtt_filter_seconds{topic="/a \\"b\\"",quantile="0.99"} 0.001\n', text)
+        self.assertIn('xbee2mqtt_filter_seconds_count{topic="/a \\"b\\""} 1\n', text)
+        self.assertIn('xbee2mqtt_queue_depth 5\n', text)
+        self.assertNotIn('broken', text)
+
+    def test_values(self):
+        self.metrics.inc('duplicates')
+        self.metrics.observe('latency_seconds', 0.002, {'stage': 'published'})
+        values = dict(self.metrics.values())
+        self.assertEqual(1, values['duplicates'])
+        self.assertEqual(0.002, values['latency_seconds/published/p50'])
+        self.assertEqual(0.002, values['latency_seconds/published/p999'])
+        self.assertEqual(1, values['latency_seconds/published/count'])
+
+    def test_server(self):
+        self.metrics.inc('published')
+        server = MetricsServer(self.metrics, '127.0.0.1', 0)
+        self.assertTrue(server.start())
+        try:
+            response = urlopen('http://127.0.0.1:%d/metrics' % server._server.server_address[1], timeout=5)
+            self.assertIn(b'xbee2mqtt_published_total 1', response.read())
+        finally:
+            server.stop()
+
+if __name__ == '__main__':
+    unittest.main()
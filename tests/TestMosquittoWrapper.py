@@ -0,0 +1,157 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+from unittest import mock
+
+from libs.mosquitto_wrapper import MosquittoWrapper, Mosquitto
+from libs.publish_batcher import PublishBatcher
+from libs.offline_buffer import OfflineBuffer
+
+class TestMosquittoWrapper(unittest.TestCase):
+
+    def setUp(self):
+        self.mqtt = MosquittoWrapper('test')
+        self.mqtt.connected = True
+        self.mqtt.subscribe_chunk_size = 2
+        self.mqtt.subscribe_qos = 1
+
+    def test_chunks(self):
+        with mock.patch.object(Mosquitto, 'subscribe', return_value=(0, 1)) as subscribe:
+            self.mqtt.subscribe(['/a/set', '/b/set', '/c/set'])
+            self.mqtt.subscribe(['/a/set'])
+        self.assertEqual(2, subscribe.call_count)
+        self.assertEqual([('/a/set', 1), ('/b/set', 1)], subscribe.call_args_list[0][0][1])
+        self.assertEqual([('/c/set', 1)], subscribe.call_args_list[1][0][1])
+
+    def test_unsubscribe(self):
+        with mock.patch.object(Mosquitto, 'subscribe', return_value=(0, 1)):
+            self.mqtt.subscribe(['/a/set', '/b/set'])
+        with mock.patch.object(Mosquitto, 'unsubscribe', return_value=(0, 2)) as unsubscribe:
+            self.mqtt.unsubscribe(['/b/set', '/c/set'])
+        unsubscribe.assert_called_once_with(self.mqtt, ['/b/set'])
+
+    def test_disconnected(self):
+        self.mqtt.connected = False
+        with mock.patch.object(Mosquitto, 'subscribe', return_value=(0, 1)) as subscribe:
+            self.mqtt.subscribe(['/a/set'])
+        self.assertEqual(0, subscribe.call_count)
+        self.assertIn('/a/set', self.mqtt.subscriptions)
+
+    def test_batch(self):
+        self.mqtt.batcher = PublishBatcher(self.mqtt.publish_batch, 2)
+        with mock.patch.object(Mosquitto, 'publish') as publish:
+            self.mqtt.publish('/a', 1)
+            self.assertEqual(0, publish.call_count)
+            self.mqtt.publish(b'/b', 2.5)
+        self.assertEqual([('/a', '1', 0, False), ('/b', '2.5', 0, False)], [call[0][1:] for call in publish.call_args_list])
+
+    def test_batch_write(self):
+        messages = [('/a', '1', 0, False), ('/b', '2', 0, False)]
+        with mock.patch.object(Mosquitto, 'publish') as publish, \
+                mock.patch.object(Mosquitto, 'want_write', return_value=True), \
+                mock.patch.object(Mosquitto, 'loop_write') as loop_write:
+            self.mqtt.publish_batch(messages)
+            self.assertEqual(1, loop_write.call_count)
+            # An event loop writes the packets itself
+            self.mqtt.on_socket_register_write = lambda *args: None
+            self.mqtt.publish_batch(messages)
+            self.assertEqual(1, loop_write.call_count)
+        self.assertEqual(4, publish.call_count)
+
+    def _publish(self, delivered=True):
+        """
+        Replacement for paho's publish, confirming each message right away when delivered
+        """
+        self.published = []
+        def publish(client, topic, payload, qos, retain):
+            self.published.append(payload)
+            info = mock.Mock(rc=0, mid=len(self.published))
+            if delivered:
+                self.mqtt._MosquittoWrapper__on_publish(client, None, info.mid)
+            return info
+        return mock.patch.object(Mosquitto, 'publish', side_effect=publish)
+
+    def test_offline(self):
+        self.mqtt.offline = OfflineBuffer(10, 'fifo')
+        self.mqtt.replay_rate = 2
+        self.mqtt.connected = False
+        with self._publish():
+            for value in range(3):
+                self.mqtt.publish('/a', value)
+            self.assertEqual([], self.published)
+            self.mqtt.connected = True
+            self.mqtt._replay_time = 100
+            self.mqtt.maintain(101)
+            # Not overtaken by newer messages while replaying
+            self.mqtt.publish('/a', 3)
+            self.mqtt.maintain(102)
+        self.assertEqual(['0', '1', '2', '3'], self.published)
+
+    def test_offline_replaying(self):
+        self.mqtt.offline = OfflineBuffer(10, 'fifo')
+        self.mqtt.replay_rate = 0
+        self.mqtt.offline.put('/a', '0', 0, False)
+        with self._publish() as publish:
+            replay = publish.side_effect
+            def publish_while_replaying(*args):
+                # Published from another thread once the buffer has been emptied
+                self.mqtt.publish('/a', 1)
+                return replay(*args)
+            publish.side_effect = publish_while_replaying
+            self.mqtt.maintain(100)
+            self.assertEqual(1, len(self.mqtt.offline))
+            publish.side_effect = replay
+            self.mqtt.maintain(101)
+        self.assertEqual(['0', '1'], self.published)
+
+    def test_offline_delivery(self):
+        self.mqtt.offline = OfflineBuffer(10, 'fifo')
+        self.mqtt.replay_rate = 0
+        for value in range(2):
+            self.mqtt.offline.put('/a', str(value), 1, False)
+        with self._publish(delivered=False):
+            self.mqtt.maintain(100)
+            self.mqtt.publish('/a', 2)
+            # Nothing else is replayed until the broker confirms the batch
+            self.mqtt.maintain(101)
+            self.assertEqual(['0', '1'], self.published)
+            self.mqtt._MosquittoWrapper__on_publish(self.mqtt, None, 1)
+            self.mqtt.maintain(102)
+            self.assertEqual(['0', '1'], self.published)
+            self.mqtt._MosquittoWrapper__on_publish(self.mqtt, None, 2)
+            self.mqtt.maintain(103)
+        self.assertEqual(['0', '1', '2'], self.published)
+
+    def test_offline_rewind(self):
+        self.mqtt.offline = OfflineBuffer(10, 'fifo')
+        self.mqtt.replay_rate = 0
+        self.mqtt.batcher = PublishBatcher(self.mqtt.publish_batch, 10)
+        self.mqtt.batcher.add('/b', '0', 1, False)
+        for value in range(2):
+            self.mqtt.offline.put('/a', str(value), 1, False)
+        with self._publish(delivered=False):
+            self.mqtt.maintain(100)
+            # Lost with the connection, the replayed batch and the batch waiting to be sent go back in order
+            self.mqtt._MosquittoWrapper__on_disconnect(self.mqtt, None, 1)
+            self.mqtt.publish('/c', 0)
+            self.mqtt.batcher.flush()
+            self.assertEqual(['/b', '/a', '/a', '/c'], [message[0] for message in self.mqtt.offline.take(10)])
+
+    def test_reconnect(self):
+        self.mqtt.connected = False
+        self.mqtt.reconnect_supervisor.jitter = 0
+        self.mqtt.reconnect_supervisor.disconnected(100)
+        with mock.patch.object(Mosquitto, 'reconnect', side_effect=OSError('refused')) as reconnect:
+            self.assertEqual(0.5, self.mqtt.maintain(100.5))
+            self.assertEqual(0, reconnect.call_count)
+            self.assertEqual(2, self.mqtt.maintain(101))
+            self.assertEqual(1, reconnect.call_count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.offline_buffer import OfflineBuffer
+from libs.reconnect import ReconnectSupervisor
+
+class TestOfflineBuffer(unittest.TestCase):
+
+    def test_latest(self):
+        buffer = OfflineBuffer(2, 'latest')
+        buffer.put('/a', '1', 0, False)
+        buffer.put('/b', '2', 0, False)
+        buffer.put('/a', '3', 0, False)
+        self.assertEqual([('/a', '3', 0, False), ('/b', '2', 0, False)], buffer.take(5))
+        buffer.put('/a', '1', 0, False)
+        buffer.put('/b', '2', 0, False)
+        buffer.put('/c', '3', 0, False)
+        self.assertEqual(['/b', '/c'], [message[0] for message in buffer.take(5)])
+        stats = buffer.stats()
+        self.assertEqual(1, stats['replaced'])
+        self.assertEqual(1, stats['dropped'])
+
+    def test_fifo(self):
+        buffer = OfflineBuffer(3, 'fifo')
+        for value in range(5):
+            buffer.put('/a', str(value), 0, False)
+        self.assertEqual(3, len(buffer))
+        self.assertEqual(['2', '3'], [message[1] for message in buffer.take(2)])
+        self.assertEqual(['4'], [message[1] for message in buffer.take(2)])
+        self.assertEqual(2, buffer.stats()['dropped'])
+
+    def test_rewind(self):
+        buffer = OfflineBuffer(3, 'latest')
+        buffer.put('/a', '1', 0, False)
+        buffer.put('/b', '2', 0, False)
+        buffer.take(2)
+        buffer.put('/a', '3', 0, False)
+        buffer.rewind()
+        # The newer message of /a replaces the one taken
+        self.assertEqual([('/b', '2', 0, False), ('/a', '3', 0, False)], buffer.take(5))
+        buffer.acknowledge()
+        buffer.rewind()
+        self.assertEqual(0, len(buffer))
+
+    def test_requeue(self):
+        buffer = OfflineBuffer(3, 'fifo')
+        buffer.put('/a', '1', 0, False)
+        buffer.put('/a', '2', 0, False)
+        buffer.take(1)
+        buffer.requeue([('/b', '1', 0, False), ('/b', '2', 0, False)])
+        # The message taken goes back too, and is the oldest one dropped
+        self.assertEqual([('/b', '1'), ('/b', '2'), ('/a', '2')], [message[:2] for message in buffer.take(5)])
+        self.assertEqual(1, buffer.stats()['dropped'])
+
+    def test_policy(self):
+        self.assertRaises(ValueError, OfflineBuffer, 10, 'newest')
+
+class TestReconnectSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = ReconnectSupervisor(random=lambda: 1.0)
+        self.supervisor.jitter = 0.5
+        self.supervisor.max_delay = 8
+
+    def _refuse(self):
+        raise OSError('refused')
+
+    def test_backoff(self):
+        self.assertEqual([0.5, 1, 2, 4, 4], [self.supervisor.delay(attempts) for attempts in range(5)])
+
+    def test_attempts(self):
+        self.supervisor.disconnected(100)
+        self.assertFalse(self.supervisor.due(100.4))
+        self.assertTrue(self.supervisor.due(100.5))
+        self.assertIsNotNone(self.supervisor.attempt(self._refuse, 100.5))
+        self.assertEqual(1, self.supervisor.wait(100.5))
+        self.assertIsNone(self.supervisor.attempt(lambda: None, 101.5))
+        self.assertIsNone(self.supervisor.wait(101.5))
+        self.supervisor.connected()
+        self.assertEqual(0, self.supervisor.attempts)
+        self.assertEqual(1, self.supervisor.stats()['reconnects'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ __license__ = 'GPL v3'
 import unittest
 
 from libs.processor import Processor
+from libs.metrics import Metrics
 
 class TestProcessor(unittest.TestCase):
 
@@ -22,6 +23,20 @@ class TestProcessor(unittest.TestCase):
         # 11 * 0.5 + 1 = 6.5, rounds to 6
         self.assertEqual(6, processor.process('/test/chained', '11'))
 
+    def test_metrics(self):
+        processor = Processor({
+            '/test/a': { 'type': 'round', 'parameters':{ 'decimals': 0}},
+            '/test/b': { 'type': 'round', 'parameters':{ 'decimals': 0}},
+        })
+        processor.metrics = Metrics()
+        processor.process('/test/a', '1.2')
+        processor.process('/test/b', '1.2')
+        # A single histogram unless asked for one per topic
+        self.assertEqual(2, dict(processor.metrics.values())['filter_seconds/count'])
+        processor.metrics_by_topic = True
+        processor.process('/test/a', '1.2')
+        self.assertEqual(1, dict(processor.metrics.values())['filter_seconds//test/a/count'])
+
     def test_unknown(self):
         processor = Processor({
             '/test/linear': { 'type': 'linear', 'parameters':{ 'slope': 2, 'offset': 1}},
@@ -30,6 +45,28 @@ class TestProcessor(unittest.TestCase):
         self.assertEqual('0', processor.process('/test/linear/1', '0'))
         self.assertEqual('10', processor.process('/test/linear/2', '10'))
 
+    def test_invalid_filters_skipped(self):
+        processor = Processor({
+            '/test/invalid': [
+                { 'type': 'linear', 'parameters':{ 'slope': 2}},
+                { 'type': 'unknown' },
+                { 'type': 'round', 'parameters':{ 'decimals': 0}},
+            ],
+        })
+        self.assertEqual(4, processor.process('/test/invalid', '3.7'))
+
+    def test_reload(self):
+        processor = Processor({
+            '/test/reload': { 'type': 'linear', 'parameters':{ 'slope': 2, 'offset': 0}},
+        })
+        self.assertEqual(20, processor.process('/test/reload', '10'))
+        processor.load({
+            '/test/reload': { 'type': 'linear', 'parameters':{ 'slope': 3, 'offset': 0}},
+        })
+        self.assertEqual(30, processor.process('/test/reload', '10'))
+        processor.load({})
+        self.assertEqual('10', processor.process('/test/reload', '10'))
+
     def test_round(self):
         processor = Processor({
             '/test/round/1': { 'type': 'round', 'parameters':{ 'decimals': 2}},
@@ -59,6 +96,15 @@ class TestProcessor(unittest.TestCase):
         self.assertEqual('off', processor.process('/test/enum', '0'))
         self.assertEqual('on', processor.process('/test/enum', '3'))
 
+    def test_enum_default(self):
+        processor = Processor({
+            '/test/enum/1': { 'type': 'enum', 'parameters':{ 'values': { 0: 'off', 1: 'on'}, 'default': 'unknown'}},
+            '/test/enum/2': { 'type': 'enum', 'parameters':{ 'values': { 0: 'off', 1: 'on'}}},
+        })
+        self.assertEqual('on', processor.process('/test/enum/1', 1))
+        self.assertEqual('unknown', processor.process('/test/enum/1', '3'))
+        self.assertEqual('3', processor.process('/test/enum/2', '3'))
+
     def test_step(self):
         processor = Processor({
             '/test/step': { 'type': 'step', 'parameters':{ 2: 1, 4: 2, 5: 3}},
@@ -68,6 +114,22 @@ class TestProcessor(unittest.TestCase):
         self.assertEqual(2, processor.process('/test/step', '3'))
         self.assertEqual(3, processor.process('/test/step', '10'))
 
+    def test_step_unsorted(self):
+        processor = Processor({
+            '/test/step': { 'type': 'step', 'parameters':{ 5: 'high', 2: 'low', 4: 'medium'}},
+        })
+        self.assertEqual('low', processor.process('/test/step', '1.5'))
+        self.assertEqual('medium', processor.process('/test/step', '3'))
+        self.assertEqual('high', processor.process('/test/step', '4.5'))
+        self.assertEqual('high', processor.process('/test/step', '10'))
+
+    def test_step_tied_thresholds(self):
+        processor = Processor({
+            '/test/step': { 'type': 'step', 'parameters':{ 2: 'low', '2': 1, 4: 'high'}},
+        })
+        self.assertEqual('low', processor.process('/test/step', '1'))
+        self.assertEqual('high', processor.process('/test/step', '3'))
+
     def test_boolean(self):
         processor = Processor({
             '/test/boolean': { 'type': 'boolean' },
@@ -92,11 +154,138 @@ class TestProcessor(unittest.TestCase):
         })
         self.assertEqual("Current power consumption: 200W", processor.process('/test/format1', '200'))
 
+    def test_format_timestamps(self):
+        processor = Processor({
+            '/test/format2': { 'type': 'format', 'parameters':{'format': '{date} {value:>4}'} }
+        })
+        date, value = processor.process('/test/format2', '20').split(' ', 1)
+        self.assertRegex(date, r'^\d{4}-\d{2}-\d{2}$')
+        self.assertEqual("  20", value)
+
     def test_regexp(self):
         processor = Processor({
             '/test/regexp1': { 'type': 'regexp', 'parameters':{'pattern': '(.*): (.*)', 'replacement': '\\1|\\2'} }
         })
         self.assertEqual("username|text", processor.process('/test/regexp1', 'username: text'))
 
+    def test_regexp_invalid(self):
+        processor = Processor({
+            '/test/regexp2': { 'type': 'regexp', 'parameters':{'pattern': '(.*', 'replacement': ''} }
+        })
+        self.assertEqual("text", processor.process('/test/regexp2', 'text'))
+
+    def test_process_batch(self):
+        processor = Processor({
+            '/test/linear': { 'type': 'linear', 'parameters':{ 'slope': 0.5, 'offset': 1}},
+            '/test/round': [
+                { 'type': 'linear', 'parameters':{ 'slope': 0.5, 'offset': 1}},
+                { 'type': 'round', 'parameters':{ 'decimals': 0}},
+            ],
+            '/test/boolean': { 'type': 'boolean' },
+            '/test/not': { 'type': 'not' },
+            '/test/step': { 'type': 'step', 'parameters':{ 2: 1, 4: 2, 5: 3}},
+            '/test/enum': { 'type': 'enum', 'parameters':{ 0: 'off', 1: 'on'}},
+        })
+        # long enough to take the numpy path when numpy is installed
+        for values in [['0', '1', '11', '-3'], [str(x) for x in range(-20, 20)]]:
+            for topic in ['/test/linear', '/test/round', '/test/boolean', '/test/not', '/test/step', '/test/enum', '/test/none']:
+                expected = [processor.process(topic, value) for value in values]
+                self.assertEqual(expected, processor.process_batch(topic, values))
+
+    def test_process_batch_fallback(self):
+        processor = Processor({
+            '/test/linear': { 'type': 'linear', 'parameters':{ 'slope': 2, 'offset': 1}},
+        })
+        self.assertEqual([3, 'abc', 5], processor.process_batch('/test/linear', ['1', 'abc', '2']))
+
+    def test_process_many(self):
+        processor = Processor({
+            '/test/linear': { 'type': 'linear', 'parameters':{ 'slope': 2, 'offset': 1}},
+            '/test/not': { 'type': 'not' },
+        })
+        self.assertEqual(
+            [('/test/linear', 3), ('/test/not', 0), ('/test/other', '7'), ('/test/linear', 5), ('/test/not', 1)],
+            processor.process_many([
+                ('/test/linear', '1'), ('/test/not', '1'), ('/test/other', '7'), ('/test/linear', '2'), ('/test/not', '0'),
+            ])
+        )
+
+    def test_average(self):
+        processor = Processor({
+            '/test/average': { 'type': 'average', 'parameters':{ 'samples': 3}},
+            '/test/other': { 'type': 'average', 'parameters':{ 'samples': 3}},
+        })
+        self.assertEqual([1, 1.5, 2, 3, 4], processor.process_batch('/test/average', ['1', '2', '3', '4', '5']))
+        self.assertEqual(10, processor.process('/test/other', '10'))
+
+    def test_minimum_maximum(self):
+        processor = Processor({
+            '/test/minimum': { 'type': 'minimum', 'parameters':{ 'samples': 3}},
+            '/test/maximum': { 'type': 'maximum', 'parameters':{ 'samples': 3}},
+        })
+        values = [5, 3, 4, 6, 7, 2, 2, 8]
+        self.assertEqual([5, 3, 3, 3, 4, 2, 2, 2], processor.process_batch('/test/minimum', values))
+        self.assertEqual([5, 5, 5, 6, 7, 7, 7, 8], processor.process_batch('/test/maximum', values))
+
+    def test_median(self):
+        processor = Processor({
+            '/test/median': { 'type': 'median', 'parameters':{ 'samples': 3}},
+        })
+        self.assertEqual([5, 4, 4, 4, 6, 6], processor.process_batch('/test/median', [5, 3, 4, 100, 6, 2]))
+
+    def test_ewma(self):
+        processor = Processor({
+            '/test/ewma': { 'type': 'ewma', 'parameters':{ 'alpha': 0.5}},
+        })
+        self.assertEqual([10, 15, 12.5], processor.process_batch('/test/ewma', ['10', '20', '10']))
+
+    def test_ewma_quoted_alpha(self):
+        processor = Processor({
+            '/test/ewma': { 'type': 'ewma', 'parameters':{ 'alpha': '0.5'}},
+        })
+        self.assertEqual([10, 15], processor.process_batch('/test/ewma', [10, 20]))
+
+    def test_time_window(self):
+        processor = Processor({
+            '/test/average': { 'type': 'average', 'parameters':{ 'seconds': 10}},
+        })
+        filter = processor._filters['/test/average'][0]
+        now = [100]
+        filter.clock = lambda: now[0]
+        self.assertEqual(2, processor.process('/test/average', 2))
+        now[0] = 105
+        self.assertEqual(3, processor.process('/test/average', 4))
+        now[0] = 111
+        self.assertEqual(5, processor.process('/test/average', 6))
+
+    def test_downsample(self):
+        processor = Processor({
+            '/test/samples': [
+                { 'type': 'average', 'parameters':{ 'samples': 2, 'downsample': True}},
+                { 'type': 'round', 'parameters':{ 'decimals': 0}},
+            ],
+            '/test/seconds': { 'type': 'maximum', 'parameters':{ 'seconds': 60, 'downsample': True}},
+        })
+        self.assertEqual([None, 2, None, 4, None], processor.process_batch('/test/samples', [1, 3, 3, 5, 7]))
+
+        filter = processor._filters['/test/seconds'][0]
+        now = [100]
+        filter.clock = lambda: now[0]
+        self.assertEqual(None, processor.process('/test/seconds', 1))
+        now[0] = 130
+        self.assertEqual(None, processor.process('/test/seconds', 3))
+        now[0] = 160
+        self.assertEqual(3, processor.process('/test/seconds', 2))
+        now[0] = 170
+        self.assertEqual(None, processor.process('/test/seconds', 1))
+
+    def test_window_invalid(self):
+        processor = Processor({
+            '/test/average': { 'type': 'average' },
+            '/test/median': { 'type': 'median', 'parameters':{ 'samples': 0}},
+        })
+        self.assertEqual('4', processor.process('/test/average', '4'))
+        self.assertEqual('4', processor.process('/test/median', '4'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,66 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import os
+import time
+import threading
+import shutil
+import tempfile
+import unittest
+
+from libs.profiler import Profiler
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = Profiler(os.path.join(self.directory, 'profiles'))
+        self.profiler.interval = 0.001
+
+    def tearDown(self):
+        self.profiler.stop()
+        shutil.rmtree(self.directory)
+
+    def test_sampler(self):
+        self.profiler.start()
+        time.sleep(0.05)
+        path = self.profiler.stop()
+        self.assertTrue(path.endswith('.collapsed'))
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(int(count) > 0)
+        self.assertIn(';', stack)
+
+    def test_command(self):
+        self.profiler.command(b'30', now=100)
+        self.assertTrue(self.profiler.running())
+        self.assertIsNone(self.profiler.poll(129))
+        self.assertTrue(self.profiler.command('stop').endswith('.collapsed'))
+        for message in ['unknown', 'nan', 'inf', '-5', '0']:
+            self.profiler.command(message)
+            self.assertFalse(self.profiler.running())
+
+    def test_concurrent_stop(self):
+        self.profiler.start()
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(self.profiler.stop())) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len([path for path in paths if path is not None]))
+
+    def test_max_duration(self):
+        self.profiler.command('1e9', now=100)
+        self.assertIsNone(self.profiler.poll(3699))
+        self.assertIsNotNone(self.profiler.poll(3700))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import time
+import unittest
+
+from libs.publish_batcher import PublishBatcher
+
+class TestPublishBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.batcher = PublishBatcher(self.batches.append, 3, 0.05)
+
+    def tearDown(self):
+        self.batcher.stop()
+
+    def test_size(self):
+        for value in range(7):
+            self.batcher.add('/test', str(value), 0, False)
+        self.assertEqual([3, 3], [len(batch) for batch in self.batches])
+        self.assertEqual(1, len(self.batcher))
+
+    def test_delay(self):
+        self.batcher.start()
+        self.batcher.add('/test', '1', 0, False)
+        time.sleep(0.2)
+        self.assertEqual([[('/test', '1', 0, False)]], self.batches)
+
+    def test_stop(self):
+        self.batcher.start()
+        self.batcher.max_delay = 10
+        self.batcher.add('/test', '1', 0, False)
+        self.batcher.stop()
+        self.assertEqual(1, len(self.batches))
+
+    def test_coalesce(self):
+        self.batcher.coalesce = True
+        self.batcher.add('/a', '1', 0, False)
+        self.batcher.add('/b', '1', 0, False)
+        self.batcher.add('/a', '2', 0, False)
+        self.assertEqual([[('/b', '1', 0, False), ('/a', '2', 0, False)]], self.batches)
+        self.assertEqual(1, self.batcher.stats()['coalesced'])
+
+if __name__ == '__main__':
+    unittest.main()
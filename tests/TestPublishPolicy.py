@@ -0,0 +1,74 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.publish_policy import PublishPolicies
+
+class TestPublishPolicy(unittest.TestCase):
+
+    def test_no_policy(self):
+        policies = PublishPolicies({'/battery': {'on_change': True}})
+        self.assertTrue(policies.check('/other', 1, 100))
+        self.assertTrue(policies.check('/other', 1, 100))
+
+    def test_deadband(self):
+        policies = PublishPolicies({'/battery': {'deadband': 0.1}})
+        self.assertTrue(policies.check('/battery', '3.30', 100))
+        self.assertFalse(policies.check('/battery', '3.35', 101))
+        self.assertFalse(policies.check('/battery', '3.25', 102))
+        self.assertTrue(policies.check('/battery', '3.41', 103))
+
+    def test_deadband_percent(self):
+        policies = PublishPolicies({'/xbee/+/adc-7': {'deadband_percent': 10}})
+        self.assertTrue(policies.check('/xbee/1/adc-7', 500, 100))
+        self.assertTrue(policies.check('/xbee/2/adc-7', 100, 100))
+        self.assertFalse(policies.check('/xbee/1/adc-7', 540, 101))
+        self.assertTrue(policies.check('/xbee/2/adc-7', 110, 101))
+        self.assertTrue(policies.check('/xbee/1/adc-7', 560, 102))
+
+    def test_on_change(self):
+        policies = PublishPolicies({'/status': {'on_change': True}})
+        self.assertTrue(policies.check('/status', 'Open', 100))
+        self.assertFalse(policies.check('/status', 'Open', 101))
+        self.assertTrue(policies.check('/status', 'Closed', 102))
+        self.assertEqual(1, policies.stats()['suppressed'])
+
+    def test_min_interval(self):
+        policies = PublishPolicies({'/power': {'min_interval': 10}})
+        self.assertTrue(policies.check('/power', 1, 100))
+        self.assertFalse(policies.check('/power', 2, 105))
+        self.assertFalse(policies.check('/power', 3, 106))
+        self.assertEqual([], policies.tick(109))
+        self.assertEqual([('/power', 3)], policies.tick(110))
+        self.assertEqual([], policies.tick(120))
+        self.assertFalse(policies.check('/power', 4, 115))
+
+    def test_max_interval(self):
+        policies = PublishPolicies({'/battery': {'deadband': 1, 'max_interval': 60}})
+        self.assertTrue(policies.check('/battery', 10, 100))
+        self.assertFalse(policies.check('/battery', 10.5, 130))
+        self.assertEqual([], policies.tick(159))
+        self.assertEqual([('/battery', 10.5)], policies.tick(160))
+        self.assertFalse(policies.check('/battery', 10.5, 170))
+        self.assertTrue(policies.check('/battery', 10.5, 220))
+        self.assertEqual(1, policies.stats()['heartbeats'])
+
+    def test_idle_timeout(self):
+        policies = PublishPolicies({'/sensors/+': {'max_interval': 60}})
+        policies.idle_timeout = 300
+        policies.check('/sensors/a', 1, 100)
+        policies.check('/sensors/b', 1, 100)
+        policies.check('/sensors/b', 2, 250)
+        policies.tick(399)
+        self.assertEqual(2, policies.stats()['topics'])
+        self.assertEqual([], [topic for topic, value in policies.tick(400) if topic == '/sensors/a'])
+        self.assertEqual(1, policies.stats()['topics'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import time
+import unittest
+import threading
+
+from libs.publish_queue import PublishQueue
+
+class TestPublishQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = []
+
+    def on_message(self, address, port, value):
+        self.messages.append((address, port, value))
+
+    def test_order(self):
+        queue = PublishQueue(10)
+        queue.start()
+        handler = queue.handler(self.on_message)
+        for value in range(5):
+            handler('0013a20040401122', 'adc-1', value)
+        queue.stop()
+        self.assertEqual([0, 1, 2, 3, 4], [value for address, port, value in self.messages])
+        self.assertEqual(5, queue.processed)
+
+    def test_drop_oldest(self):
+        queue = PublishQueue(3, 'drop-oldest')
+        for value in range(5):
+            queue.put(self.on_message, 'address', 'port', value)
+        queue.start()
+        queue.stop()
+        self.assertEqual([2, 3, 4], [value for address, port, value in self.messages])
+        self.assertEqual(2, queue.stats()['dropped']['drop-oldest'])
+
+    def test_drop_newest(self):
+        queue = PublishQueue(3, 'drop-newest')
+        for value in range(5):
+            queue.put(self.on_message, 'address', 'port', value)
+        queue.start()
+        queue.stop()
+        self.assertEqual([0, 1, 2], [value for address, port, value in self.messages])
+        self.assertEqual(2, queue.stats()['dropped']['drop-newest'])
+
+    def test_block_timeout(self):
+        release = threading.Event()
+        queue = PublishQueue(1, 'block', 0.05)
+        queue.start()
+        queue.put(release.wait)
+        while queue.qsize():
+            time.sleep(.01)
+        queue.put(self.on_message, 'address', 'port', 1)
+        self.assertFalse(queue.put(self.on_message, 'address', 'port', 2))
+        release.set()
+        queue.stop()
+        self.assertEqual([1], [value for address, port, value in self.messages])
+        self.assertEqual(1, queue.stats()['dropped']['block'])
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, PublishQueue, 10, 'unknown')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.reassembler import LineReassembler
+
+ADDRESS = '0013a20040401122'
+
+class TestReassembler(unittest.TestCase):
+
+    def setUp(self):
+        self.reassembler = LineReassembler()
+
+    def test_split_lines(self):
+        self.assertEqual([], self.reassembler.feed(ADDRESS, b'temp', 0))
+        self.assertEqual([], self.reassembler.feed(ADDRESS, b'erature:2', 0))
+        self.assertEqual(['temperature:21.5', 'humidity:40'], self.reassembler.feed(ADDRESS, b'1.5\r\nhumidity:40\nst', 0))
+        self.assertEqual(['status:1'], self.reassembler.feed(ADDRESS, b'atus:1\n', 0))
+        self.assertEqual(0, len(self.reassembler))
+
+    def test_addresses(self):
+        self.reassembler.feed(ADDRESS, b'a:', 0)
+        self.reassembler.feed('0013a200406bfd09', b'b:', 0)
+        self.assertEqual(['a:1'], self.reassembler.feed(ADDRESS, b'1\n', 0))
+        self.assertEqual(['b:2'], self.reassembler.feed('0013a200406bfd09', b'2\n', 0))
+
+    def test_multibyte(self):
+        data = 'text:añb\n'.encode('utf-8')
+        self.assertEqual([], self.reassembler.feed(ADDRESS, data[:7], 0))
+        self.assertEqual(['text:añb'], self.reassembler.feed(ADDRESS, data[7:], 0))
+
+    def test_max_line_length(self):
+        self.reassembler.max_line_length = 4
+        self.assertEqual([], self.reassembler.feed(ADDRESS, b'abc', 0))
+        self.assertEqual(['abcd'], self.reassembler.feed(ADDRESS, b'defgh', 0))
+        self.assertEqual(['efgh', 'i'], self.reassembler.feed(ADDRESS, b'i\n', 0))
+
+    def test_expire(self):
+        self.reassembler.idle_timeout = 10
+        self.reassembler.feed(ADDRESS, b'partial', 0)
+        self.assertEqual([], self.reassembler.expire(5))
+        self.reassembler.feed(ADDRESS, b' line', 5)
+        self.assertEqual([], self.reassembler.expire(10))
+        self.assertEqual([(ADDRESS, 'partial line')], self.reassembler.expire(15))
+        self.assertEqual(0, len(self.reassembler))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from libs.spool import MessageSpool
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'spool', 'test.db')
+        self.spool = MessageSpool(self.path, 0, 0)
+
+    def tearDown(self):
+        self.spool.close()
+        shutil.rmtree(self.directory)
+
+    def test_order(self):
+        for value in range(5):
+            self.spool.put('/a', str(value), 1, True)
+        self.assertEqual([('/a', b'0', 1, True), ('/a', b'1', 1, True)], self.spool.take(2))
+        self.assertEqual([b'2', b'3', b'4'], [message[1] for message in self.spool.take(10)])
+        self.assertEqual(5, len(self.spool))
+        self.spool.acknowledge()
+        self.assertEqual(0, len(self.spool))
+
+    def test_restart(self):
+        for value in range(3):
+            self.spool.put('/a', str(value), 0, False)
+        self.spool.take(1)
+        self.spool.acknowledge()
+        self.spool.take(1)
+        self.spool.close()
+        # The message taken but not acknowledged is replayed again
+        self.spool = MessageSpool(self.path, 0, 0)
+        self.assertEqual(2, len(self.spool))
+        self.assertEqual([b'1', b'2'], [message[1] for message in self.spool.take(10)])
+
+    def test_rewind(self):
+        for value in range(3):
+            self.spool.put('/a', str(value), 0, False)
+        self.spool.take(2)
+        self.spool.rewind()
+        self.assertEqual([b'0'], [message[1] for message in self.spool.take(1)])
+        self.spool.requeue([('/b', 'x', 0, False), ('/b', 'y', 0, False)])
+        self.assertEqual(['/b', '/b', '/a'], [message[0] for message in self.spool.take(3)])
+        self.spool.acknowledge()
+        self.assertEqual([b'1', b'2'], [message[1] for message in self.spool.take(10)])
+
+    def test_limits(self):
+        self.spool.max_messages = 2
+        self.spool.max_age = 10
+        self.spool.put('/a', '1', 0, False, now=100)
+        self.spool.put('/b', '2', 0, False, now=105)
+        self.spool.put('/c', '3', 0, False, now=106)
+        self.assertEqual(['/b', '/c'], [message[0] for message in self.spool.take(10, now=106)])
+        self.spool.close()
+        self.spool = MessageSpool(self.path, 2, 10)
+        self.assertEqual(['/c'], [message[0] for message in self.spool.take(10, now=115.5)])
+        stats = self.spool.stats()
+        self.assertEqual(1, stats['expired'])
+
+    def test_expire_on_put(self):
+        self.spool.max_age = 10
+        self.spool.put('/a', '1', 0, False, now=100)
+        self.spool.put('/b', '2', 0, False, now=130)
+        self.assertEqual(2, len(self.spool))
+        # Expired while spooling, without replaying
+        self.spool.put('/c', '3', 0, False, now=161)
+        self.assertEqual(1, len(self.spool))
+
+    def test_expire_on_take(self):
+        self.spool.max_age = 10
+        self.spool.put('/a', '1', 0, False, now=100)
+        self.spool.put('/b', '2', 0, False, now=150)
+        # At most once per expire_interval while draining the backlog
+        self.assertEqual(['/a'], [message[0] for message in self.spool.take(1, now=159)])
+        self.spool.rewind()
+        self.assertEqual(['/b'], [message[0] for message in self.spool.take(1, now=160)])
+
+if __name__ == '__main__':
+    unittest.main()
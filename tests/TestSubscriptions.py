@@ -0,0 +1,86 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.subscriptions import SubscriptionRegistry
+
+class TestSubscriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = SubscriptionRegistry()
+
+    def test_batch(self):
+        self.assertEqual(2, self.registry.want(['/a/set', '/b/set']))
+        self.assertEqual((['/a/set', '/b/set'], []), self.registry.changes())
+        self.registry.sent(1, ['/a/set', '/b/set'])
+        self.assertEqual(['/a/set', '/b/set'], self.registry.acknowledged(1, [0, 0]))
+        self.assertEqual(['/a/set', '/b/set'], self.registry.subscribed())
+        self.assertEqual(0, self.registry.stats()['pending'])
+
+    def test_early_acknowledgement(self):
+        self.registry.want(['/a/set'])
+        self.registry.changes()
+        self.assertIsNone(self.registry.acknowledged(1, [0]))
+        self.registry.sent(1, ['/a/set'])
+        self.assertEqual(['/a/set'], self.registry.subscribed())
+        self.assertEqual(0, self.registry.stats()['pending'])
+
+    def test_redundant(self):
+        self.registry.want(['/a/set'])
+        self.registry.changes()
+        self.assertEqual(0, self.registry.want(['/a/set']))
+        self.assertEqual(0, self.registry.unwant(['/b/set']))
+        self.assertEqual(([], []), self.registry.changes())
+
+    def test_unsubscribe(self):
+        self.registry.want(['/a/set'])
+        self.registry.changes()
+        self.registry.sent(1, ['/a/set'])
+        self.registry.acknowledged(1)
+        self.registry.unwant(['/a/set'])
+        self.assertEqual(([], ['/a/set']), self.registry.changes())
+        self.registry.sent(2, ['/a/set'])
+        self.registry.acknowledged(2)
+        self.assertEqual([], self.registry.subscribed())
+        self.assertEqual(None, self.registry.acknowledged(2))
+
+    def test_flapping(self):
+        # Unwanted and wanted again before the broker was told: nothing to send
+        self.registry.want(['/a/set'])
+        self.registry.changes()
+        self.registry.sent(1, ['/a/set'])
+        self.registry.unwant(['/a/set'])
+        self.registry.want(['/a/set'])
+        self.assertEqual(([], []), self.registry.changes())
+        self.registry.acknowledged(1)
+        self.assertEqual(['/a/set'], self.registry.subscribed())
+
+    def test_refused_and_failed(self):
+        self.registry.want(['/a/set', '/b/set'])
+        self.registry.changes()
+        self.registry.sent(1, ['/a/set', '/b/set'])
+        self.registry.acknowledged(1, [0, 0x80])
+        self.assertEqual(['/a/set'], self.registry.subscribed())
+
+        self.registry.want(['/c/set'])
+        self.registry.changes()
+        self.registry.sent(2, ['/c/set'], False)
+        self.assertEqual((['/c/set'], []), self.registry.changes())
+
+    def test_reset(self):
+        self.registry.want(['/a/set'])
+        self.registry.changes()
+        self.registry.sent(1, ['/a/set'])
+        self.registry.acknowledged(1)
+        self.registry.reset()
+        self.assertEqual([], self.registry.subscribed())
+        self.assertEqual((['/a/set'], []), self.registry.changes())
+
+if __name__ == '__main__':
+    unittest.main()
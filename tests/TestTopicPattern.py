@@ -0,0 +1,57 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.cache import LRUCache
+from libs.topic_pattern import TopicPattern
+
+ADDRESS = '0013a20040401122'
+
+class TestTopicPattern(unittest.TestCase):
+
+    def test_plain(self):
+        pattern = TopicPattern('/raw/xbee/{address}/{port}')
+        self.assertFalse(pattern.has_item)
+        self.assertEqual('/raw/xbee/0013a20040401122/adc-1', pattern.format(ADDRESS, 'adc-1'))
+        self.assertEqual('/raw/xbee/0013a20040401122/seen', pattern.format(ADDRESS, 'seen'))
+
+    def test_item(self):
+        pattern = TopicPattern('/xbee/{address}/{item}/{port}/')
+        self.assertTrue(pattern.has_item)
+        self.assertEqual('/xbee/0013a20040401122/analog/pin-1', pattern.format(ADDRESS, 'adc-1'))
+        self.assertEqual('/xbee/0013a20040401122/digital/pin-12', pattern.format(ADDRESS, 'dio-12'))
+        self.assertEqual('/xbee/0013a20040401122/config/pin-3', pattern.format(ADDRESS, 'pin-3'))
+
+    def test_filter(self):
+        self.assertEqual('/raw/xbee/+/+/set', TopicPattern('/raw/xbee/{address}/{port}/set').topic_filter())
+        self.assertEqual('/xbee/+/+/+/set', TopicPattern('/xbee/{address}/{item}/{port}/set/').topic_filter())
+
+    def test_parse(self):
+        pattern = TopicPattern('/raw/xbee/{address}/{port}/set')
+        self.assertEqual({'address': ADDRESS, 'port': 'dio-3'}, pattern.parse('/raw/xbee/%s/dio-3/set' % ADDRESS))
+        self.assertEqual(None, pattern.parse('/raw/xbee/%s' % ADDRESS))
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+        stats = cache.stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['evictions'])
+
+if __name__ == '__main__':
+    unittest.main()
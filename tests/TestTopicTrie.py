@@ -0,0 +1,38 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import unittest
+
+from libs.topic_trie import TopicTrie
+
+class TestTopicTrie(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = TopicTrie()
+        self.trie.insert('/home/door/status/set', 'door')
+        self.trie.insert('/raw/xbee/+/+/set', 'pattern')
+        self.trie.insert('/raw/xbee/0013a20040401122/dio-12/set', 'route')
+        self.trie.insert('/service/#', 'service')
+
+    def test_literal(self):
+        self.assertEqual('door', self.trie.match('/home/door/status/set'))
+        self.assertEqual(None, self.trie.match('/home/door/status'))
+        self.assertEqual(None, self.trie.match('/home/door/status/set/more'))
+
+    def test_precedence(self):
+        self.assertEqual('route', self.trie.match('/raw/xbee/0013a20040401122/dio-12/set'))
+        self.assertEqual('pattern', self.trie.match('/raw/xbee/0013a20040401122/dio-11/set'))
+
+    def test_multilevel(self):
+        self.assertEqual('service', self.trie.match('/service/xbee2mqtt/status'))
+        self.assertEqual('service', self.trie.match('/service'))
+        self.assertEqual('none', self.trie.match('/other', 'none'))
+        self.assertEqual(4, len(self.trie))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,11 +18,13 @@ class TestXBee(unittest.TestCase):
     serial = None
     xbee = None
     messages = []
+    native = False
 
     def setUp(self):
         self.messages = []
         self.serial = Serial(None, None)
         self.xbee = XBeeWrapper()
+        self.xbee.native = self.native
         self.xbee.default_port_name = 'serial'
         self.xbee.serial = self.serial
         self.xbee.on_message = self.on_message
@@ -69,5 +71,47 @@ class TestXBee(unittest.TestCase):
         self.assertEqual('dio-12', self.messages[0]['port'])
         self.assertEqual(1, self.messages[0]['value'])
 
+    def test_frame(self):
+        frames = []
+        self.xbee.on_frame = lambda address, values, rssi: frames.append((address, values))
+        self.serial.feed('920013a200406bfd090123010110008010000B00')  # IO Sample DIO12:1, ADC7(Supply Voltage):2816
+        while len(frames) == 0:
+            time.sleep(.1)
+        self.assertEqual([('0013a200406bfd09', [('dio-12', 1), ('adc-7', 2816)])], frames)
+        # Frame values do not go to on_message as well
+        self.assertEqual(0, len(self.messages))
+
+    def test_pin_response(self):
+        packet = {
+            'id': 'remote_at_response',
+            'source_addr_long': binascii.unhexlify('0013a20040401122'),
+            'command': b'D3',
+            'status': b'\x00',
+        }
+        # Reply to a pin change, without a value
+        self.xbee.process(dict(packet, parameter=None))
+        self.assertEqual(0, len(self.messages))
+        self.xbee.process(dict(packet, parameter=b'\x05'))
+        self.assertEqual([{'address': '0013a20040401122', 'port': 'pin-3', 'value': 5}], self.messages)
+
+    def test_feed(self):
+        serial = Serial(None, None)
+        serial.feed('920013a200406bfd090123010110008010000B00')  # IO Sample DIO12:1, ADC7(Supply Voltage):2816
+        xbee = XBeeWrapper()
+        xbee.threaded = False
+        xbee.serial = serial
+        xbee.on_message = self.on_message
+        xbee.connect()
+        xbee.feed(b'\x00\x13' + serial.stream[:7]) # noise before the start delimiter
+        self.assertEqual(0, len(self.messages))
+        xbee.feed(serial.stream[7:])
+        self.assertEqual(2, len(self.messages))
+        self.assertEqual('dio-12', self.messages[0]['port'])
+        self.assertEqual(2816, self.messages[1]['value'])
+
+class TestXBeeNative(TestXBee):
+
+    native = True
+
 if __name__ == '__main__':
     unittest.main()
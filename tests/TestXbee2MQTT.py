@@ -0,0 +1,160 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Xose Pérez"
+__contact__ = "xose.perez@gmail.com"
+__copyright__ = "Copyright (C) Xose Pérez"
+__license__ = 'GPL v3'
+
+import json
+import time
+import unittest
+
+from xbee2mqtt import Xbee2MQTT
+from libs.processor import Processor
+from libs.metrics import Metrics
+from libs.profiler import Profiler
+
+ADDRESS = '0013a20040401122'
+
+class MQTTMock(object):
+
+    def __init__(self):
+        self.published = []
+        self.subscribed = []
+        self.unsubscribed = []
+
+    def publish(self, topic, value):
+        self.published.append((topic, value))
+
+    def subscribe(self, topic):
+        self.subscribed.append(topic)
+
+    def unsubscribe(self, topic):
+        self.unsubscribed.append(topic)
+
+class XBeeMock(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, address, port, value):
+        self.sent.append((address, port, value))
+
+class TestXbee2MQTT(unittest.TestCase):
+
+    subscription_mode = 'routes'
+
+    def setUp(self):
+        self.gateway = Xbee2MQTT('/tmp/xbee2mqtt-test.pid')
+        self.gateway.mqtt = MQTTMock()
+        self.gateway.xbee = XBeeMock()
+        self.gateway.processor = Processor({})
+        self.gateway._duplicates = None
+        self.gateway.subscription_mode = self.subscription_mode
+        self.gateway.expose_undefined_topics = True
+        self.gateway.default_topic_pattern = '/raw/xbee/{address}/{port}'
+        self.gateway.default_input_topic_pattern = '/raw/xbee/{address}/{port}/set'
+        self.gateway.load({ADDRESS: {'dio-12': '/home/door/status'}})
+
+    def test_route_command(self):
+        self.gateway.mqtt_on_message('/home/door/status/set', b'1')
+        self.assertEqual([(ADDRESS, 'dio-12', b'1')], self.gateway.xbee.sent)
+
+    def test_unknown_command(self):
+        self.gateway.mqtt_on_message('/other/topic/set', b'1')
+        self.assertEqual([], self.gateway.xbee.sent)
+
+    def test_exposed_command(self):
+        self.gateway.xbee_on_message(ADDRESS, 'pin-3', 5)
+        self.gateway.mqtt_on_message('/raw/xbee/%s/dio-3/set' % ADDRESS, b'1')
+        self.assertEqual([(ADDRESS, 'dio-3', b'1')], self.gateway.xbee.sent)
+        self.assertEqual([('/raw/xbee/%s/pin-3' % ADDRESS, 5)], self.gateway.mqtt.published)
+
+    def test_rejected_command(self):
+        self.gateway._exposed.add('/raw/xbee//dio-3/set')
+        for i in range(2):
+            self.gateway.mqtt_on_message('/raw/xbee//dio-3/set', b'1')
+        self.assertEqual([], self.gateway.xbee.sent)
+        self.assertEqual(1, self.gateway._rejected.stats()['hits'])
+
+    def test_command_topics(self):
+        self.assertEqual(['/home/door/status/set'], self.gateway.command_topics())
+
+    def test_document(self):
+        self.gateway.publish_mode = 'document'
+        self.gateway.xbee_on_frame(ADDRESS, [('dio-12', 1), ('adc-1', 512)], -40)
+        self.assertEqual(1, len(self.gateway.mqtt.published))
+        topic, payload = self.gateway.mqtt.published[0]
+        self.assertEqual('/raw/xbee/%s' % ADDRESS, topic)
+        data = json.loads(payload)
+        self.assertEqual({'dio-12': 1, 'adc-1': 512}, data['values'])
+        self.assertEqual(-40, data['rssi'])
+        self.assertEqual(ADDRESS, data['address'])
+
+    def test_document_both(self):
+        self.gateway.publish_mode = 'both'
+        self.gateway.xbee_on_frame(ADDRESS, [('dio-12', 1)], None, 100.0)
+        # Duplicates are not published to their topic again, but stay in the document
+        self.gateway.xbee_on_frame(ADDRESS, [('dio-12', 1), ('adc-1', 512)])
+        topics = [topic for topic, value in self.gateway.mqtt.published]
+        self.assertEqual(['/home/door/status', '/raw/xbee/%s' % ADDRESS, '/raw/xbee/%s/adc-1' % ADDRESS, '/raw/xbee/%s' % ADDRESS], topics)
+        self.assertEqual(100.0, json.loads(self.gateway.mqtt.published[1][1])['time'])
+        self.assertEqual({'dio-12': 1, 'adc-1': 512}, json.loads(self.gateway.mqtt.published[3][1])['values'])
+
+    def test_patterns_per_instance(self):
+        other = Xbee2MQTT('/tmp/xbee2mqtt-test.pid')
+        other.default_topic_pattern = '/other/{address}/{port}'
+        self.assertEqual('/other/a/b', other.transform_pattern('/other/{address}/{port}', 'a', 'b'))
+        self.assertNotIn('/other/{address}/{port}', self.gateway._patterns)
+        self.assertIsNone(Xbee2MQTT._patterns)
+
+    def test_metrics(self):
+        self.gateway.metrics = Metrics()
+        self.gateway.expose_undefined_topics = False
+        received = time.time()
+        self.gateway.xbee_on_message(ADDRESS, 'dio-12', 1, received)
+        self.gateway.xbee_on_message(ADDRESS, 'dio-12', 1, received)
+        self.gateway.xbee_on_message(ADDRESS, 'adc-1', 512, received)
+        metrics = dict(self.gateway.metrics.values())
+        self.assertEqual(2, metrics['messages/routed'])
+        self.assertEqual(1, metrics['messages/unrouted'])
+        self.assertEqual(1, metrics['duplicates'])
+        self.assertEqual(1, metrics['latency_seconds/published/count'])
+        self.assertEqual(3, metrics['latency_seconds/dequeued/count'])
+
+    def test_profiler_topic(self):
+        commands = []
+        self.gateway.profiler = Profiler()
+        self.gateway.profiler.command = commands.append
+        self.gateway.profiler_topic = '/service/xbee2mqtt/profile'
+        self.assertIn('/service/xbee2mqtt/profile', self.gateway.command_topics())
+        self.gateway.mqtt_on_message('/service/xbee2mqtt/profile', b'10')
+        self.assertEqual([b'10'], commands)
+        self.assertEqual([], self.gateway.xbee.sent)
+
+class TestXbee2MQTTWildcard(TestXbee2MQTT):
+
+    subscription_mode = 'wildcard'
+
+    def test_command_topics(self):
+        self.assertEqual(['/home/door/status/set', '/raw/xbee/+/+/set'], self.gateway.command_topics())
+
+    def test_command_filters(self):
+        self.gateway.load({
+            ADDRESS: {'dio-12': '/home/door/status', 'dio-11': '/home/window/status', 'dio-10': '/garden/valve'},
+        })
+        self.assertEqual(
+            ['/garden/valve/set', '/home/+/status/set', '/raw/xbee/+/+/set'], self.gateway.command_topics()
+        )
+        self.gateway.mqtt_on_message('/home/window/status/set', b'1')
+        self.assertEqual([(ADDRESS, 'dio-11', b'1')], self.gateway.xbee.sent)
+
+    def test_concealed_command(self):
+        self.gateway.xbee_on_message(ADDRESS, 'pin-3', 0)
+        self.gateway.mqtt_on_message('/raw/xbee/%s/dio-3/set' % ADDRESS, b'1')
+        self.assertEqual([], self.gateway.xbee.sent)
+        self.assertEqual([], self.gateway.mqtt.subscribed)
+
+if __name__ == '__main__':
+    unittest.main()
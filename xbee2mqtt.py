@@ -26,13 +26,11 @@ __copyright__ = "Copyright (C) 2012-2013 Xose Pérez"
 __license__ = 'GPL v3'
 
 import os
-import re
 import sys
 import time
 import logging
 
 #from tests.SerialMock import Serial
-from parse import parse
 from serial import Serial
 from serial import SerialException
 from libs.daemon import Daemon
@@ -40,6 +38,20 @@ from libs.processor import Processor
 from libs.config import Config
 from libs.mosquitto_wrapper import MosquittoWrapper
 from libs.xbee_wrapper import XBeeWrapper
+from libs.publish_queue import PublishQueue
+from libs.publish_batcher import PublishBatcher
+from libs.offline_buffer import OfflineBuffer
+from libs.spool import MessageSpool
+from libs.metrics import Metrics, MetricsServer
+from libs.profiler import Profiler
+from libs.async_engine import AsyncEngine
+from libs.at_scheduler import ATScheduler
+from libs.cache import LRUCache
+from libs.dedup import DuplicateFilter
+from libs.publish_policy import PublishPolicies
+from libs import document
+from libs.topic_pattern import TopicPattern
+from libs.topic_trie import TopicTrie
 
 class Xbee2MQTT(Daemon):
     """
@@ -48,16 +60,56 @@ class Xbee2MQTT(Daemon):
     """
 
     duplicate_check_window = 5
+    duplicate_cache_size = 10000
+    topic_cache_size = 4096
+
+    # 'topics' publishes every port to its own topic, 'document' publishes
+    # one document per node and frame, 'both' does both
+    publish_mode = 'topics'
+    document_topic_pattern = '/raw/xbee/{address}'
+    document_format = 'json'
+
+    # Level of the per message log lines and how many messages
+    # are published for each one logged
+    message_log_level = logging.INFO
+    message_log_sample = 1
+
+    # 'routes' subscribes to every route /set topic,
+    # 'wildcard' to a few filters and dispatches commands locally
+    subscription_mode = 'routes'
 
     logger = None
     xbee = None
     mqtt = None
     processor = None
+    policies = None
+    queue = None
+    engine = None
     config_file = None
 
+    # Optional Metrics, served by metrics_server and/or published
+    # under metrics_topic every metrics_interval seconds
+    metrics = None
+    metrics_server = None
+    metrics_topic = None
+    metrics_interval = 60
+
+    # Optional Profiler, toggled by the USR2 signal and
+    # driven by the messages sent to profiler_topic
+    profiler = None
+    profiler_topic = None
+
     _routes = {}
     _actions = {}
-    _topics = {}
+    _duplicates = None
+    _patterns = None
+    _topic_cache = None
+    _rejected = None
+    _commands = None
+    _exposed = None
+    _housekeeping = 0
+    _unlogged = 0
+    _metrics_published = 0
 
     def load(self, routes):
         """
@@ -65,22 +117,107 @@ class Xbee2MQTT(Daemon):
         """
         self._routes = {}
         self._actions = {}
+        if self._exposed is None:
+            self._exposed = set()
         for address, ports in routes.items():
             for port, topic in ports.items():
                 self._routes[(address, port)] = topic
                 self._actions['%s/set' % topic] = (address, port)
+        self.load_patterns()
+
+        # Command dispatch tree, routes take precedence over the input pattern
+        self._commands = TopicTrie()
+        for topic, data in self._actions.items():
+            self._commands.insert(topic, data)
+        pattern = self._patterns.get(getattr(self, 'default_input_topic_pattern', None), None)
+        if pattern:
+            self._commands.insert(pattern.topic_filter(), pattern)
+
+    def load_patterns(self):
+        """
+        Analyses the default topic patterns and empties the topic cache
+        """
+        self._patterns = {}
+        for name in ['default_topic_pattern', 'default_input_topic_pattern']:
+            pattern = getattr(self, name, None)
+            if pattern:
+                self._patterns[pattern] = TopicPattern(pattern)
+        self._topic_cache = LRUCache(self.topic_cache_size)
+        self._rejected = LRUCache(self.topic_cache_size)
+
+    def command_topics(self):
+        """
+        Topics to subscribe to for incoming commands
+        """
+        profiler = [self.profiler_topic] if self.profiler is not None and self.profiler_topic else []
+        if self.subscription_mode != 'wildcard':
+            return sorted(list(self._actions.keys()) + profiler)
+
+        # One filter per root level and depth of the route topics, with a wildcard
+        # where their levels differ, plus the input pattern
+        groups = {}
+        for topic in self._actions.keys():
+            levels = topic.split('/')
+            root = [level for level in levels if level][:1]
+            groups.setdefault((len(levels), tuple(root)), []).append(levels)
+        filters = set()
+        for group in groups.values():
+            filters.add('/'.join([
+                level[0] if len(set(level)) == 1 else '+' for level in zip(*group)
+            ]))
+        pattern = self._patterns.get(getattr(self, 'default_input_topic_pattern', None), None)
+        if pattern and self.expose_undefined_topics:
+            filters.add(pattern.topic_filter())
+        return sorted(list(filters) + profiler)
+
+    def expose(self, topic):
+        """
+        Starts accepting commands from an undefined route topic
+        """
+        if self.subscription_mode == 'wildcard':
+            self._exposed.add(topic)
+        else:
+            self.mqtt.subscribe(topic)
+
+    def conceal(self, topic):
+        """
+        Stops accepting commands from an undefined route topic
+        """
+        if self.subscription_mode == 'wildcard':
+            self._exposed.discard(topic)
+        else:
+            self.mqtt.unsubscribe(topic)
 
-    def log(self, level, message):
+    def log(self, level, message, *args):
         if self.logger:
-            self.logger.log(level, message)
+            self.logger.log(level, message, *args)
+
+    def log_message(self, message, *args):
+        """
+        Logs a published message at message_log_level, one out of every message_log_sample
+        """
+        self._unlogged += 1
+        if self._unlogged < self.message_log_sample:
+            return
+        self._unlogged = 0
+        if self.logger is not None and self.logger.isEnabledFor(self.message_log_level):
+            self.logger.log(self.message_log_level, message, *args)
 
     def cleanup(self):
         """
         Clean up connections and unbind ports
         """
         self.xbee.disconnect()
+        if self.queue:
+            self.queue.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.profiler is not None:
+            self.profiler.stop()
         self.log(logging.INFO, "Exiting")
         self.mqtt.disconnect()
+        if self.mqtt.offline is not None:
+            self.mqtt.offline.close()
         sys.exit()
 
     def mqtt_on_message(self, topic, message):
@@ -88,16 +225,35 @@ class Xbee2MQTT(Daemon):
         Message received from a subscribed topic
         """
 
-        self.log(logging.DEBUG, "Message received from MQTT broker: %s %s" % (topic, message))
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Message received from MQTT broker: %s %s", topic, message)
 
-        data = self._actions.get(topic, None)
-        if data is None:
-            result = parse(self.default_input_topic_pattern, topic).named
+        if topic == self.profiler_topic and self.profiler is not None:
+            self.profiler.command(message)
+            return
 
-            new_schema = re.search('{item}', self.default_topic_pattern)
-            if new_schema:
+        data = self._commands.match(topic)
+        if data is None:
+            self.log(logging.DEBUG, "No route for topic %s", topic)
+            return
+
+        if isinstance(data, TopicPattern):
+            if self.subscription_mode == 'wildcard' and topic not in self._exposed:
+                self.log(logging.DEBUG, "Topic %s is not exposed", topic)
+                return
+            if self._rejected.get(topic):
+                self.log(logging.DEBUG, "Topic %s does not match the input pattern", topic)
+                return
+            result = data.parse(topic)
+            if result is None:
+                self.log(logging.DEBUG, "Topic %s does not match the input pattern", topic)
+                self._rejected.put(topic, True)
+                return
+
+            output = self._patterns.get(self.default_topic_pattern, None)
+            if output is not None and output.has_item:
                 number = result['port'][4:]
-                item = result['item']
+                item = result.get('item', None)
 
                 if item == 'analog':
                     result['port'] = 'adc-%s' % number
@@ -110,85 +266,154 @@ class Xbee2MQTT(Daemon):
 
         if data:
             address, port = data
-            self.log(logging.INFO, "Setting radio %s port %s to %s" % (address, port, message))
+            self.log(logging.INFO, "Setting radio %s port %s to %s", address, port, message)
             try:
                 self.xbee.send_message(address, port, message)
             except Exception as e:
-                self.log(logging.ERROR, "Error while sending message (%s)" % e)
+                self.log(logging.ERROR, "Error while sending message (%s)", e)
 
-    def mqtt_publish(self, topic, value):
+    def mqtt_publish(self, topic, value, received=None):
         """
-        Publishes a non duplicate value to a given topic
+        Publishes a non duplicate value to a given topic,
+        received is the time the value arrived from the radio
         """
         if topic:
 
-            now = time.time()
-            if topic in self._topics \
-                and self._topics[topic]['time'] + self.duplicate_check_window > now \
-                and self._topics[topic]['value'] == value \
-                :
-                    self.log(logging.DEBUG, "Duplicate removed")
-                    return
-            self._topics[topic] = {'time': now, 'value': value}
+            if self.duplicate(topic, value):
+                return
 
             value = self.processor.process(topic, value)
-            self.log(logging.INFO, "Sending message to MQTT broker: %s %s" % (topic, value))
-            self.mqtt.publish(topic, value)
+            if value is None:
+                self.log(logging.DEBUG, "Value dropped by filter")
+                return
+            self.publish_value(topic, value, received)
+
+    def duplicate(self, topic, value):
+        """
+        Whether the value was already published to the topic within the duplicate check window
+        """
+        if self._duplicates is None:
+            self._duplicates = DuplicateFilter(self.duplicate_check_window, self.duplicate_cache_size)
+        if self._duplicates.duplicate(topic, value):
+            self.log(logging.DEBUG, "Duplicate removed")
+            if self.metrics is not None:
+                self.metrics.inc('duplicates')
+            return True
+        return False
+
+    def publish_value(self, topic, value, received=None):
+        """
+        Publishes a processed value unless its publish policy holds it back
+        """
+        if self.policies is not None and not self.policies.check(topic, value):
+            self.log(logging.DEBUG, "Value held back by publish policy")
+            return
+        self.log_message("Sending message to MQTT broker: %s %s", topic, value)
+        self.mqtt.publish(topic, value)
+        self.measure('published', received)
+
+    def measure(self, stage, received):
+        """
+        Records the time since a value was received from the radio
+        """
+        if received is not None and self.metrics is not None:
+            self.metrics.observe('latency_seconds', time.time() - received, {'stage': stage})
+
+    def stamp(self, callback):
+        """
+        Returns a radio callback that also passes the time it was called at
+        """
+        def stamped(*args):
+            callback(*(args + (time.time(),)))
+        return stamped
 
     def transform_pattern(self, pattern, address, port):
         """
         Transform default topic pattern to expand adc/dio ports if there is a {item} whitin
         to keep compatibility with old topic patterns schemas.
+        Results are cached by pattern, address and port.
         """
-        prefix = port[:4]
-        if prefix == 'adc-':
-            item = 'analog'
-        elif prefix == 'dio-':
-            item = 'digital'
-        elif prefix == 'pin-':
-            item = 'config'
-        else:
-            item = ''
-
-        new_schema = re.search('{item}', pattern)
-        if new_schema:
-            number = port[4:]
-            port = "pin-%s" % number if len(item)>0 else port
-            topic = pattern.format(address=address, port=port, item=item)
-        else:
-            topic = pattern.format(address=address, port=port)
-
-        # Clean excess slashes.
-        return re.sub('//+|/$', '', topic).rstrip('/')
-
-    def xbee_on_message(self, address, port, value):
+        key = (pattern, address, port)
+        if self._topic_cache is None:
+            self.load_patterns()
+        topic = self._topic_cache.get(key)
+        if topic is None:
+            compiled = self._patterns.get(pattern, None)
+            if compiled is None:
+                compiled = self._patterns[pattern] = TopicPattern(pattern)
+            topic = compiled.format(address, port)
+            self._topic_cache.put(key, topic)
+        return topic
+
+    def xbee_on_message(self, address, port, value, received=None):
         """
         Message from the radio coordinator
         """
-        self.log(logging.DEBUG, "Message received from radio: %s %s %s" % (address, port, value))
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Message received from radio: %s %s %s", address, port, value)
+        self.measure('dequeued', received)
+        self.mqtt_publish(self.route(address, port, value), value, received)
 
+    def xbee_on_frame(self, address, values, rssi=None, received=None):
+        """
+        All the values received from the radio coordinator in a frame,
+        published as a single document
+        """
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Frame received from radio: %s %s", address, values)
+        self.measure('dequeued', received)
+
+        ports = {}
+        for port, value in values:
+            topic = self.route(address, port, value)
+            # Duplicates are only left out of the per-topic messages, documents hold every port
+            publish = self.publish_mode == 'both' and topic and not self.duplicate(topic, value)
+            processed = self.processor.process(topic, value) if topic else value
+            if processed is None:
+                continue
+            ports[port] = processed
+            if publish:
+                self.publish_value(topic, processed, received)
+        if not ports:
+            return
+
+        data = {'address': address, 'time': round(received if received is not None else time.time(), 3), 'values': ports}
+        if rssi is not None:
+            data['rssi'] = rssi
+        topic = self.transform_pattern(self.document_topic_pattern, address, '')
+        self.log_message("Sending document to MQTT broker: %s %s", topic, data)
+        self.mqtt.publish(topic, document.encode(data, self.document_format))
+        self.measure('published', received)
+
+    def route(self, address, port, value):
+        """
+        Returns the topic for a radio port, or False if it is not published,
+        and exposes the input topics of the undefined digital ports
+        """
         topic = self._routes.get(
             (address, port),
             self.transform_pattern(self.default_topic_pattern, address, port) if self.expose_undefined_topics else False
         )
         prefix = port[:4]
         if self.expose_undefined_topics and prefix in ['dio-', 'pin-']:
-            self.mqtt.subscribe(self.transform_pattern(self.default_input_topic_pattern, address, port))
+            self.expose(self.transform_pattern(self.default_input_topic_pattern, address, port))
             number = port[4:]
             digital = 'dio-%s' % number
             digital_topic = self.transform_pattern(self.default_input_topic_pattern, address, digital)
             if prefix == 'pin-' and value in [4, 5]:
-                self.mqtt.subscribe(digital_topic)
+                self.expose(digital_topic)
             else:
-                self.mqtt.unsubscribe(digital_topic)
-        self.mqtt_publish(topic, value)
+                self.conceal(digital_topic)
+        if self.metrics is not None:
+            self.metrics.inc('messages', {'route': 'routed' if topic else 'unrouted'})
+        return topic
 
     def xbee_on_identification(self, address, alias):
         """
         Identification message from remote node
         """
         now = time.strftime("%s")
-        self.log(logging.INFO, "Identification received from radio: %s (%s) %s" % (address, alias, now))
+        self.log(logging.INFO, "Identification received from radio: %s (%s) %s", address, alias, now)
 
         topic = self._routes.get(
             (address, "seen"),
@@ -203,11 +428,77 @@ class Xbee2MQTT(Daemon):
         self.mqtt_publish(topic, alias)
         self.xbee.send_query(address)
 
+    def housekeeping(self):
+        """
+        Periodic maintenance of the components, called about once per second
+        """
+        now = time.time()
+        if now - self._housekeeping < 1:
+            return
+        self._housekeeping = now
+        self.xbee.housekeeping(now)
+        if self._duplicates is not None:
+            self._duplicates.expire(now)
+        if self.policies is not None:
+            for topic, value in self.policies.tick(now):
+                self.log_message("Sending message to MQTT broker: %s %s", topic, value)
+                self.mqtt.publish(topic, value)
+        if self.profiler is not None:
+            self.profiler.poll(now)
+        if self.metrics is not None and self.metrics_topic and now - self._metrics_published >= self.metrics_interval:
+            self._metrics_published = now
+            self.publish_metrics()
+
+    def publish_metrics(self):
+        """
+        Publishes every metric to its own topic under metrics_topic
+        """
+        for path, value in self.metrics.values():
+            self.mqtt.publish('%s/%s' % (self.metrics_topic, path), value)
+
+    def register_metrics(self, metrics):
+        metrics.describe('frames', 'API frames received from the coordinator by API id')
+        metrics.describe('messages', 'Radio values with and without a topic to publish them to')
+        metrics.describe('duplicates', 'Duplicate values dropped')
+        metrics.describe('filter_seconds', 'Time spent in the filter pipelines')
+        metrics.describe('latency_seconds', 'Time since a value was received from the radio, by stage')
+        self.xbee.metrics = metrics
+        self.processor.metrics = metrics
+        self.mqtt.metrics = metrics
+        if self.queue:
+            metrics.describe('queue_depth', 'Radio messages waiting for the publisher thread')
+            metrics.gauge('queue_depth', self.queue.qsize)
+            for policy in self.queue.policies:
+                metrics.gauge(
+                    'queue_dropped', lambda policy=policy: self.queue.stats()['dropped'][policy],
+                    {'policy': policy}, type='counter'
+                )
+
+    def do_profile(self):
+        """
+        Starts profiling with the configured defaults, or stops it if running
+        """
+        if self.profiler is None:
+            return
+        if self.profiler.running():
+            self.profiler.stop()
+        else:
+            self.profiler.start()
+
     def do_reload(self):
         self.log(logging.INFO, "Reloading")
-        config = Config(config_file)
+        config = Config(self.config_file)
+        previous = set(self.command_topics())
         self.load(config.get('general', 'routes', {}))
-        self.mqtt.subscribe(list(self._actions.keys()))
+        self.processor.load(config.get('processor', 'filters', {}))
+        if self.policies is not None:
+            self.policies.load(config.get('publisher', 'policies', {}))
+
+        # Only subscribe to new routes and unsubscribe from removed ones
+        current = set(self.command_topics())
+        self.mqtt.subscribe_to = list(current)
+        self.mqtt.unsubscribe(sorted(previous - current))
+        self.mqtt.subscribe(sorted(current - previous))
 
     def run(self):
         """
@@ -215,13 +506,47 @@ class Xbee2MQTT(Daemon):
         """
         self.log(logging.INFO, "Starting " + __app__ + " v" + __version__)
         self.mqtt.on_message_cleaned = self.mqtt_on_message
-        self.mqtt.subscribe_to = list(self._actions.keys())
+        self.mqtt.subscribe_to = self.command_topics()
         self.mqtt.logger = self.logger
+        if self.profiler is not None:
+            self.profiler.logger = self.logger
         self.xbee.on_identification = self.xbee_on_identification
         self.xbee.on_node_discovery = self.xbee_on_identification
-        self.xbee.on_message = self.xbee_on_message
         self.xbee.logger = self.logger
 
+        # Hand radio events over to the publisher worker so
+        # the serial reader thread never waits on the broker
+        on_message = self.xbee_on_message
+        on_frame = self.xbee_on_frame
+        if self.queue:
+            self.queue.logger = self.logger
+            self.queue.start()
+            self.xbee.on_identification = self.queue.handler(self.xbee_on_identification)
+            self.xbee.on_node_discovery = self.queue.handler(self.xbee_on_identification)
+            on_message = self.queue.handler(on_message)
+            on_frame = self.queue.handler(on_frame)
+
+        # Radio values carry their reception time to measure latencies
+        if self.metrics is not None:
+            self.register_metrics(self.metrics)
+            on_message = self.stamp(on_message)
+            on_frame = self.stamp(on_frame)
+
+        # In document modes frame values go to the frame handler,
+        # pin responses still come through on_message
+        self.xbee.on_message = on_message
+        if self.publish_mode != 'topics':
+            self.xbee.on_frame = on_frame
+
+        if self.metrics_server:
+            self.metrics_server.logger = self.logger
+            self.metrics_server.start()
+
+        if self.engine:
+            self.engine.logger = self.logger
+            self.engine.on_tick = self.housekeeping
+            self.engine.attach(self.mqtt, self.xbee)
+
         self.mqtt.connect()
         if not self.xbee.connect():
             self.stop()
@@ -230,11 +555,20 @@ class Xbee2MQTT(Daemon):
             self.log(logging.INFO, "Requesting Node Discovery")
             self.xbee.xbee.at(command='ND')
 
+        if self.engine:
+            self.engine.run()
+            return
+
         while True:
             try:
                 self.mqtt.loop()
             except Exception as e:
                 logging.exception("Error while looping MQTT (%s)" % e)
+            wait = self.mqtt.maintain()
+            if self.mqtt.socket() is None:
+                # No connection, loop() returns straight away
+                time.sleep(min(1, wait) if wait is not None else 1)
+            self.housekeeping()
 
 if __name__ == "__main__":
 
@@ -262,6 +596,28 @@ if __name__ == "__main__":
     mqtt.qos = config.get('mqtt', 'qos', 0)
     mqtt.retain = config.get('mqtt', 'retain', True)
     mqtt.set_will = config.get('mqtt', 'set_will', True)
+    mqtt.subscribe_qos = config.get('mqtt', 'subscribe_qos', 0)
+    mqtt.subscribe_chunk_size = config.get('mqtt', 'subscribe_chunk_size', 100)
+    if config.get('mqtt', 'batch_messages', 0) > 1:
+        mqtt.batcher = PublishBatcher(
+            max_messages=config.get('mqtt', 'batch_messages', 0),
+            max_delay=config.get('mqtt', 'batch_delay', 50) / 1000.0
+        )
+        mqtt.batcher.coalesce = config.get('mqtt', 'batch_coalesce', False)
+    mqtt.reconnect_supervisor.min_delay = config.get('mqtt', 'reconnect_min_delay', 1)
+    mqtt.reconnect_supervisor.max_delay = config.get('mqtt', 'reconnect_max_delay', 120)
+    if config.get('mqtt', 'spool_file', None):
+        mqtt.offline = MessageSpool(
+            resolve_path(config.get('mqtt', 'spool_file', None)),
+            config.get('mqtt', 'spool_max_messages', 100000),
+            config.get('mqtt', 'spool_max_age', 86400)
+        )
+    elif config.get('mqtt', 'offline_buffer_size', 1000) > 0:
+        mqtt.offline = OfflineBuffer(
+            config.get('mqtt', 'offline_buffer_size', 1000),
+            config.get('mqtt', 'offline_buffer_policy', 'latest')
+        )
+    mqtt.replay_rate = config.get('mqtt', 'replay_rate', 50)
 
     try:
         serial = Serial(
@@ -276,14 +632,35 @@ if __name__ == "__main__":
     xbee.default_port_name = config.get('radio', 'default_port_name', 'serial')
     xbee.sample_rate = config.get('general', 'sample_rate', 0)
     xbee.change_detection = config.get('general', 'change_detection', False)
-
-    processor = Processor(config.get('processor', 'filters', []))
+    xbee.native = config.get('radio', 'parser', 'python-xbee') == 'native'
+    xbee.reassembler.max_line_length = config.get('radio', 'max_line_length', 1024)
+    xbee.reassembler.idle_timeout = config.get('radio', 'line_timeout', 60)
+    xbee.scheduler = ATScheduler()
+    xbee.scheduler.interval = config.get('radio', 'query_interval', 1)
+    xbee.scheduler.max_in_flight = config.get('radio', 'query_concurrency', 1)
+    xbee.scheduler.max_total_in_flight = config.get('radio', 'query_max_in_flight', 8)
+    xbee.scheduler.response_timeout = config.get('radio', 'query_timeout', 5)
+    xbee.scheduler.transactions.retries = config.get('radio', 'query_retries', 2)
+    xbee.scheduler.transactions.backoff = config.get('radio', 'query_backoff', 2)
+
+    processor = Processor(config.get('processor', 'filters', {}), logger)
+    policies = PublishPolicies(config.get('publisher', 'policies', {}), logger)
+    policies.idle_timeout = config.get('publisher', 'idle_timeout', 86400)
+
+    queue = None
+    if config.get('queue', 'enabled', True):
+        queue = PublishQueue(
+            config.get('queue', 'size', 1000),
+            config.get('queue', 'policy', 'drop-oldest'),
+            config.get('queue', 'block_timeout', None)
+        )
 
     xbee2mqtt = Xbee2MQTT(resolve_path(config.get('daemon', 'pidfile', '/tmp/xbee2mqtt.pid')))
     xbee2mqtt.stdout = resolve_path(config.get('daemon', 'stdout', '/dev/null'))
     xbee2mqtt.stderr = resolve_path(config.get('daemon', 'stderr', xbee2mqtt.stdout))
     xbee2mqtt.discovery_on_connect = config.get('general', 'discovery_on_connect', True)
     xbee2mqtt.duplicate_check_window = config.get('general', 'duplicate_check_window', 5)
+    xbee2mqtt.duplicate_cache_size = config.get('general', 'duplicate_cache_size', 10000)
     xbee2mqtt.default_output_topic_pattern = config.get(
         'general', 'default_output_topic_pattern', '/raw/xbee/{address}/{port}'
     )
@@ -297,12 +674,40 @@ if __name__ == "__main__":
     xbee2mqtt.expose_undefined_topics = config.get(
         'general', 'expose_undefined_topics', xbee2mqtt.publish_undefined_topics
     )
+    xbee2mqtt.topic_cache_size = config.get('general', 'topic_cache_size', 4096)
+    xbee2mqtt.subscription_mode = config.get('general', 'subscription_mode', 'routes')
+    xbee2mqtt.message_log_level = config.get('daemon', 'message_logging_level', logging.INFO)
+    xbee2mqtt.message_log_sample = config.get('daemon', 'message_logging_sample', 1)
+    xbee2mqtt.publish_mode = config.get('general', 'publish_mode', 'topics')
+    xbee2mqtt.document_topic_pattern = config.get('general', 'document_topic_pattern', '/raw/xbee/{address}')
+    xbee2mqtt.document_format = config.get('general', 'document_format', 'json')
+    if not document.available(xbee2mqtt.document_format):
+        logger.warning("Document format '%s' not available, using json", xbee2mqtt.document_format)
+        xbee2mqtt.document_format = 'json'
     xbee2mqtt.load(config.get('general', 'routes', {}))
     xbee2mqtt.logger = logger
     xbee2mqtt.mqtt = mqtt
     xbee2mqtt.xbee = xbee
     xbee2mqtt.processor = processor
+    xbee2mqtt.policies = policies
+    xbee2mqtt.queue = queue
+    xbee2mqtt.engine = AsyncEngine() if config.get('general', 'engine', 'threaded') == 'asyncio' else None
     xbee2mqtt.config_file = config_file
+    if config.get('metrics', 'enabled', False):
+        xbee2mqtt.metrics = Metrics()
+        if config.get('metrics', 'port', 9717):
+            xbee2mqtt.metrics_server = MetricsServer(
+                xbee2mqtt.metrics,
+                config.get('metrics', 'host', '127.0.0.1'),
+                config.get('metrics', 'port', 9717)
+            )
+        xbee2mqtt.metrics_topic = config.get('metrics', 'topic', None)
+        xbee2mqtt.metrics_interval = config.get('metrics', 'interval', 60)
+        processor.metrics_by_topic = config.get('metrics', 'filter_topics', False)
+    xbee2mqtt.profiler = Profiler(resolve_path(config.get('profiler', 'directory', 'var/profiles')))
+    xbee2mqtt.profiler.duration = config.get('profiler', 'duration', 60)
+    xbee2mqtt.profiler.interval = config.get('profiler', 'interval', 5) / 1000.0
+    xbee2mqtt.profiler_topic = config.get('profiler', 'topic', None)
 
     if len(sys.argv) == 2:
         if 'start' == sys.argv[1]:
@@ -313,11 +718,13 @@ if __name__ == "__main__":
             xbee2mqtt.restart()
         elif 'reload' == sys.argv[1]:
             xbee2mqtt.reload()
+        elif 'profile' == sys.argv[1]:
+            xbee2mqtt.profile()
         else:
             print("Unknown command")
             sys.exit(2)
         sys.exit(0)
     else:
-        print("usage: %s start|stop|restart" % sys.argv[0])
+        print("usage: %s start|stop|restart|reload|profile" % sys.argv[0])
         sys.exit(2)
 